@@ -1,18 +1,29 @@
 from generals.agents.agent import Agent
 from generals.core.game import Action
-from generals.core.grid import Grid, GridFactory
+from generals.core.grid import Grid, GridFactory, GridPool
+from generals.core.map_archive import MapArchive
+from generals.core.map_bank import MapBank
 from generals.core.observation import Observation
 from generals.core.replay import Replay
 from generals.envs.gymnasium_generals import GymnasiumGenerals
+from generals.envs.gymnasium_generals_vector import GymnasiumGeneralsVector
 from generals.envs.pettingzoo_generals import PettingZooGenerals
+from generals.envs.shared_memory_vector_env import SharedMemoryVectorEnv
+from generals.envs.threaded_vector_env import ThreadedVectorEnv
 
 __all__ = [
     "Action",
     "Agent",
     "GridFactory",
+    "GridPool",
+    "MapArchive",
+    "MapBank",
     "PettingZooGenerals",
     "GymnasiumGenerals",
+    "GymnasiumGeneralsVector",
     "Grid",
     "Replay",
+    "SharedMemoryVectorEnv",
+    "ThreadedVectorEnv",
     "Observation",
 ]
@@ -2,7 +2,11 @@ import numpy as np
 
 from generals.core.config import DIRECTIONS, Direction
 from .channels import UNIT_TYPES
-from .observation import Observation
+from .observation import OBSERVATION_CHANNELS, Observation
+
+# Channels of Observation.as_tensor used to compute valid moves
+_OWNED_CELLS = OBSERVATION_CHANNELS.index("owned_cells")
+_MOUNTAINS = OBSERVATION_CHANNELS.index("mountains")
 
 
 class Action(np.ndarray):
@@ -121,3 +125,26 @@ def compute_valid_move_mask(observation: Observation) -> np.ndarray:
             valid_action_mask[valid_source_indices[:, 0], valid_source_indices[:, 1], channel_index, unit_idx] = 1.0
 
     return valid_action_mask
+
+
+def compute_valid_move_mask_batch(tensor: np.ndarray) -> np.ndarray:
+    """
+    Batched compute_valid_move_mask, over observations stacked by Observation.as_tensor into shape (N, C, H, W).
+    Padded cells are mountains, so moves into the padding are never valid.
+
+    Returns:
+        np.ndarray: an (N, H, W, 4, 4) boolean array, the stacked masks of the observations.
+    """
+    num_observations, _, height, width = tensor.shape
+    movable = (tensor[:, : len(UNIT_TYPES)] > 1.0) & (tensor[:, _OWNED_CELLS] != 0)[:, None]
+    passable = tensor[:, _MOUNTAINS] == 0
+
+    valid_action_mask = np.zeros((num_observations, height, width, 4, len(UNIT_TYPES)), dtype=bool)
+    for channel_index, direction in enumerate(DIRECTIONS):
+        di, dj = direction.value
+        # Sources whose destination is inside the grid, and their destinations
+        sources = (slice(max(-di, 0), height - max(di, 0)), slice(max(-dj, 0), width - max(dj, 0)))
+        destinations = (slice(max(di, 0), height + min(di, 0)), slice(max(dj, 0), width + min(dj, 0)))
+        valid = movable[:, :, sources[0], sources[1]] & passable[:, None, destinations[0], destinations[1]]
+        valid_action_mask[:, sources[0], sources[1], channel_index] = valid.transpose(0, 2, 3, 1)
+    return valid_action_mask
@@ -1,7 +1,7 @@
 import numpy as np
 from scipy.ndimage import maximum_filter  # type: ignore
 
-from .config import MOUNTAIN, PASSABLE
+from .grid import Grid, compute_static_layers, encode_grid
 
 valid_generals = ["A", "B"]  # Generals are represented by A and B
 
@@ -34,32 +34,63 @@ class Channels:
     passable (1 if cell is neutral, 0 otherwise)
     """
 
-    def __init__(self, grid: np.ndarray, _agents: list[str]):
-        # Initialize unit arrays - instead of one armies array, create separate arrays for each unit type
-        self._cavalry = np.zeros_like(grid, dtype=np.float32)
-        self._infantry = np.zeros_like(grid, dtype=np.float32)
-        self._archers = np.zeros_like(grid, dtype=np.float32)
-        self._siege = np.zeros_like(grid, dtype=np.float32)
-
-        # Initialize with one default unit type at general positions (infantry)
-        self._infantry = np.where(np.isin(grid, valid_generals), 1, 0).astype(np.float32)
-
-        self._generals = np.where(np.isin(grid, valid_generals), 1, 0).astype(bool)
-        self._mountains = np.where(grid == MOUNTAIN, 1, 0).astype(bool)
-        self._passable = (grid != MOUNTAIN).astype(bool)
-        self._cities = np.where(np.char.isdigit(grid), 1, 0).astype(bool)
-        self._cities = (self._cities + np.where(grid == "x", 1, 0)).astype(bool)  # city with value 50 is marked as x
-
-        self._ownership = {"neutral": ((grid == PASSABLE) | (np.char.isdigit(grid)) | (grid == "x")).astype(bool)}
-        for i, agent in enumerate(_agents):
-            self._ownership[agent] = np.where(grid == chr(ord("A") + i), 1, 0).astype(bool)
-
-        # City costs are 40 + digit in the cell - add city populations as infantry
-        city_costs = np.where(np.char.isdigit(grid), grid, "0").astype(np.float32)
-        city_costs += np.where(grid == "x", 10, 0)
-        # Add city units as infantry
-        city_population = 40 * self._cities + city_costs
-        self._infantry += city_population
+    def __init__(self, grid: Grid | np.ndarray, _agents: list[str]):
+        self._agents = _agents
+        # Flat buffers the changing channels are views of, one row per layer, reused by reset while the map fits
+        self._unit_buffer = np.empty((len(UNIT_TYPES), 0), dtype=np.float32)
+        self._mask_buffer = np.empty((1 + len(_agents), 0), dtype=bool)
+        self.reset(grid)
+
+    def reset(self, grid: Grid | np.ndarray) -> None:
+        """
+        Reinitializes all channels for a new grid, in place. The arrays of the previous grid are reused
+        whenever the new grid has no more cells, otherwise the buffers are grown to fit it.
+
+        Channels that don't change during a game (generals, mountains, passable & cities) are the read-only
+        Grid.static_layers, shared by all games on the same map. Grids can also be given by their int8 codes
+        (see Grid.codes) or their characters, the static layers are then computed for this game only.
+        """
+        if isinstance(grid, Grid):
+            layers = grid.static_layers
+        else:
+            layers = compute_static_layers(grid if grid.dtype == np.int8 else encode_grid(grid))
+        height, width = layers.passable.shape
+        size = height * width
+        if size > self._unit_buffer.shape[1]:
+            self._unit_buffer = np.empty((len(self._unit_buffer), size), dtype=np.float32)
+            self._mask_buffer = np.empty((len(self._mask_buffer), size), dtype=bool)
+        units = self._unit_buffer[:, :size].reshape(-1, height, width)
+        neutral, *ownership = self._mask_buffer[:, :size].reshape(-1, height, width)
+
+        # Separate arrays for each unit type instead of one armies array
+        self._cavalry, self._infantry, self._archers, self._siege = units
+        self._generals, self._mountains, self._passable, self._cities = layers[:4]
+        units[:] = 0
+        # Generals start with one infantry, cities with 40 + their cost as infantry
+        self._infantry[:] = layers.infantry
+
+        neutral[:] = layers.neutral
+        self._ownership = {"neutral": neutral}
+        for i, (agent, owned) in enumerate(zip(self._agents, ownership)):
+            owned[:] = False
+            if i < len(layers.general_positions):
+                owned[tuple(layers.general_positions[i])] = True
+            self._ownership[agent] = owned
+
+    def __getstate__(self) -> dict:
+        # Copies, e.g. the states of replays, only keep the channels and not the buffers behind them
+        state = self.__dict__.copy()
+        state.pop("_unit_buffer", None)
+        state.pop("_mask_buffer", None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        num_agents = len(self._ownership) - 1
+        self._unit_buffer = np.empty((len(UNIT_TYPES), 0), dtype=np.float32)
+        self._mask_buffer = np.empty((1 + num_agents, 0), dtype=bool)
+        if "_agents" not in state:
+            self._agents = [agent for agent in self._ownership if agent != "neutral"]
 
     def get_total_armies(self) -> np.ndarray:
         """Returns the total number of units in each cell (all unit types combined)"""
@@ -1,17 +1,37 @@
-from typing import Any, TypeAlias
+from typing import Any, Literal, TypeAlias
 
 import numba as nb
 import numpy as np
+from scipy.ndimage import maximum_filter  # type: ignore
 
 from .action import Action
 from .channels import Channels, UNIT_TYPES, COMBAT_EFFECTIVENESS
 from .config import DIRECTIONS
 from .grid import Grid
-from .observation import Observation
+from .observation import MASK_LAYERS, NEVER_SEEN, SCALAR_FIELDS, UNIT_LAYERS, Observation
 
 # Type aliases
 Info: TypeAlias = dict[str, Any]
 
+# Features of a single cell in Game.token_observation
+TOKEN_FEATURES = [
+    "row",
+    "col",
+    "cavalry",
+    "infantry",
+    "archers",
+    "siege",
+    "owned",
+    "opponent",
+    "city",
+    "general",
+    "mountain",
+    "structure_in_fog",
+]
+
+# Node features of Game.graph_observation. Nodes are passable cells, so there is no mountain feature.
+GRAPH_FEATURES = ["row", "col"] + [layer for layer in UNIT_LAYERS + MASK_LAYERS if layer != "mountains"]
+
 
 @nb.njit(cache=True)
 def calculate_army_size(armies, ownership):
@@ -23,29 +43,303 @@ def calculate_land_size(ownership):
     return np.int32(np.sum(ownership))
 
 
+# Combat effectiveness of unit type i attacking unit type j, and the (row, col) offsets of DIRECTIONS
+_EFFECTIVENESS = np.array([[COMBAT_EFFECTIVENESS[i][j] for j in UNIT_TYPES] for i in UNIT_TYPES], dtype=np.float32)
+_DIRECTION_OFFSETS = np.array([direction.value for direction in DIRECTIONS], dtype=np.int64)
+
+# Errors of resolve_moves, raised as IndexError by Game.step
+_MOVE_ERRORS = ["", "Invalid unit type index.", "Source cell out of bounds.", "Invalid direction."]
+
+# Channel of Observation.as_tensor of every grid layer, and the first channel of the scalar fields
+_UNIT_CHANNELS = np.array([UNIT_LAYERS.index(unit_type) for unit_type in UNIT_TYPES])
+_ARMIES, _SCALARS = UNIT_LAYERS.index("armies"), len(UNIT_LAYERS + MASK_LAYERS)
+_GENERALS, _CITIES, _MOUNTAINS, _NEUTRAL, _OWNED, _OPPONENT, _FOG, _STRUCTURES_IN_FOG = (
+    len(UNIT_LAYERS) + MASK_LAYERS.index(name) for name in MASK_LAYERS
+)
+
+
+@nb.njit(cache=True, nogil=True)
+def _combat(attacker, defender, effectiveness):
+    """
+    Resolves combat between two cells holding attacker & defender units per type, see Game.resolve_combat.
+    Returns whether the attacker wins and the remaining units of the winner. Computed in float32.
+    """
+    attacker_power = np.float32(0)
+    for i in range(4):
+        contribution = np.float32(0)
+        for j in range(4):
+            contribution += effectiveness[i, j] * defender[j]
+        attacker_power += attacker[i] * contribution
+    defender_power = np.float32(0)
+    for j in range(4):
+        contribution = np.float32(0)
+        for i in range(4):
+            contribution += effectiveness[j, i] * attacker[i]
+        defender_power += defender[j] * contribution
+
+    attacker_total = attacker[0] + attacker[1] + attacker[2] + attacker[3]
+    defender_total = defender[0] + defender[1] + defender[2] + defender[3]
+    if attacker_total == 0:
+        return False, defender.copy()
+    if defender_total == 0:
+        return True, attacker.copy()
+
+    if attacker_power > defender_power:
+        attacker_wins = True
+        remaining_percentage = np.float32(1) - defender_power / attacker_power * np.float32(0.8)
+        winner = attacker
+    else:
+        attacker_wins = False
+        remaining_percentage = np.float32(1) - attacker_power / defender_power * np.float32(0.5)
+        winner = defender
+    if not remaining_percentage > np.float32(0.1):
+        remaining_percentage = np.float32(0.1)
+    return attacker_wins, winner * remaining_percentage
+
+
+@nb.njit(cache=True, nogil=True)
+def resolve_moves(
+    actions, cavalry, infantry, archers, siege, neutral, ownership_0, ownership_1, passable, general_positions
+):
+    """
+    Applies the moves of both agents, rows of actions are (agent index, *action) in the order of play.
+    Equivalent to the move resolution of Game.step in the original Python implementation, float32 included.
+
+    Returns:
+        tuple: (winner, loser, error), agent indices of the last general capture (-1 if none) and the index
+            of the error in _MOVE_ERRORS that stopped the resolution (0 if none).
+    """
+    height, width = passable.shape
+    winner, loser = -1, -1
+    units = np.empty(4, dtype=np.float32)
+    for row in range(actions.shape[0]):
+        agent, pass_turn, si, sj = actions[row, 0], actions[row, 1], actions[row, 2], actions[row, 3]
+        direction, unit_type, split_army = actions[row, 4], actions[row, 5], actions[row, 6]
+        if not -4 <= unit_type < 4:
+            return winner, loser, 1
+        unit_type = unit_type % 4
+        unit_array = cavalry if unit_type == 0 else infantry if unit_type == 1 else archers if unit_type == 2 else siege
+        owned = ownership_0 if agent == 0 else ownership_1
+
+        if pass_turn == 1:
+            continue
+        # Negative indices are out of bounds too, instead of wrapping around to the opposite edge
+        if not (0 <= si < height and 0 <= sj < width):
+            return winner, loser, 2
+        ri, rj = si, sj
+
+        if split_army == 1:
+            army_to_move = unit_array[ri, rj] / np.float32(2.0)
+        else:
+            army_to_move = unit_array[ri, rj] - np.float32(1)
+        if army_to_move < 1.0:
+            continue
+        if unit_array[ri, rj] - np.float32(1) < army_to_move:
+            army_to_move = unit_array[ri, rj] - np.float32(1)
+        army_to_stay = unit_array[ri, rj] - army_to_move
+        if owned[ri, rj] == 0 or army_to_move < 1:
+            continue
+
+        if not -4 <= direction < 4:
+            return winner, loser, 3
+        di = si + _DIRECTION_OFFSETS[direction % 4, 0]
+        dj = sj + _DIRECTION_OFFSETS[direction % 4, 1]
+        if di < 0 or di >= height or dj < 0 or dj >= width:
+            continue
+        if passable[di, dj] == 0:
+            continue
+
+        # Owner of the target cell: 0 neutral, 1 & 2 the agents, neutral if nobody owns it
+        target_owner = 0
+        if neutral[di, dj]:
+            target_owner = 0
+        elif ownership_0[di, dj]:
+            target_owner = 1
+        elif ownership_1[di, dj]:
+            target_owner = 2
+
+        unit_array[ri, rj] = army_to_stay
+        if target_owner == agent + 1:
+            unit_array[di, dj] += army_to_move
+            continue
+
+        # Units left in the source cell fight the moving units, as in Game.resolve_combat
+        units[0], units[1], units[2], units[3] = cavalry[ri, rj], infantry[ri, rj], archers[ri, rj], siege[ri, rj]
+        moving = np.zeros(4, dtype=np.float32)
+        moving[unit_type] = army_to_move
+        attacker_wins, remaining = _combat(units, moving, _EFFECTIVENESS)
+
+        if attacker_wins:
+            owned[di, dj] = True
+            if target_owner == 1:
+                ownership_0[di, dj] = False
+            elif target_owner == 2:
+                ownership_1[di, dj] = False
+            if target_owner > 0:
+                general_position = general_positions[target_owner - 1]
+                if di == general_position[0] and dj == general_position[1]:
+                    winner, loser = agent, target_owner - 1
+        cavalry[di, dj] = remaining[0]
+        infantry[di, dj] = remaining[1]
+        archers[di, dj] = remaining[2]
+        siege[di, dj] = remaining[3]
+    return winner, loser, 0
+
+
+@nb.njit(cache=True, nogil=True)
+def produce_units(time, increment_rate, cavalry, infantry, archers, siege, ownership_0, ownership_1, generals, cities):
+    """Unit production of a turn, equivalent to Game._global_game_update in the original Python implementation."""
+    height, width = generals.shape
+    for i in range(height):
+        for j in range(width):
+            for owned in (ownership_0, ownership_1):
+                if time % increment_rate == 0 and owned[i, j]:
+                    cavalry[i, j] += np.float32(1)
+                    infantry[i, j] += np.float32(1)
+                    archers[i, j] += np.float32(1)
+                    siege[i, j] += np.float32(1)
+            if time % 2 == 0 and time > 0:
+                for owned in (ownership_0, ownership_1):
+                    if owned[i, j] and (generals[i, j] or cities[i, j]):
+                        infantry[i, j] += np.float32(1)
+                    if owned[i, j] and cities[i, j]:
+                        if time % 6 == 0:
+                            cavalry[i, j] += np.float32(1)
+                        if time % 8 == 0:
+                            archers[i, j] += np.float32(1)
+
+
+@nb.njit(cache=True, nogil=True)
+def write_observation_tensors(
+    out, scalars, cavalry, infantry, archers, siege, generals, cities, mountains, neutral, ownership_0, ownership_1
+):
+    """
+    Writes the observations of both agents into out of shape (2, 19, pad, pad), as Observation.as_tensor(pad_to=pad)
+    of Game.all_observations would, given the (2, 6) scalar fields of the agents.
+    """
+    height, width = generals.shape
+    out[:] = 0
+    out[:, _MOUNTAINS] = 1
+    for agent in range(2):
+        owned, opponent = (ownership_0, ownership_1) if agent == 0 else (ownership_1, ownership_0)
+        tensor = out[agent]
+        for i in range(height):
+            for j in range(width):
+                visible = False
+                for ni in range(max(i - 1, 0), min(i + 2, height)):
+                    for nj in range(max(j - 1, 0), min(j + 2, width)):
+                        visible = visible or owned[ni, nj]
+                v = np.float32(visible)
+                visible_units = (cavalry[i, j] * v, infantry[i, j] * v, archers[i, j] * v, siege[i, j] * v)
+                for k in range(4):
+                    tensor[_UNIT_CHANNELS[k], i, j] = visible_units[k]
+                tensor[_ARMIES, i, j] = visible_units[0] + visible_units[1] + visible_units[2] + visible_units[3]
+                tensor[_GENERALS, i, j] = generals[i, j] and visible
+                tensor[_CITIES, i, j] = cities[i, j] and visible
+                tensor[_MOUNTAINS, i, j] = mountains[i, j] and visible
+                tensor[_NEUTRAL, i, j] = neutral[i, j] and visible
+                tensor[_OWNED, i, j] = owned[i, j] and visible
+                tensor[_OPPONENT, i, j] = opponent[i, j] and visible
+                structure = not visible and (mountains[i, j] or cities[i, j])
+                tensor[_STRUCTURES_IN_FOG, i, j] = structure
+                tensor[_FOG, i, j] = not visible and not structure
+        for k in range(scalars.shape[1]):
+            tensor[_SCALARS + k] = scalars[agent, k]
+
+
+class FogMemory:
+    """
+    What one agent saw in every cell the last time the cell was visible: units per type, the owner
+    (0 unowned, 1 the agent, 2 the opponent) and the turn. Never seen cells hold zero units and NEVER_SEEN.
+
+    Only cells that are visible and changed are written on update. The turn of visible cells is always the
+    current one, so it is written only when a cell goes into fog.
+    """
+
+    def __init__(self, grid_dims: tuple[int, int]):
+        self.units = np.zeros((len(UNIT_TYPES), *grid_dims), dtype=np.float32)
+        self.owner = np.full(grid_dims, NEVER_SEEN, dtype=np.int8)
+        self.turn = np.full(grid_dims, NEVER_SEEN, dtype=np.int32)
+        self.visible = np.zeros(grid_dims, dtype=bool)
+        self.time = NEVER_SEEN
+
+    def reset(self, grid_dims: tuple[int, int]) -> None:
+        """Forgets everything, reusing the arrays if grid_dims didn't change."""
+        if self.owner.shape != tuple(grid_dims):
+            self.__init__(grid_dims)
+            return
+        self.units[:] = 0
+        self.owner[:] = NEVER_SEEN
+        self.turn[:] = NEVER_SEEN
+        self.visible = np.zeros(grid_dims, dtype=bool)
+        self.time = NEVER_SEEN
+
+    def update(self, visible: np.ndarray, units: np.ndarray, owner: np.ndarray, time: int) -> None:
+        hidden = self.visible & ~visible
+        self.turn[hidden] = self.time
+
+        changed = visible & ((self.units != units).any(axis=0) | (self.owner != owner))
+        self.units[:, changed] = units[:, changed]
+        self.owner[changed] = owner[changed]
+        self.visible = visible
+        self.time = time
+
+    def layers(self) -> dict[str, np.ndarray]:
+        """Returns copies of the memory as Observation fields."""
+        return {
+            "last_seen_cavalry": self.units[0].copy(),
+            "last_seen_infantry": self.units[1].copy(),
+            "last_seen_archers": self.units[2].copy(),
+            "last_seen_siege": self.units[3].copy(),
+            "last_seen_owner": self.owner.copy(),
+            "last_seen_turn": np.where(self.visible, np.int32(self.time), self.turn),
+        }
+
+
 class Game:
-    def __init__(self, grid: Grid, agents: list[str]):
+    def __init__(self, grid: Grid, agents: list[str], fog_memory: bool = False):
         # Agents
         self.agents = agents
-        self.agent_order = self.agents[:]
-
-        # Grid
-        _grid = grid.grid
-        self.channels = Channels(_grid, self.agents)
-        self.grid_dims = (_grid.shape[0], _grid.shape[1])
-        self.general_positions = {agent: np.argwhere(_grid == chr(ord("A") + i))[0] for i, agent in enumerate(self.agents)}
 
         # Time stuff
-        self.time = 0
         self.increment_rate = 50
 
         # Limits
         self.max_army_value = 100_000
-        self.max_land_value = np.prod(self.grid_dims)
         self.max_timestep = 100_000
 
+        # Optional last-seen memory of every agent, exposed as the memory layers of its observations
+        self.fog_memory = {agent: FogMemory(grid.shape) for agent in self.agents} if fog_memory else None
+
+        self.channels = Channels(grid, self.agents)
+        self._start(grid)
+
+    def reset(self, grid: Grid) -> None:
+        """
+        Starts a new game on grid, reinitializing the arrays of the current game in place.
+        They are reused whenever the new grid fits in them, which makes this much cheaper than a new Game.
+        """
+        self.channels.reset(grid)
+        if self.fog_memory is not None:
+            for memory in self.fog_memory.values():
+                memory.reset(grid.shape)
+        self._start(grid)
+
+    def _start(self, grid: Grid) -> None:
+        """Sets the state of a new game on grid, whose channels are already initialized."""
+        self.agent_order = self.agents[:]
+
+        # Grid
+        self.grid = grid
+        self.grid_dims = (grid.shape[0], grid.shape[1])
+        self.general_positions = dict(zip(self.agents, grid.static_layers.general_positions))
+
+        self.time = 0
+        self.max_land_value = np.prod(self.grid_dims)
+
         self.winner = None
         self.loser = None
+        self._update_fog_memory()
 
     def resolve_combat(
         self,
@@ -171,122 +465,39 @@ class Game:
         """
         Perform one step of the game
         """
+        self.advance(actions)
+        self._update_fog_memory()
+        observations = self.all_observations()
+        infos = self.get_infos()
+        return observations, infos
+
+    def advance(self, actions: dict[str, Action]) -> None:
+        """
+        Perform one step of the game, without computing observations.
+
+        Moves and unit production are computed by numba kernels that release the GIL,
+        so that many games can be advanced in parallel threads.
+        """
         done_before_actions = self.is_done()
-        for agent in self.agent_order:
-            pass_turn, si, sj, direction, unit_type_idx, split_army = actions[agent]
-
-            # Get the unit type being moved
-            unit_type = UNIT_TYPES[unit_type_idx]
-
-            # Get the current unit array based on unit type
-            if unit_type == "cavalry":
-                unit_array = self.channels.cavalry
-            elif unit_type == "infantry":
-                unit_array = self.channels.infantry
-            elif unit_type == "archers":
-                unit_array = self.channels.archers
-            elif unit_type == "siege":
-                unit_array = self.channels.siege
-            else:
-                continue  # Invalid unit type
-
-            # Skip if agent wants to pass the turn
-            if pass_turn == 1:
-                continue
-
-            if split_army == 1:  # Agent wants to split the army
-                army_to_move = unit_array[si, sj] / 2.0
-            else:  # Leave just one army in the source cell
-                army_to_move = unit_array[si, sj] - 1
-
-            if army_to_move < 1.0:  # Skip if army size to move is less than 1
-                continue
-
-            # Cap the amount of army to move (previous moves may have lowered available army)
-            army_to_move = min(army_to_move, unit_array[si, sj] - 1)
-            army_to_stay = unit_array[si, sj] - army_to_move
-
-            # Check if the current agent still owns the source cell and has more than 1 army
-            if self.channels.ownership[agent][si, sj] == 0 or army_to_move < 1:
-                continue
-
-            di, dj = (
-                si + DIRECTIONS[direction].value[0],
-                sj + DIRECTIONS[direction].value[1],
-            )  # destination indices
-
-            # Skip if the destination cell is not passable or out of bounds
-            if di < 0 or di >= self.grid_dims[0] or dj < 0 or dj >= self.grid_dims[1]:
-                continue
-            if self.channels.passable[di, dj] == 0:
-                continue
-
-            # Figure out the target square owner
-            target_square_owner_idx = np.argmax(
-                [self.channels.ownership[agent][di, dj] for agent in ["neutral"] + self.agents]
-            )
-            target_square_owner = (["neutral"] + self.agents)[target_square_owner_idx]
-
-            # Update source cell - remove moving units
-            unit_array[si, sj] = army_to_stay
-
-            if target_square_owner == agent:
-                # Moving to own cell - just add units
-                unit_array[di, dj] += army_to_move
-            else:
-                # Moving to enemy/neutral cell - resolve combat
-                source_pos = (si, sj)
-                target_pos = (di, dj)
-
-                # Save counts before combat
-                attacker_units = {unit_type: army_to_move}
-
-                # Temporarily place attacking units at target to resolve combat
-                original_target_cavalry = self.channels.cavalry[di, dj]
-                original_target_infantry = self.channels.infantry[di, dj]
-                original_target_archers = self.channels.archers[di, dj]
-                original_target_siege = self.channels.siege[di, dj]
-
-                # Set attacking units at target temporarily
-                self.channels.cavalry[di, dj] = army_to_move if unit_type == "cavalry" else 0
-                self.channels.infantry[di, dj] = army_to_move if unit_type == "infantry" else 0
-                self.channels.archers[di, dj] = army_to_move if unit_type == "archers" else 0
-                self.channels.siege[di, dj] = army_to_move if unit_type == "siege" else 0
-
-                # Resolve combat
-                square_winner, remaining_units = self.resolve_combat(agent, target_square_owner, source_pos, target_pos)
-
-                # Restore target cell units
-                self.channels.cavalry[di, dj] = original_target_cavalry
-                self.channels.infantry[di, dj] = original_target_infantry
-                self.channels.archers[di, dj] = original_target_archers
-                self.channels.siege[di, dj] = original_target_siege
-
-                # Update target cell based on combat result
-                if square_winner == agent:
-                    # Attacker won - update cell ownership and set remaining units
-                    self.channels.ownership[agent][di, dj] = True
-                    if target_square_owner != "neutral":
-                        self.channels.ownership[target_square_owner][di, dj] = False
-
-                    # Set the remaining units
-                    self.channels.cavalry[di, dj] = remaining_units.get("cavalry", 0)
-                    self.channels.infantry[di, dj] = remaining_units.get("infantry", 0)
-                    self.channels.archers[di, dj] = remaining_units.get("archers", 0)
-                    self.channels.siege[di, dj] = remaining_units.get("siege", 0)
-
-                    # Check if the captured cell is the opponent's general
-                    if target_square_owner in self.agents:
-                        gi, gj = tuple(self.general_positions[target_square_owner])
-                        if (di, dj) == (gi, gj):
-                            self.loser = target_square_owner
-                            self.winner = agent
-                else:
-                    # Defender won - update with remaining units
-                    self.channels.cavalry[di, dj] = remaining_units.get("cavalry", 0)
-                    self.channels.infantry[di, dj] = remaining_units.get("infantry", 0)
-                    self.channels.archers[di, dj] = remaining_units.get("archers", 0)
-                    self.channels.siege[di, dj] = remaining_units.get("siege", 0)
+        channels = self.channels
+        moves = np.array([[self.agents.index(agent), *actions[agent]] for agent in self.agent_order], dtype=np.int64)
+        general_positions = np.array([self.general_positions[agent] for agent in self.agents], dtype=np.int64)
+        winner, loser, error = resolve_moves(
+            moves,
+            channels.cavalry,
+            channels.infantry,
+            channels.archers,
+            channels.siege,
+            channels.ownership_neutral,
+            channels.ownership[self.agents[0]],
+            channels.ownership[self.agents[1]],
+            channels.passable,
+            general_positions,
+        )
+        if winner >= 0:
+            self.winner, self.loser = self.agents[winner], self.agents[loser]
+        if error:
+            raise IndexError(_MOVE_ERRORS[error])
 
         # Swap agent order (because priority is alternating)
         self.agent_order = self.agent_order[::-1]
@@ -303,39 +514,42 @@ class Game:
         else:
             self._global_game_update()
 
-        observations = {agent: self.agent_observation(agent) for agent in self.agents}
-        infos = self.get_infos()
-        return observations, infos
-
     def _global_game_update(self) -> None:
         """
         Update game state globally.
         """
-        owners = self.agents
-
-        # every `increment_rate` steps, increase army size in each cell
-        if self.time % self.increment_rate == 0:
-            for owner in owners:
-                for unit_array in [self.channels.cavalry, self.channels.infantry, self.channels.archers, self.channels.siege]:
-                    unit_array += self.channels.ownership[owner]
-
-        # Increment armies on general and city cells, but only if they are owned by player
-        if self.time % 2 == 0 and self.time > 0:
-            update_mask = self.channels.generals + self.channels.cities
-            for owner in owners:
-                # Generals produce infantry, cities produce a mix of units
-                self.channels.infantry += update_mask * self.channels.ownership[owner]
-
-                # Cities also produce some cavalry and archers (less than infantry)
-                city_mask = self.channels.cities * self.channels.ownership[owner]
-                if self.time % 6 == 0:  # Every 6 turns, cities produce cavalry
-                    self.channels.cavalry += city_mask
-                if self.time % 8 == 0:  # Every 8 turns, cities produce archers
-                    self.channels.archers += city_mask
+        # every `increment_rate` steps, increase army size in each cell,
+        # armies on general and city cells are incremented every other step, but only if they are owned by player
+        channels = self.channels
+        produce_units(
+            self.time,
+            self.increment_rate,
+            channels.cavalry,
+            channels.infantry,
+            channels.archers,
+            channels.siege,
+            channels.ownership[self.agents[0]],
+            channels.ownership[self.agents[1]],
+            channels.generals,
+            channels.cities,
+        )
 
-    def agent_observation(self, agent: str) -> Observation:
+    def _update_fog_memory(self) -> None:
+        if self.fog_memory is None:
+            return
+        channels = self.channels
+        units = np.stack([channels.cavalry, channels.infantry, channels.archers, channels.siege])
+        for agent, memory in self.fog_memory.items():
+            opponent = self.agents[0] if agent == self.agents[1] else self.agents[1]
+            owner = channels.ownership[agent] + 2 * channels.ownership[opponent].astype(np.int8)
+            memory.update(channels.get_visibility(agent).astype(bool), units, owner, self.time)
+
+    def _fog_memory_layers(self, agent: str) -> dict[str, np.ndarray]:
+        return {} if self.fog_memory is None else self.fog_memory[agent].layers()
+
+    def _scores(self) -> dict[str, dict[str, int]]:
         """
-        Returns an observation for a given agent.
+        Returns army & land size of every agent.
         """
         scores = {}
         for _agent in self.agents:
@@ -352,6 +566,13 @@ class Game:
                 "army": army_size,
                 "land": land_size,
             }
+        return scores
+
+    def agent_observation(self, agent: str) -> Observation:
+        """
+        Returns an observation for a given agent.
+        """
+        scores = self._scores()
 
         visible = self.channels.get_visibility(agent)
         invisible = 1 - visible
@@ -406,4 +627,340 @@ class Game:
             opponent_army_count=opponent_army_count,
             timestep=timestep,
             priority=priority,
+            **self._fog_memory_layers(agent),
+        )
+
+    def all_observations(self) -> dict[str, Observation]:
+        """
+        Returns observations of all agents, identical to calling agent_observation for each of them.
+
+        Instead of building the views one by one, layers of both agents are computed in one fused pass,
+        and work they share (scores, stacking of the unit & structure layers) is done only once.
+        """
+        channels = self.channels
+        agents = self.agents
+
+        ownership = np.stack([channels.ownership[agent] for agent in agents])
+        units = np.stack([channels.cavalry, channels.infantry, channels.archers, channels.siege])
+        structures = np.stack([channels.mountains, channels.generals, channels.cities, channels.ownership_neutral])
+        army_sizes, land_sizes = self._army_and_land_sizes(ownership, units)
+
+        # Visibility of all agents at once, the filter is not applied across the agent axis
+        visible = maximum_filter(ownership, size=(1, 3, 3)).astype(bool)
+        invisible = 1 - visible
+
+        visible_units = units[None] * visible[:, None]
+        armies = visible_units[:, 0] + visible_units[:, 1] + visible_units[:, 2] + visible_units[:, 3]
+        visible_structures = structures[None] * visible[:, None]
+        structures_in_fog = invisible * (channels.mountains + channels.cities)
+        fog_cells = invisible - structures_in_fog
+
+        observations = {}
+        for i, agent in enumerate(agents):
+            opponent = 1 - i
+            observations[agent] = Observation(
+                cavalry=visible_units[i, 0],
+                infantry=visible_units[i, 1],
+                archers=visible_units[i, 2],
+                siege=visible_units[i, 3],
+                armies=armies[i],
+                generals=visible_structures[i, 1],
+                cities=visible_structures[i, 2],
+                mountains=visible_structures[i, 0],
+                neutral_cells=visible_structures[i, 3],
+                owned_cells=ownership[i] * visible[i],
+                opponent_cells=ownership[opponent] * visible[i],
+                fog_cells=fog_cells[i],
+                structures_in_fog=structures_in_fog[i],
+                owned_land_count=land_sizes[i],
+                owned_army_count=army_sizes[i],
+                opponent_land_count=land_sizes[opponent],
+                opponent_army_count=army_sizes[opponent],
+                timestep=self.time,
+                priority=1 if agent == self.agent_order[0] else 0,
+                **self._fog_memory_layers(agent),
+            )
+        return observations
+
+    def _army_and_land_sizes(self, ownership: np.ndarray, units: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Scores of the stacked agents' ownership, summed per unit type the same way as in agent_observation."""
+        height, width = self.grid_dims
+        num_agents = len(ownership)
+        owned_units = (units[None] * ownership[:, None]).reshape(num_agents, len(units), height * width)
+        unit_sums = owned_units.sum(axis=-1)
+        army_sizes = (unit_sums[:, 0] + unit_sums[:, 1] + unit_sums[:, 2] + unit_sums[:, 3]).astype(int)
+        land_sizes = ownership.reshape(num_agents, -1).sum(axis=-1)
+        return army_sizes, land_sizes
+
+    def observation_tensors(self, pad_to: int | None = None, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Returns the observations of all agents stacked into a (2, 19, pad_to, pad_to) tensor.
+
+        The result is identical to stacking Observation.as_tensor(pad_to) of all_observations, but
+        no Observation is built and the layers are written by a numba kernel that releases the GIL.
+
+        Args:
+            pad_to: Size the observations are padded to, the size of the grid if None.
+            out: Preallocated array to write the tensor into, a new float32 array is allocated if None.
+        """
+        channels = self.channels
+        pad_to = pad_to or max(self.grid_dims)
+        assert pad_to >= max(self.grid_dims), "Can't pad to a smaller size than the original observation."
+        if out is None:
+            out = np.empty((len(self.agents), _SCALARS + len(SCALAR_FIELDS), pad_to, pad_to), dtype=np.float32)
+
+        ownership = np.stack([channels.ownership[agent] for agent in self.agents])
+        units = np.stack([channels.cavalry, channels.infantry, channels.archers, channels.siege])
+        army_sizes, land_sizes = self._army_and_land_sizes(ownership, units)
+        priority = [1 if agent == self.agent_order[0] else 0 for agent in self.agents]
+        scalars = np.array(
+            [
+                [land_sizes[0], army_sizes[0], land_sizes[1], army_sizes[1], self.time, priority[0]],
+                [land_sizes[1], army_sizes[1], land_sizes[0], army_sizes[0], self.time, priority[1]],
+            ],
+            dtype=np.int64,
+        )
+        write_observation_tensors(
+            out,
+            scalars,
+            channels.cavalry,
+            channels.infantry,
+            channels.archers,
+            channels.siege,
+            channels.generals,
+            channels.cities,
+            channels.mountains,
+            channels.ownership_neutral,
+            channels.ownership[self.agents[0]],
+            channels.ownership[self.agents[1]],
+        )
+        return out
+
+    def window_origin(self, agent: str, window: int, center: Literal["general", "centroid"] = "general") -> np.ndarray:
+        """
+        Returns the (row, col) of the top-left cell of a window x window crop centered on the agent.
+
+        Args:
+            agent: The agent to center the crop on.
+            window: Height & width of the crop.
+            center: "general" centers the crop on the agent's general, "centroid" on the centroid of its army,
+                i.e. of its owned cells weighted by their number of units.
+        """
+        position = self.general_positions[agent]
+        if center == "centroid":
+            army = self.channels.get_total_armies() * self.channels.ownership[agent]
+            if army.sum() > 0:
+                rows, cols = np.indices(self.grid_dims)
+                position = np.round([np.sum(rows * army) / army.sum(), np.sum(cols * army) / army.sum()])
+        elif center != "general":
+            raise ValueError(f"Invalid center: {center}")
+        return np.asarray(position, dtype=int) - window // 2
+
+    def egocentric_observation(
+        self, agent: str, window: int, center: Literal["general", "centroid"] = "general"
+    ) -> Observation:
+        """
+        Returns the agent's observation cropped to a fixed window x window area around the agent,
+        see window_origin. Cells outside the map are padded like in Observation.as_tensor, i.e. as mountains.
+
+        Only cells inside the window are computed, so the cost doesn't depend on the size of the map
+        and the observation shape stays the same for every map.
+        """
+        top, left = self.window_origin(agent, window, center)
+        height, width = self.grid_dims
+
+        # Part of the map covered by the window, extended by a one cell margin for the visibility filter
+        r0, r1, c0, c1 = max(top, 0), min(top + window, height), max(left, 0), min(left + window, width)
+        m0, m1, n0, n1 = max(r0 - 1, 0), min(r1 + 1, height), max(c0 - 1, 0), min(c1 + 1, width)
+        margin = maximum_filter(self.channels.ownership[agent][m0:m1, n0:n1], size=3).astype(bool)
+        visible = margin[r0 - m0 : r1 - m0, c0 - n0 : c1 - n0]
+        invisible = 1 - visible
+
+        opponent = self.agents[0] if agent == self.agents[1] else self.agents[1]
+        area = (slice(r0, r1), slice(c0, c1))
+        window_area = (slice(r0 - top, r1 - top), slice(c0 - left, c1 - left))
+
+        def crop(layer: np.ndarray, dtype, padding=0) -> np.ndarray:
+            cropped = np.full((window, window), padding, dtype=dtype)
+            cropped[window_area] = layer
+            return cropped
+
+        cavalry = crop(self.channels.cavalry[area] * visible, np.float32)
+        infantry = crop(self.channels.infantry[area] * visible, np.float32)
+        archers = crop(self.channels.archers[area] * visible, np.float32)
+        siege = crop(self.channels.siege[area] * visible, np.float32)
+        structures_in_fog = invisible * (self.channels.mountains[area] + self.channels.cities[area])
+
+        memory = {}
+        if self.fog_memory is not None:
+            for name, layer in self.fog_memory[agent].layers().items():
+                padding = 0 if layer.dtype == np.float32 else NEVER_SEEN
+                memory[name] = crop(layer[area], layer.dtype, padding=padding)
+
+        scores = self._scores()
+        return Observation(
+            cavalry=cavalry,
+            infantry=infantry,
+            archers=archers,
+            siege=siege,
+            armies=cavalry + infantry + archers + siege,
+            generals=crop(self.channels.generals[area] * visible, bool),
+            cities=crop(self.channels.cities[area] * visible, bool),
+            mountains=crop(self.channels.mountains[area] * visible, bool, padding=1),
+            neutral_cells=crop(self.channels.ownership_neutral[area] * visible, bool),
+            owned_cells=crop(self.channels.ownership[agent][area] * visible, bool),
+            opponent_cells=crop(self.channels.ownership[opponent][area] * visible, bool),
+            fog_cells=crop(invisible - structures_in_fog, invisible.dtype),
+            structures_in_fog=crop(structures_in_fog, invisible.dtype),
+            owned_land_count=scores[agent]["land"],
+            owned_army_count=scores[agent]["army"],
+            opponent_land_count=scores[opponent]["land"],
+            opponent_army_count=scores[opponent]["army"],
+            timestep=self.time,
+            priority=1 if agent == self.agent_order[0] else 0,
+            **memory,
+        )
+
+    def minimap(self, agent: str, size: int, observation: Observation | None = None) -> np.ndarray:
+        """
+        Returns a downsampled global view of the agent's observation, of shape (13, size, size).
+        Each cell holds the mean of the corresponding block of the map for every grid layer of the
+        observation, i.e. all layers except the scalar ones. Pairs well with egocentric_observation.
+        The agent's current observation can be passed if it was already computed.
+        """
+        if observation is None:
+            observation = self.agent_observation(agent)
+        height, width = self.grid_dims
+        row_starts = np.arange(size) * height // size
+        col_starts = np.arange(size) * width // size
+        row_counts = np.maximum(np.diff(row_starts, append=height), 1)
+        col_counts = np.maximum(np.diff(col_starts, append=width), 1)
+
+        layers = np.stack([observation[name] for name in UNIT_LAYERS + MASK_LAYERS]).astype(np.float32)
+        block_sums = np.add.reduceat(np.add.reduceat(layers, row_starts, axis=1), col_starts, axis=2)
+        return (block_sums / (row_counts[:, None] * col_counts[None, :])).astype(np.float32)
+
+    def token_observation(self, agent: str, max_tokens: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns a sparse observation for set-based (e.g. transformer) policies, built directly from the game state.
+
+        Every visible cell that is not empty (i.e. it has units, an owner or a structure) becomes one token,
+        followed by a token for every structure hidden in fog. Features of each token are listed in
+        TOKEN_FEATURES: the cell position, unit counts per type, owner, structure flags and fog state.
+
+        Args:
+            agent: The observing agent.
+            max_tokens: If given, tokens are truncated or zero-padded to exactly this many.
+
+        Returns:
+            tuple: (tokens, mask)
+                tokens: float32 array of shape (num_tokens, len(TOKEN_FEATURES))
+                mask: boolean array of shape (num_tokens,), False for padding tokens
+        """
+        num_tokens = self._count_tokens(agent) if max_tokens is None else max_tokens
+        tokens = np.zeros((num_tokens, len(TOKEN_FEATURES)), dtype=np.float32)
+        mask = np.zeros(num_tokens, dtype=bool)
+        self._fill_tokens(agent, tokens, mask)
+        return tokens, mask
+
+    def _token_cells(self, agent: str) -> tuple[np.ndarray, np.ndarray]:
+        """Returns flat indices of visible non-empty cells and of structures in fog."""
+        channels = self.channels
+        visible = channels.get_visibility(agent)
+        non_empty = (
+            (channels.get_total_armies() > 0)
+            | ~channels.ownership_neutral
+            | channels.mountains
+            | channels.cities
+            | channels.generals
         )
+        structures = channels.mountains | channels.cities
+        return np.flatnonzero(visible & non_empty), np.flatnonzero(~visible & structures)
+
+    def _count_tokens(self, agent: str) -> int:
+        visible_cells, fog_cells = self._token_cells(agent)
+        return len(visible_cells) + len(fog_cells)
+
+    def _fill_tokens(self, agent: str, tokens: np.ndarray, mask: np.ndarray) -> None:
+        """Writes the agent's tokens into zeroed tokens & mask arrays, truncating to their length."""
+        channels = self.channels
+        opponent = self.agents[0] if agent == self.agents[1] else self.agents[1]
+        visible_cells, fog_cells = self._token_cells(agent)
+        visible_cells = visible_cells[: len(tokens)]
+        fog_cells = fog_cells[: len(tokens) - len(visible_cells)]
+
+        num_visible, num_tokens = len(visible_cells), len(visible_cells) + len(fog_cells)
+        cells = np.concatenate([visible_cells, fog_cells])
+        tokens[:num_tokens, 0], tokens[:num_tokens, 1] = np.divmod(cells, self.grid_dims[1])
+
+        layers = [
+            channels.cavalry,
+            channels.infantry,
+            channels.archers,
+            channels.siege,
+            channels.ownership[agent],
+            channels.ownership[opponent],
+            channels.cities,
+            channels.generals,
+            channels.mountains,
+        ]
+        for feature, layer in enumerate(layers, start=2):
+            tokens[:num_visible, feature] = layer.ravel()[visible_cells]
+        tokens[num_visible:num_tokens, -1] = 1
+        mask[:num_tokens] = True
+
+    def graph_observation(self, agent: str) -> np.ndarray:
+        """
+        Returns node features of the agent's observation for graph neural network policies.
+
+        Nodes are the passable cells of the map, in the order of Grid.adjacency, which holds the edges.
+        The adjacency is computed once per grid, so no edges are recomputed here.
+
+        Returns:
+            np.ndarray: float32 array of shape (num_nodes, len(GRAPH_FEATURES)).
+        """
+        channels = self.channels
+        nodes = self.grid.adjacency.nodes
+        opponent = self.agents[0] if agent == self.agents[1] else self.agents[1]
+        visible = channels.get_visibility(agent).ravel()[nodes]
+        cities = channels.cities.ravel()[nodes]
+
+        layers = {
+            "cavalry": channels.cavalry,
+            "infantry": channels.infantry,
+            "archers": channels.archers,
+            "siege": channels.siege,
+            "armies": channels.get_total_armies(),
+            "generals": channels.generals,
+            "cities": channels.cities,
+            "neutral_cells": channels.ownership_neutral,
+            "owned_cells": channels.ownership[agent],
+            "opponent_cells": channels.ownership[opponent],
+        }
+        features = np.empty((len(nodes), len(GRAPH_FEATURES)), dtype=np.float32)
+        features[:, 0], features[:, 1] = np.divmod(nodes, self.grid_dims[1])
+        for i, name in enumerate(GRAPH_FEATURES[2:], start=2):
+            if name in layers:
+                features[:, i] = layers[name].ravel()[nodes] * visible
+        # Mountains are never nodes, so cities are the only structures that can hide in fog
+        features[:, GRAPH_FEATURES.index("structures_in_fog")] = ~visible & cities
+        features[:, GRAPH_FEATURES.index("fog_cells")] = ~visible & ~cities
+        return features
+
+
+def stack_token_observations(games: list[Game], max_tokens: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Batched Game.token_observation with a fixed token budget, for all agents of many games at once.
+
+    Returns:
+        tuple: (tokens, mask)
+            tokens: float32 array of shape (len(games), num_agents, max_tokens, len(TOKEN_FEATURES))
+            mask: boolean array of shape (len(games), num_agents, max_tokens), False for padding tokens
+    """
+    num_agents = len(games[0].agents) if games else 0
+    tokens = np.zeros((len(games), num_agents, max_tokens, len(TOKEN_FEATURES)), dtype=np.float32)
+    mask = np.zeros((len(games), num_agents, max_tokens), dtype=bool)
+    for i, game in enumerate(games):
+        for j, agent in enumerate(game.agents):
+            game._fill_tokens(agent, tokens[i, j], mask[i, j])
+    return tokens, mask
@@ -1,7 +1,13 @@
-from collections import deque
-from typing import Literal
-
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from functools import cached_property
+from typing import Literal, NamedTuple
+
+import numba as nb
 import numpy as np
+from scipy.ndimage import label  # type: ignore
 
 from .config import MOUNTAIN, PASSABLE
 
@@ -9,15 +15,191 @@ DEFAULT_MIN_GRID_DIM = (15, 15)
 DEFAULT_MAX_GRID_DIM = (23, 23)
 DEFAULT_MOUNTAIN_DENSITY = 0.2
 DEFAULT_CITY_DENSITY = 0.05
-MAX_GENERALSIO_ATTEMPTS = 100
 MIN_GENERALS_DISTANCE = 15
 RADIUS_FROM_GENERAL = [6, 12]
+ALL_PAIRS_MAX_NODES = 2048
+
+
+# int8 codes of the cells of a grid, see Grid.codes. Cities with a cost c (0-9, 10 for "x") are
+# CITY_CODE + c, and general i (A, B) is GENERAL_CODE - i.
+MOUNTAIN_CODE = -1
+PASSABLE_CODE = 0
+CITY_CODE = 1
+GENERAL_CODE = -2
+_CELLS = "BA#.0123456789x"  # Cell of code c is _CELLS[c - _MIN_CODE]
+_MIN_CODE = GENERAL_CODE - 1
+_INVALID_CODE = 127
+_ENCODING = np.full(128, _INVALID_CODE, dtype=np.int8)
+_ENCODING[[ord(cell) for cell in _CELLS]] = np.arange(len(_CELLS)) + _MIN_CODE
+_DECODING = np.array(list(_CELLS))
+
+# Connects 4-neighbouring cells of the same grid only, for labelling a stack of grids at once
+_SLICE_STRUCTURE = np.zeros((3, 3, 3), dtype=bool)
+_SLICE_STRUCTURE[1] = [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
 
 
 class InvalidGridError(Exception):
     pass
 
 
+def encode_grid(grid: np.ndarray) -> np.ndarray:
+    """Returns the int8 codes of the cells of a grid of single characters."""
+    points = np.asarray(grid, dtype="<U1").view(np.uint32)
+    codes = _ENCODING[np.minimum(points, len(_ENCODING) - 1)]
+    if (codes == _INVALID_CODE).any():
+        raise InvalidGridError(f"Invalid grid cells: {set(np.asarray(grid)[codes == _INVALID_CODE].tolist())}.")
+    return codes
+
+
+def decode_grid(codes: np.ndarray) -> np.ndarray:
+    """Returns the grid of single characters of int8 codes, the inverse of encode_grid."""
+    return _DECODING[codes - _MIN_CODE]
+
+
+def canonical_hash(codes: np.ndarray) -> str:
+    """
+    Returns a hash of int8 grid codes (see Grid.codes) that is the same for all grids obtained from one another
+    by the 8 rotations & reflections of the grid and by swapping the generals. It hashes the smallest of these
+    variants, comparing shapes and then bytes.
+    """
+    swapped = codes.copy()
+    swapped[codes == GENERAL_CODE] = GENERAL_CODE - 1
+    swapped[codes == GENERAL_CODE - 1] = GENERAL_CODE
+    variants = []
+    for labelled in (codes, swapped):
+        for grid in (labelled, labelled.T):
+            for k in range(4):
+                variant = np.ascontiguousarray(np.rot90(grid, k))
+                variants.append((variant.shape, variant.tobytes()))
+    shape, cells = min(variants)
+    return hashlib.blake2b(np.array(shape, dtype=np.int64).tobytes() + cells).hexdigest()
+
+
+@nb.njit(cache=True)
+def compute_distance_field(passable: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """
+    Multi-source BFS over passable cells.
+
+    Args:
+        passable: 2D boolean mask of cells that can be walked through.
+        sources: (K, 2) array of (row, col) cells with distance 0.
+
+    Returns:
+        np.ndarray: int32 array with the shortest-path distance of each cell to the nearest source,
+        or -1 if the cell can't be reached.
+    """
+    height, width = passable.shape
+    distances = np.full((height, width), -1, dtype=np.int32)
+    queue = np.empty(height * width, dtype=np.int64)
+    head, tail = 0, 0
+    for k in range(sources.shape[0]):
+        i, j = sources[k, 0], sources[k, 1]
+        if distances[i, j] == -1:
+            distances[i, j] = 0
+            queue[tail] = i * width + j
+            tail += 1
+
+    while head < tail:
+        i, j = queue[head] // width, queue[head] % width
+        head += 1
+        for di, dj in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            ni, nj = i + di, j + dj
+            if 0 <= ni < height and 0 <= nj < width and passable[ni, nj] and distances[ni, nj] == -1:
+                distances[ni, nj] = distances[i, j] + 1
+                queue[tail] = ni * width + nj
+                tail += 1
+    return distances
+
+
+@nb.njit(cache=True)
+def compute_all_pairs_distances(neighbors: np.ndarray) -> np.ndarray:
+    """
+    BFS from every node of a graph given by its neighbour table (see Grid.neighbors).
+
+    Returns:
+        np.ndarray: (N, N) int16 array with the shortest-path distance between each pair of nodes,
+        or -1 if they aren't connected.
+    """
+    num_nodes = neighbors.shape[0]
+    distances = np.full((num_nodes, num_nodes), -1, dtype=np.int16)
+    queue = np.empty(num_nodes, dtype=np.int64)
+    for source in range(num_nodes):
+        row = distances[source]
+        row[source] = 0
+        queue[0] = source
+        head, tail = 0, 1
+        while head < tail:
+            node = queue[head]
+            head += 1
+            for k in range(neighbors.shape[1]):
+                neighbor = neighbors[node, k]
+                if neighbor != -1 and row[neighbor] == -1:
+                    row[neighbor] = row[node] + 1
+                    queue[tail] = neighbor
+                    tail += 1
+    return distances
+
+
+class Adjacency(NamedTuple):
+    """
+    Graph of the passable cells of a grid, with edges between 4-neighbouring cells, in CSR format.
+    Neighbours of node i are indices[indptr[i]:indptr[i + 1]].
+
+    Attributes:
+        nodes: Flat (row-major) index of the cell of each node.
+        node_ids: Node id of each cell of the grid, -1 for impassable cells.
+        indptr: Offsets into indices, of length len(nodes) + 1.
+        indices: Neighbouring node ids, of length 2 * number of edges.
+    """
+
+    nodes: np.ndarray
+    node_ids: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+
+
+class StaticLayers(NamedTuple):
+    """
+    Layers of a grid that only depend on its map, i.e. what games on it start from. Arrays are read-only,
+    since they are shared by all grids with the same content, see Grid.static_layers.
+
+    Attributes:
+        generals, mountains, passable, cities: Masks of the cells, which don't change during a game.
+        neutral: Mask of the cells owned by no agent at the start, i.e. passable cells except generals.
+        infantry: float32 infantry of each cell at the start, 1 on generals and 40 + their cost on cities.
+        general_positions: (row, col) of the general of each agent, in the order of the agents.
+    """
+
+    generals: np.ndarray
+    mountains: np.ndarray
+    passable: np.ndarray
+    cities: np.ndarray
+    neutral: np.ndarray
+    infantry: np.ndarray
+    general_positions: np.ndarray
+
+
+def compute_static_layers(codes: np.ndarray) -> StaticLayers:
+    """Computes the static layers of a grid from its int8 codes (see Grid.codes)."""
+    generals = codes <= GENERAL_CODE
+    cities = codes >= CITY_CODE
+    infantry = generals + np.where(cities, 40 + codes - CITY_CODE, 0).astype(np.float32)
+    general_positions = np.array(
+        [np.argwhere(codes == GENERAL_CODE - i)[0] for i in range(np.count_nonzero(generals))], dtype=np.int64
+    ).reshape(-1, 2)
+    mountains = codes == MOUNTAIN_CODE
+    layers = StaticLayers(generals, mountains, ~mountains, cities, codes >= PASSABLE_CODE, infantry, general_positions)
+    for layer in layers:
+        layer.flags.writeable = False
+    return layers
+
+
+# Static layers of the most recently used maps, shared by all grids of the same content
+STATIC_LAYERS_CACHE_SIZE = 1024
+_static_layers_cache: OrderedDict[str, StaticLayers] = OrderedDict()
+_static_layers_lock = threading.Lock()
+
+
 class Grid:
     """
     Represents the game grid containing passable areas, mountains, cities, and generals.
@@ -47,23 +229,170 @@ class Grid:
         Grid.ensure_grid_is_valid(grid)
         self.grid = grid
 
+    @classmethod
+    def from_codes(cls, codes: np.ndarray, validate: bool = True) -> "Grid":
+        """
+        Creates a grid from the int8 codes of its cells (see Grid.codes), without any string processing.
+        The character grid is only decoded when accessed.
+
+        Args:
+            codes: 2D int8 array of cell codes.
+            validate: Whether to check that the grid is valid, which grids known to be valid can skip.
+        """
+        grid = cls.__new__(cls)
+        grid.codes = codes
+        if validate:
+            Grid.ensure_grid_is_valid(codes)
+        return grid
+
+    @cached_property
+    def grid(self) -> np.ndarray:
+        """2D array of the single-character cells, decoded from the codes for grids created from them."""
+        return decode_grid(self.codes)
+
+    @cached_property
+    def codes(self) -> np.ndarray:
+        """
+        The cells as an int8 array, computed once per grid: MOUNTAIN_CODE, PASSABLE_CODE, CITY_CODE + the
+        city's cost (0-10) and GENERAL_CODE - i for the general of agent i.
+        """
+        return encode_grid(self.grid)
+
+    @cached_property
+    def content_hash(self) -> str:
+        """Hash of the shape and the cells of the grid, equal for grids with the same content."""
+        codes = np.ascontiguousarray(self.codes)
+        return hashlib.blake2b(np.array(codes.shape, dtype=np.int64).tobytes() + codes.tobytes()).hexdigest()
+
+    @cached_property
+    def canonical_hash(self) -> str:
+        """
+        Hash of the grid up to rotations, reflections and swapping the generals, see canonical_hash.
+        Grids with the same canonical hash are the same map for all purposes, e.g. to deduplicate map banks.
+        """
+        return canonical_hash(self.codes)
+
+    @cached_property
+    def static_layers(self) -> StaticLayers:
+        """
+        The layers games on this grid start from. They are cached by content_hash, so they are computed
+        once for grids with the same content, e.g. when maps are reused across resets, and shared by them.
+        """
+        with _static_layers_lock:
+            layers = _static_layers_cache.get(self.content_hash)
+            if layers is not None:
+                _static_layers_cache.move_to_end(self.content_hash)
+                return layers
+
+        layers = compute_static_layers(self.codes)
+        with _static_layers_lock:
+            _static_layers_cache[self.content_hash] = layers
+            while len(_static_layers_cache) > STATIC_LAYERS_CACHE_SIZE:
+                _static_layers_cache.popitem(last=False)
+        return layers
+
+    def __getstate__(self) -> dict:
+        # Unpickled grids share the cached static layers again instead of bringing their own copy
+        state = self.__dict__.copy()
+        state.pop("static_layers", None)
+        return state
+
     @property
     def shape(self):
-        return self.grid.shape
+        return self.codes.shape if "codes" in self.__dict__ else self.grid.shape
+
+    @cached_property
+    def node_ids(self) -> np.ndarray:
+        """Node id of each cell, numbering the passable cells in row-major order, -1 for mountains."""
+        passable = self.codes != MOUNTAIN_CODE
+        node_ids = np.full(self.shape, -1, dtype=np.int32)
+        node_ids[passable] = np.arange(np.count_nonzero(passable), dtype=np.int32)
+        return node_ids
+
+    @cached_property
+    def neighbors(self) -> np.ndarray:
+        """
+        Neighbour table of the passable cells, computed once per grid: (num_nodes, 4) int32 array with the
+        node ids (see node_ids) of the cells above, below, left and right of each node, -1 for mountains
+        and cells outside the grid.
+        """
+        nodes = np.flatnonzero(self.node_ids != -1)
+        # Pad with impassable cells so that neighbours of border cells can be looked up too
+        padded_ids = np.pad(self.node_ids, 1, constant_values=-1)
+        rows, cols = np.divmod(nodes, self.shape[1])
+        return np.stack(
+            [padded_ids[rows + 1 + di, cols + 1 + dj] for di, dj in [(-1, 0), (1, 0), (0, -1), (0, 1)]], axis=1
+        )
+
+    @cached_property
+    def adjacency(self) -> Adjacency:
+        """
+        Adjacency of the passable cells, computed once per grid. Useful for graph neural network policies.
+        """
+        nodes = np.flatnonzero(self.node_ids != -1).astype(np.int32)
+        has_neighbor = self.neighbors != -1
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+        np.cumsum(has_neighbor.sum(axis=1), out=indptr[1:])
+        indices = self.neighbors[has_neighbor].astype(np.int32)
+        return Adjacency(nodes, self.node_ids, indptr, indices)
+
+    @cached_property
+    def general_distances(self) -> np.ndarray:
+        """
+        Shortest-path distances over passable cells from the general of each agent, computed once per grid:
+        (num_generals, height, width) int32 array, -1 for cells that can't be reached.
+        """
+        positions = self.static_layers.general_positions
+        return np.stack([compute_distance_field(self.codes != MOUNTAIN_CODE, position[None]) for position in positions])
+
+    @cached_property
+    def city_distances(self) -> np.ndarray:
+        """
+        Shortest-path distances over passable cells from each city, in row-major order, computed once per
+        grid: (num_cities, height, width) int32 array, -1 for cells that can't be reached.
+        """
+        passable = self.codes != MOUNTAIN_CODE
+        cities = np.argwhere(self.codes >= CITY_CODE)
+        distances = np.empty((len(cities), *self.shape), dtype=np.int32)
+        for i, city in enumerate(cities):
+            distances[i] = compute_distance_field(passable, city[None])
+        return distances
+
+    def all_pairs_distances(self, max_nodes: int = ALL_PAIRS_MAX_NODES) -> np.ndarray:
+        """
+        Shortest-path distances between all pairs of passable cells, computed on first use and cached:
+        (num_nodes, num_nodes) int16 array indexed by node ids (see node_ids), -1 for disconnected nodes.
+
+        Args:
+            max_nodes: Largest number of passable cells to compute the matrix for, since its size grows
+                with the square of it.
+
+        Raises:
+            ValueError: If the grid has more than max_nodes passable cells.
+        """
+        if "_all_pairs_distances" not in self.__dict__:
+            if len(self.neighbors) > max_nodes:
+                raise ValueError(
+                    f"All-pairs distances need at most {max_nodes} nodes, the grid has {len(self.neighbors)}."
+                )
+            self._all_pairs_distances = compute_all_pairs_distances(self.neighbors)
+        return self._all_pairs_distances
 
     @staticmethod
     def ensure_grid_is_valid(grid: np.ndarray):
-        if not Grid.are_generals_connected(grid):
+        codes = Grid._as_codes(grid)
+        if not Grid.are_generals_connected(codes):
             raise InvalidGridError("Invalid grid layout - generals cannot reach each other.")
 
         # check that exactly one 'A' and one 'B' are present in the grid
-        first_general = np.argwhere(np.isin(grid, ["A"]))
-        second_general = np.argwhere(np.isin(grid, ["B"]))
-        if len(first_general) != 1 or len(second_general) != 1:
+        if np.count_nonzero(codes == GENERAL_CODE) != 1 or np.count_nonzero(codes == GENERAL_CODE - 1) != 1:
             raise InvalidGridError("Exactly one 'A' and one 'B' should be present in the grid.")
 
     def __eq__(self, other):
-        return np.array_equal(self.grid, other.grid)
+        return np.array_equal(self.codes, other.codes)
+
+    def __hash__(self):
+        return hash((self.shape, self.codes.tobytes()))
 
     @staticmethod
     def generals_distance(grid: "Grid") -> int:
@@ -81,30 +410,61 @@ class Grid:
     @staticmethod
     def are_generals_connected(grid: np.ndarray | str) -> bool:
         """
-        Returns True if there is a path connecting the two generals.
+        Returns True if there is a path connecting the two generals, through cells that are neither
+        mountains nor cities.
         """
-        if isinstance(grid, str):
-            grid = Grid.numpify_grid(grid)
+        codes = Grid._as_codes(grid)
+        labels, _ = label(Grid._walkable(codes))
+        generals = np.argwhere(codes <= GENERAL_CODE)
+        start, end = generals[0], generals[1]
+        return labels[start[0], start[1]] == labels[end[0], end[1]]
 
-        height, width = grid.shape
+    @staticmethod
+    def validate_many(grids: Sequence["Grid | np.ndarray"] | np.ndarray) -> np.ndarray:
+        """
+        Checks many candidate grids at once, e.g. for bulk map generation. All grids are labelled
+        in a single pass, so this is much faster than validating them one by one.
 
-        def dfs(grid, visited, square):
-            i, j = square
-            if i < 0 or i >= height or j < 0 or j >= width or visited[i, j]:
-                return
-            if grid[i, j] == MOUNTAIN or str(grid[i, j]).isdigit() or grid[i, j] == "x":  # mountain or city
-                return
-            visited[i, j] = True
-            for di, dj in [[-1, 0], [1, 0], [0, -1], [0, 1]]:
-                new_square = (i + di, j + dj)
-                dfs(grid, visited, new_square)
+        Args:
+            grids: Grids or their int8 codes (see Grid.codes), possibly of different shapes,
+                or an (N, height, width) int8 array of codes.
 
-        generals = np.argwhere(np.isin(grid, ["A", "B"]))
-        start, end = generals[0], generals[1]
+        Returns:
+            np.ndarray: (N,) boolean array, True for grids with exactly one general of each agent,
+            connected to each other.
+        """
+        if isinstance(grids, np.ndarray) and grids.ndim == 3:
+            codes = grids
+        else:
+            grid_codes = [grid.codes if isinstance(grid, Grid) else grid for grid in grids]
+            if not grid_codes:
+                return np.zeros(0, dtype=bool)
+            height = max(grid.shape[0] for grid in grid_codes)
+            width = max(grid.shape[1] for grid in grid_codes)
+            # Mountains as padding keep grids of different shapes apart
+            codes = np.full((len(grid_codes), height, width), MOUNTAIN_CODE, dtype=np.int8)
+            for i, grid in enumerate(grid_codes):
+                codes[i, : grid.shape[0], : grid.shape[1]] = grid
+
+        labels, _ = label(Grid._walkable(codes), structure=_SLICE_STRUCTURE)
+        valid = np.ones(len(codes), dtype=bool)
+        general_labels = []
+        for general in (GENERAL_CODE, GENERAL_CODE - 1):
+            is_general = (codes == general).reshape(len(codes), -1)
+            valid &= is_general.sum(axis=1) == 1
+            general_labels.append(labels.reshape(len(codes), -1)[np.arange(len(codes)), is_general.argmax(axis=1)])
+        return valid & (general_labels[0] == general_labels[1])
 
-        visited = np.zeros_like(grid, dtype=bool)
-        dfs(grid, visited, start)
-        return visited[end[0], end[1]]
+    @staticmethod
+    def _as_codes(grid: np.ndarray | str) -> np.ndarray:
+        if isinstance(grid, str):
+            grid = Grid.numpify_grid(grid)
+        return grid if grid.dtype == np.int8 else encode_grid(grid)
+
+    @staticmethod
+    def _walkable(codes: np.ndarray) -> np.ndarray:
+        """Cells generals can be connected through, i.e. passable cells and generals."""
+        return (codes == PASSABLE_CODE) | (codes <= GENERAL_CODE)
 
     def __str__(self):
         return Grid.stringify_grid(self.grid)
@@ -152,7 +512,87 @@ class GridFactory:
         else:
             raise ValueError(f"Invalid mode: {self.mode}")
 
+    def generate_batch(self, n: int) -> list[Grid]:
+        """
+        Generates n grids at once, reproducibly from the factory's random generator.
+
+        In "uniform" mode, the terrain of all grids is sampled in a single draw, the generals are placed
+        for all grids at once and connectivity is checked in bulk with Grid.validate_many, resampling only
+        the grids that fail. Grids are built from their int8 codes, without going through strings.
+        Grids of "generalsio" mode are generated one by one.
+
+        Uniform batches follow the same rules as generate_uniform_grid, i.e. the same cell probabilities and
+        minimum distance between the generals, but they draw from the random generator in a different order.
+        A batch is therefore not the grids that n calls of generate would return for the same seed.
+        Its widths are also drawn between min_grid_dims[1] and max_grid_dims[1], whereas generate_uniform_grid
+        uses the height bounds for both.
+        """
+        if self.mode != "uniform":
+            return [self.generate() for _ in range(n)]
+
+        p_neutral = 1 - self.mountain_density - self.city_density
+        if p_neutral < 0:
+            raise ValueError("Sum of mountain_density and city_density cannot exceed 1.")
+
+        height, width = self.max_grid_dims
+        codes = np.empty((n, height, width), dtype=np.int8)
+        dims = np.empty((n, 2), dtype=np.int64)
+        pending = np.arange(n)
+        while len(pending) > 0:
+            dims[pending], codes[pending] = self._sample_uniform_codes(len(pending))
+            pending = pending[~Grid.validate_many(codes[pending])]
+
+        return [Grid.from_codes(codes[i, :h, :w].copy(), validate=False) for i, (h, w) in enumerate(dims)]
+
+    def _sample_uniform_codes(self, n: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Samples the dims and the codes of n uniform grids, padded with mountains to max_grid_dims.
+        Generals are placed, but the grids aren't checked to be valid.
+        """
+        max_height, max_width = self.max_grid_dims
+        heights = self.rng.integers(self.min_grid_dims[0], max_height + 1, size=n)
+        widths = self.rng.integers(self.min_grid_dims[1], max_width + 1, size=n)
+
+        # Same cell probabilities as generate_uniform_grid, cities of each cost being equally likely,
+        # but sampled as codes for all grids at once
+        cells = np.array([PASSABLE_CODE, MOUNTAIN_CODE, *range(CITY_CODE, CITY_CODE + 11)], dtype=np.int8)
+        p_cities = self.city_density / 11
+        probs = [1 - self.mountain_density - self.city_density, self.mountain_density] + [p_cities] * 11
+        codes = self.rng.choice(cells, size=(n, max_height, max_width), p=probs)
+        rows, cols = np.arange(max_height), np.arange(max_width)
+        outside = (rows[None, :, None] >= heights[:, None, None]) | (cols[None, None, :] >= widths[:, None, None])
+        codes[outside] = MOUNTAIN_CODE
+
+        grids = np.arange(n)
+        if self.general_positions is not None:
+            for i, (row, col) in enumerate(self.general_positions):
+                codes[grids, row, col] = GENERAL_CODE - i
+            return np.stack([heights, widths], axis=1), codes
+
+        # Generals should be at least half of the largest dim apart, redraw the second one until they are
+        general_rows = self.rng.integers(0, heights, size=(2, n))
+        general_cols = self.rng.integers(0, widths, size=(2, n))
+        min_distance = np.maximum(heights, widths) // 2
+        too_close = np.arange(n)
+        while True:
+            distance = np.abs(general_rows[0] - general_rows[1]) + np.abs(general_cols[0] - general_cols[1])
+            too_close = too_close[distance[too_close] < min_distance[too_close]]
+            if len(too_close) == 0:
+                break
+            general_rows[1, too_close] = self.rng.integers(0, heights[too_close])
+            general_cols[1, too_close] = self.rng.integers(0, widths[too_close])
+
+        for i in range(2):
+            codes[grids, general_rows[i], general_cols[i]] = GENERAL_CODE - i
+        return np.stack([heights, widths], axis=1), codes
+
     def generate_generalsio_grid(self) -> Grid:
+        """
+        Generates a grid resembling those of generals.io, constructively: the second general is drawn
+        directly among the cells far enough from the first, and a path is carved through the mountains
+        if there is none. Cities are kept off a shortest path between the generals, so the grid is always
+        valid and never has to be generated again.
+        """
         grid_height = self.rng.integers(DEFAULT_MIN_GRID_DIM[0], DEFAULT_MAX_GRID_DIM[0] + 1)
         grid_width = self.rng.integers(DEFAULT_MIN_GRID_DIM[1], DEFAULT_MAX_GRID_DIM[1] + 1)
         grid_dims = (grid_height, grid_width)
@@ -162,90 +602,67 @@ class GridFactory:
         cities_to_place = 5 + 2 * self.rng.choice([2, 3])
         num_mountains = int(DEFAULT_MOUNTAIN_DENSITY * num_tiles + 0.02 * num_tiles * self.rng.random())
 
-        def bfs_distance(start, grid):
-            distances = np.full(grid_dims, float("inf"))
-            distances[start] = 0
-            queue = deque([start])
-
-            # Possible moves: up, right, down, left
-            moves = [(-1, 0), (0, 1), (1, 0), (0, -1)]
-
-            while queue:
-                current = queue.popleft()
-                current_dist = distances[current]
-
-                for move in moves:
-                    next_pos = (current[0] + move[0], current[1] + move[1])
-
-                    # Check bounds
-                    if 0 <= next_pos[0] < grid_dims[0] and 0 <= next_pos[1] < grid_dims[1]:
-                        # Check if passable (not a mountain) and not visited
-                        if grid[next_pos] != MOUNTAIN and distances[next_pos] == float("inf"):
-                            distances[next_pos] = current_dist + 1
-                            queue.append(next_pos)
-
-            return distances
-
-        def create_distance_mask(distances, max_distance):
-            return (distances <= max_distance) & (distances > 0)
-
         # Initialize empty map
         map = np.full(grid_dims, PASSABLE, dtype=str)
 
         # Place mountains randomly
         self._place_mountains(map, num_mountains)
 
-        g1 = (self.rng.integers(grid_height), self.rng.integers(grid_width))
-        distances_from_g1 = bfs_distance(g1, map)
-
-        max_attempts = MAX_GENERALSIO_ATTEMPTS // 5
-        g2 = None
-        for _ in range(max_attempts):
-            candidate_g2 = (self.rng.integers(grid_height), self.rng.integers(grid_width))
-            if distances_from_g1[candidate_g2] >= MIN_GENERALS_DISTANCE and distances_from_g1[candidate_g2] != float(
-                "inf"
-            ):
-                g2 = candidate_g2
-                break
-
-        if g2 is None:
-            # If we couldn't place g2 after max attempts, start over with a new grid
-            return self.generate_generalsio_grid()
+        # The first general needs cells far enough from it, i.e. not too close to the center of small grids
+        rows, cols = np.indices(grid_dims)
+        farthest = np.maximum(rows, grid_height - 1 - rows) + np.maximum(cols, grid_width - 1 - cols)
+        g1_candidates = np.argwhere((farthest >= MIN_GENERALS_DISTANCE) & (map != MOUNTAIN))
+        g1 = tuple(g1_candidates[self.rng.integers(len(g1_candidates))])
+        distances_from_g1 = compute_distance_field(map != MOUNTAIN, np.array([g1]))
+
+        candidates = np.argwhere(distances_from_g1 >= MIN_GENERALS_DISTANCE)
+        if len(candidates) == 0:
+            # No reachable cell is far enough, pick a far enough cell and clear a path to it. Paths are
+            # at least as long as the manhattan distance, so the generals stay far enough apart.
+            candidates = np.argwhere(np.abs(rows - g1[0]) + np.abs(cols - g1[1]) >= MIN_GENERALS_DISTANCE)
+        g2 = tuple(candidates[self.rng.integers(len(candidates))])
+        if distances_from_g1[g2] == -1:
+            self._carve_path(map, g1, g2)
+            distances_from_g1 = compute_distance_field(map != MOUNTAIN, np.array([g1]))
 
         general_positions = [g1, g2]
-
-        distances_from_g2 = bfs_distance(g2, map)
+        distances_from_g2 = compute_distance_field(map != MOUNTAIN, np.array([g2]))
+
+        # Cities block the way, keep them off a shortest path between the generals
+        path = np.zeros(grid_dims, dtype=bool)
+        i, j = g2
+        while (i, j) != g1:
+            path[i, j] = True
+            for di, dj in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                ni, nj = i + di, j + dj
+                if (
+                    0 <= ni < grid_height
+                    and 0 <= nj < grid_width
+                    and distances_from_g1[ni, nj] == distances_from_g1[i, j] - 1
+                ):
+                    i, j = ni, nj
+                    break
 
         # Place one city close to each general
         for distance in RADIUS_FROM_GENERAL:
-            mask_close_g1 = create_distance_mask(distances_from_g1, distance)
-            mask_close_g2 = create_distance_mask(distances_from_g2, distance)
-            for mask in [mask_close_g1, mask_close_g2]:
-                valid_positions = np.where(mask)
+            for distances in [distances_from_g1, distances_from_g2]:
+                valid_positions = np.argwhere((distances > 0) & (distances <= distance) & ~path)
+                if len(valid_positions) == 0:
+                    continue
 
                 # Randomly select one position from the valid positions
-                idx = self.rng.integers(0, len(valid_positions[0]))
-                city_pos = (valid_positions[0][idx], valid_positions[1][idx])
+                city_pos = tuple(valid_positions[self.rng.integers(len(valid_positions))])
                 # Generate city value (0 - 9 or 'x')
-                city_cost = self.rng.choice([str(i) for i in range(10)] + ["x"])
-                map[city_pos] = city_cost
-
+                map[city_pos] = self.rng.choice([str(i) for i in range(10)] + ["x"])
                 cities_to_place -= 1
 
         # Place remaining cities
-        self._place_cities(map, cities_to_place)
+        self._place_cities(map, min(cities_to_place, np.count_nonzero(map == MOUNTAIN)))
 
         for i, idx in enumerate(general_positions):
             map[idx[0], idx[1]] = chr(ord("A") + i)
 
-        # Convert map to string
-        map_string = "\n".join(["".join(row) for row in map.astype(str)])
-
-        try:
-            return Grid(map_string)
-        except InvalidGridError:
-            # Keep randomly generating grids until one works!
-            return self.generate_generalsio_grid()
+        return Grid.from_codes(encode_grid(map), validate=False)
 
     def generate_uniform_grid(self) -> Grid:
         grid_height = self.rng.integers(self.min_grid_dims[0], self.max_grid_dims[0] + 1)
@@ -290,6 +707,15 @@ class GridFactory:
             # Keep randomly generating grids until one works!
             return self.generate_uniform_grid()
 
+    def _carve_path(self, map: np.ndarray, start: tuple[int, int], end: tuple[int, int]):
+        """Clears mountains along a random monotone path from start to end, i.e. one of manhattan length."""
+        vertical = np.repeat([[np.sign(end[0] - start[0]), 0]], abs(end[0] - start[0]), axis=0)
+        horizontal = np.repeat([[0, np.sign(end[1] - start[1])]], abs(end[1] - start[1]), axis=0)
+        steps = self.rng.permutation(np.concatenate([vertical, horizontal]))
+        path = np.asarray(start) + np.cumsum(steps, axis=0)
+        path = path[map[path[:, 0], path[:, 1]] == MOUNTAIN]
+        map[path[:, 0], path[:, 1]] = PASSABLE
+
     def _place_mountains(self, map: np.ndarray, num_mountains: int):
         available_positions = np.argwhere(map == PASSABLE)
         selected_indices = self.rng.choice(len(available_positions), size=num_mountains, replace=False)
@@ -302,3 +728,32 @@ class GridFactory:
         selected_positions = mountain_positions[selected_indices]
         city_costs = self.rng.choice([str(i) for i in range(10)] + ["x"], size=cities_to_place)
         map[selected_positions[:, 0], selected_positions[:, 1]] = city_costs
+
+
+class GridPool:
+    """
+    A fixed pool of grids, generated up front by a grid factory, which can be used in its place.
+    New games then start right away on one of the pool's grids, drawn at random, instead of a newly generated one.
+    """
+
+    def __init__(self, grid_factory: GridFactory, size: int, seed: int | None = None):
+        """
+        Args:
+            grid_factory: Factory generating the grids of the pool.
+            size: Number of grids in the pool.
+            seed: A random seed for drawing grids from the pool.
+        """
+        assert size > 0, "The pool needs at least one grid."
+        self.grids = [grid_factory.generate() for _ in range(size)]
+        self.rng = np.random.default_rng(seed)
+        self.min_grid_dims = grid_factory.min_grid_dims
+        self.max_grid_dims = grid_factory.max_grid_dims
+
+    def __len__(self) -> int:
+        return len(self.grids)
+
+    def set_rng(self, rng: np.random.Generator):
+        self.rng = rng
+
+    def generate(self) -> Grid:
+        return self.grids[self.rng.integers(len(self.grids))]
@@ -0,0 +1,116 @@
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .grid import Grid
+
+# An archive starts with ARCHIVE_MAGIC and the number of grids, followed by their index and their codes
+ARCHIVE_MAGIC = b"GENMAPS1"
+_HEADER_SIZE = len(ARCHIVE_MAGIC) + 8
+_INDEX_DTYPE = np.dtype([("offset", "<u8"), ("height", "<u2"), ("width", "<u2")])
+
+
+class MapArchive:
+    """
+    Many grids in a single file, stored as their int8 codes (see Grid.codes) behind an index of offsets & shapes.
+
+    The file is opened as a memory map, so opening is instant whatever the number of grids, and a grid
+    is only read when it is accessed. Grids are created from their codes without any string processing
+    or validation, since only valid grids are written.
+
+    An archive can be used in place of a GridFactory, generate() then draws one of its grids at random.
+    """
+
+    def __init__(self, path: str | Path, seed: int | None = None):
+        """
+        Args:
+            path: Path of an archive written with MapArchive.write.
+            seed: A random seed for drawing grids with generate.
+        """
+        self.path = Path(path)
+        self._buffer = np.memmap(self.path, dtype=np.uint8, mode="r")
+        if bytes(self._buffer[: len(ARCHIVE_MAGIC)]) != ARCHIVE_MAGIC:
+            raise ValueError(f"{self.path} is not a map archive.")
+        count = int(self._buffer[len(ARCHIVE_MAGIC) : _HEADER_SIZE].view("<u8")[0])
+        data_start = _HEADER_SIZE + count * _INDEX_DTYPE.itemsize
+        self.index = np.asarray(self._buffer[_HEADER_SIZE:data_start]).view(_INDEX_DTYPE)
+        self._codes = np.asarray(self._buffer[data_start:]).view(np.int8)
+
+        self.rng = np.random.default_rng(seed)
+        if count > 0:
+            self.min_grid_dims = (int(self.index["height"].min()), int(self.index["width"].min()))
+            self.max_grid_dims = (int(self.index["height"].max()), int(self.index["width"].max()))
+
+    @staticmethod
+    def write(path: str | Path, grids: Iterable[Grid]) -> None:
+        """Writes grids into a new archive at path."""
+        codes = [np.ascontiguousarray(grid.codes, dtype=np.int8) for grid in grids]
+        index = np.zeros(len(codes), dtype=_INDEX_DTYPE)
+        index["height"] = [grid_codes.shape[0] for grid_codes in codes]
+        index["width"] = [grid_codes.shape[1] for grid_codes in codes]
+        sizes = index["height"].astype(np.uint64) * index["width"]
+        index["offset"][1:] = np.cumsum(sizes)[:-1]
+
+        with open(path, "wb") as file:
+            file.write(ARCHIVE_MAGIC)
+            file.write(np.uint64(len(codes)).tobytes())
+            file.write(index.tobytes())
+            for grid_codes in codes:
+                file.write(grid_codes.tobytes())
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, i: int) -> Grid:
+        offset, height, width = (int(value) for value in self.index[i])
+        codes = self._codes[offset : offset + height * width].reshape(height, width)
+        return Grid.from_codes(codes, validate=False)
+
+    def __iter__(self) -> Iterator[Grid]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def canonical_hashes(self, num_workers: int = 1) -> list[str]:
+        """
+        Returns the canonical hash (see Grid.canonical_hash) of every grid, in order. With several workers,
+        the archive is split into contiguous chunks hashed in parallel by processes, each opening the archive.
+        """
+        if num_workers <= 1 or len(self) <= 1:
+            return _canonical_hashes(self.path, 0, len(self))
+        bounds = np.linspace(0, len(self), min(num_workers, len(self)) + 1).astype(int).tolist()
+        with ProcessPoolExecutor(len(bounds) - 1) as executor:
+            chunks = executor.map(_canonical_hashes, [self.path] * (len(bounds) - 1), bounds[:-1], bounds[1:])
+            return [grid_hash for chunk in chunks for grid_hash in chunk]
+
+    def deduplicate(self, path: str | Path, num_workers: int = 1) -> "MapArchive":
+        """
+        Writes the grids of this archive to a new archive at path, without duplicates: grids that are the same
+        map up to rotations, reflections and swapping the generals are kept only once, in their first occurrence.
+
+        Args:
+            path: Path of the new archive, which must differ from this archive's path.
+            num_workers: Number of processes computing the canonical hashes, see canonical_hashes.
+
+        Returns:
+            MapArchive: The new archive.
+        """
+        assert Path(path).resolve() != self.path.resolve(), "The deduplicated archive needs a path of its own."
+        first_indices: dict[str, int] = {}
+        for i, grid_hash in enumerate(self.canonical_hashes(num_workers)):
+            first_indices.setdefault(grid_hash, i)
+        MapArchive.write(path, (self[i] for i in first_indices.values()))
+        return MapArchive(path)
+
+    def set_rng(self, rng: np.random.Generator):
+        self.rng = rng
+
+    def generate(self) -> Grid:
+        return self[self.rng.integers(len(self))]
+
+
+def _canonical_hashes(path: Path, start: int, stop: int) -> list[str]:
+    """Canonical hashes of the grids start to stop of the archive at path."""
+    archive = MapArchive(path)
+    return [archive[i].canonical_hash for i in range(start, stop)]
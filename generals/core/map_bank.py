@@ -0,0 +1,152 @@
+import multiprocessing as mp
+import queue
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from .grid import Grid, GridFactory
+from .map_archive import MapArchive
+
+
+class MapBank:
+    """
+    A bounded queue of ready grids, kept full by worker processes that generate them in the background.
+
+    The bank can be used in place of a GridFactory: generate() pops a grid that was generated and validated
+    ahead of time, so resetting an environment doesn't wait for map generation unless the bank ran dry.
+    Grids arrive in the order workers finish them, so the rng environments set with set_rng is ignored.
+
+    Banks can be saved to disk and loaded back. Loaded grids are handed out first; without a grid factory
+    to generate more, the loaded grids are reused in turn.
+    """
+
+    def __init__(
+        self,
+        grid_factory: GridFactory | None = None,
+        capacity: int = 256,
+        num_workers: int = 1,
+        seed: int | None = None,
+        context: str | None = None,
+        grids: list[Grid] | None = None,
+    ):
+        """
+        Args:
+            grid_factory: Factory the workers generate grids with, copied into every worker.
+            capacity: Maximum number of generated grids waiting in the queue.
+            num_workers: Number of worker processes.
+            seed: Seed of the workers' random generators, each gets an independent stream derived from it.
+            context: Multiprocessing start method, e.g. "fork" or "spawn". The platform default if None.
+            grids: Ready grids, handed out before any generated one.
+        """
+        assert grid_factory is not None or grids, "A MapBank needs a grid factory or grids to start with."
+        self.grid_factory = grid_factory
+        self._ready: deque[Grid] = deque(grids or [])
+
+        if grid_factory is not None:
+            self.min_grid_dims = grid_factory.min_grid_dims
+            self.max_grid_dims = grid_factory.max_grid_dims
+        else:
+            shapes = np.array([grid.shape for grid in self._ready])
+            self.min_grid_dims = tuple(shapes.min(axis=0).tolist())
+            self.max_grid_dims = tuple(shapes.max(axis=0).tolist())
+
+        self._processes: list = []
+        self._closed = False
+        if grid_factory is not None:
+            ctx = mp.get_context(context)
+            self._queue = ctx.Queue(maxsize=capacity)
+            self._stop = ctx.Event()
+            for worker_seed in np.random.SeedSequence(seed).spawn(num_workers):
+                process = ctx.Process(
+                    target=_generate_grids, args=(grid_factory, worker_seed, self._queue, self._stop), daemon=True
+                )
+                process.start()
+                self._processes.append(process)
+
+    def set_rng(self, rng: np.random.Generator):
+        """Accepted for compatibility with GridFactory, grids are handed out in the order they are ready."""
+
+    def generate(self) -> Grid:
+        """
+        Returns the next ready grid, waiting for the workers only if there is none.
+        Once the bank is closed, only grids that are still ready are handed out.
+        """
+        if self._ready:
+            grid = self._ready.popleft()
+            if self.grid_factory is None:
+                self._ready.append(grid)
+            return grid
+        self._check_open()
+        return self._queue.get()
+
+    def save(self, path: str | Path, num_grids: int = 0) -> None:
+        """
+        Saves all ready grids, i.e. loaded grids not handed out yet and all grids waiting in the queue,
+        to a MapArchive. Saved grids stay in the bank.
+
+        Args:
+            path: Path of the archive.
+            num_grids: Minimum number of grids to save, waiting for the workers to generate them if needed.
+                Useful to build archives of many more grids than the capacity of the bank.
+        """
+        if self.grid_factory is not None:
+            self._ready.extend(self._drain())
+            while len(self._ready) < num_grids:
+                self._check_open()
+                self._ready.append(self._queue.get())
+        MapArchive.write(path, self._ready)
+
+    @classmethod
+    def load(cls, path: str | Path, grid_factory: GridFactory | None = None, **kwargs) -> "MapBank":
+        """
+        Loads grids saved with save. If a grid factory is given, new grids are generated in the background
+        once the loaded ones are used up, see MapBank for the other arguments.
+        """
+        return cls(grid_factory, grids=list(MapArchive(path)), **kwargs)
+
+    def close(self) -> None:
+        """Stops the workers, discarding grids that are still in the queue."""
+        self._closed = True
+        if not self._processes:
+            return
+        self._stop.set()
+        for process in self._processes:
+            # Workers only exit once the grids they put in the queue have been read
+            while process.is_alive():
+                self._drain()
+                process.join(timeout=0.05)
+        self._processes = []
+
+    def _check_open(self) -> None:
+        """Raises instead of waiting for workers that were stopped."""
+        if self._closed:
+            raise RuntimeError("MapBank is closed")
+
+    def _drain(self) -> list[Grid]:
+        """Takes all grids out of the queue without waiting."""
+        grids = []
+        while True:
+            try:
+                grids.append(self._queue.get_nowait())
+            except queue.Empty:
+                return grids
+
+    def __enter__(self) -> "MapBank":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _generate_grids(grid_factory: GridFactory, seed: np.random.SeedSequence, grids: mp.Queue, stop) -> None:
+    """Generates grids until stopped, waiting while the queue is full."""
+    grid_factory.set_rng(np.random.default_rng(seed))
+    while not stop.is_set():
+        grid = grid_factory.generate()
+        while not stop.is_set():
+            try:
+                grids.put(grid, timeout=0.1)
+                break
+            except queue.Full:
+                continue
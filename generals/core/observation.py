@@ -1,9 +1,68 @@
 import dataclasses
+import struct
+from collections.abc import ItemsView, KeysView, ValuesView
+from enum import IntEnum
 
 import numpy as np
 
+# Observation fields grouped by their kind. Together they give the channel order of Observation.as_tensor.
+UNIT_LAYERS = ["cavalry", "infantry", "archers", "siege", "armies"]
+MASK_LAYERS = [
+    "generals",
+    "cities",
+    "mountains",
+    "neutral_cells",
+    "owned_cells",
+    "opponent_cells",
+    "fog_cells",
+    "structures_in_fog",
+]
+SCALAR_FIELDS = [
+    "owned_land_count",
+    "owned_army_count",
+    "opponent_land_count",
+    "opponent_army_count",
+    "timestep",
+    "priority",
+]
+OBSERVATION_CHANNELS = UNIT_LAYERS + MASK_LAYERS + SCALAR_FIELDS
+# Optional fog memory layers, only present if the game keeps them (see Game(fog_memory=True)).
+MEMORY_LAYERS = [
+    "last_seen_cavalry",
+    "last_seen_infantry",
+    "last_seen_archers",
+    "last_seen_siege",
+    "last_seen_owner",
+    "last_seen_turn",
+]
+# Cells that were never seen, and padding, hold this value in the owner & turn memory layers.
+NEVER_SEEN = -1
+_MEMORY_DTYPES = [np.float32] * 4 + [np.int8, np.int32]
 
-@dataclasses.dataclass
+# Layout of Observation.pack: a header with the grid shape & scalar fields,
+# followed by a (dtype, encoding) header and a payload for every layer.
+_PACK_HEADER = struct.Struct("<HH6q")
+_LAYER_HEADER = struct.Struct("<3sB")
+
+
+class _LayerEncoding(IntEnum):
+    BITS = 0  # bitmap of non-zero cells, all of which are ones
+    SPARSE_UINT8 = 1  # bitmap of non-zero cells followed by their values
+    SPARSE_UINT16 = 2
+    SPARSE_UINT32 = 3
+    SPARSE_NATIVE = 4
+    UNIT_SUM = 5  # sum of the unit type layers, nothing is stored
+    RAW = 6  # the layer bytes as they are
+
+
+_SPARSE_VALUE_DTYPES = {
+    _LayerEncoding.SPARSE_UINT8: np.dtype(np.uint8),
+    _LayerEncoding.SPARSE_UINT16: np.dtype(np.uint16),
+    _LayerEncoding.SPARSE_UINT32: np.dtype(np.uint32),
+}
+
+
+@dataclasses.dataclass(slots=True)
 class Observation(dict):
     """
     We override some dictionary methods and subclass dict to allow the
@@ -13,6 +72,9 @@ class Observation(dict):
     These steps are necessary because PettingZoo & Gymnasium expect
     dictionary-like Observation objects, but we want the benefits of
     knowing the dictionaries' members which a dataclass/class provides.
+
+    The mapping protocol is implemented directly over the fields, so
+    iterating over an observation returns the stored arrays, not copies.
     """
 
     # Unit type arrays
@@ -40,17 +102,118 @@ class Observation(dict):
     timestep: int
     priority: int = 0
 
+    # Fog memory: what the agent saw in every cell the last time it was visible.
+    # The owner is 0 for unowned cells, 1 for the agent's own cells and 2 for the opponent's.
+    last_seen_cavalry: np.ndarray | None = None
+    last_seen_infantry: np.ndarray | None = None
+    last_seen_archers: np.ndarray | None = None
+    last_seen_siege: np.ndarray | None = None
+    last_seen_owner: np.ndarray | None = None
+    last_seen_turn: np.ndarray | None = None
+
+    @classmethod
+    def from_tensor(cls, tensor: np.ndarray) -> "Observation":
+        """
+        Inverse of as_tensor; rebuilds an Observation from a (19, rows, cols) tensor,
+        or from a (25, rows, cols) one holding the fog memory layers as well.
+        """
+        fields = {}
+        if len(tensor) == len(OBSERVATION_CHANNELS) + len(MEMORY_LAYERS):
+            for channel, (name, dtype) in enumerate(
+                zip(MEMORY_LAYERS, _MEMORY_DTYPES), start=len(OBSERVATION_CHANNELS)
+            ):
+                fields[name] = tensor[channel].astype(dtype)
+        for channel, name in enumerate(OBSERVATION_CHANNELS):
+            if name in UNIT_LAYERS:
+                fields[name] = tensor[channel].astype(np.float32)
+            elif name in MASK_LAYERS:
+                fields[name] = tensor[channel] != 0
+            else:
+                fields[name] = int(tensor[channel, 0, 0])
+        return cls(**fields)
+
+    @property
+    def has_fog_memory(self) -> bool:
+        return self.last_seen_turn is not None
+
+    @property
+    def _field_names(self) -> tuple[str, ...]:
+        """Keys of the observation as a mapping, the fog memory layers are only keys if they are kept."""
+        return _FIELD_NAMES if self.has_fog_memory else _BASE_FIELD_NAMES
+
     def __getitem__(self, attribute_name: str):
+        if attribute_name not in self._field_names:
+            raise KeyError(attribute_name)
         return getattr(self, attribute_name)
 
+    def __iter__(self):
+        return iter(self._field_names)
+
+    def __len__(self):
+        return len(self._field_names)
+
+    def __contains__(self, attribute_name):
+        return attribute_name in self._field_names
+
+    def __reduce__(self):
+        # The underlying dict is always empty, so fields are all that needs to be pickled.
+        # Fog memory layers are the last fields, which default to None when they aren't kept.
+        return (self.__class__, tuple(self.values()))
+
+    def get(self, attribute_name: str, default=None):
+        return getattr(self, attribute_name) if attribute_name in self._field_names else default
+
     def keys(self):
-        return dataclasses.asdict(self).keys()
+        return KeysView(self)
 
     def values(self):
-        return dataclasses.asdict(self).values()
+        return ValuesView(self)
 
     def items(self):
-        return dataclasses.asdict(self).items()
+        return ItemsView(self)
+
+    def pack(self) -> bytes:
+        """
+        Returns a compact bytes representation of the observation, suitable for storage & transport.
+
+        Layers are stored as a bitmap of their non-zero cells, followed by the non-zero values in the
+        smallest integer dtype that represents them exactly. Boolean layers are therefore reduced to the
+        bitmap alone. Every encoding is verified, so Observation.unpack restores the layers bit-exactly,
+        including their dtypes. Fog memory layers, if present, are appended after the other layers.
+        """
+        height, width = self.armies.shape
+        scalars = [int(getattr(self, name)) for name in SCALAR_FIELDS]
+        chunks = [_PACK_HEADER.pack(height, width, *scalars)]
+        layer_names = UNIT_LAYERS + MASK_LAYERS + (MEMORY_LAYERS if self.has_fog_memory else [])
+        for name in layer_names:
+            layer = np.ascontiguousarray(getattr(self, name))
+            if name == "armies" and _is_unit_sum(self, layer):
+                encoding, payload = _LayerEncoding.UNIT_SUM, b""
+            else:
+                encoding, payload = _encode_layer(layer)
+            chunks.append(_LAYER_HEADER.pack(layer.dtype.str.encode(), encoding))
+            chunks.append(payload)
+        return b"".join(chunks)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "Observation":
+        """
+        Inverse of pack.
+        """
+        height, width, *scalars = _PACK_HEADER.unpack_from(data)
+        offset = _PACK_HEADER.size
+        fields: dict = dict(zip(SCALAR_FIELDS, scalars))
+        for name in UNIT_LAYERS + MASK_LAYERS + MEMORY_LAYERS:
+            if name in MEMORY_LAYERS and offset == len(data):
+                break
+            dtype, encoding = _LAYER_HEADER.unpack_from(data, offset)
+            offset += _LAYER_HEADER.size
+            if encoding == _LayerEncoding.UNIT_SUM:
+                units = [fields[unit_type] for unit_type in UNIT_LAYERS[:4]]
+                fields[name] = (units[0] + units[1] + units[2] + units[3]).astype(dtype.decode())
+            else:
+                fields[name], offset = _decode_layer(data, offset, np.dtype(dtype.decode()), encoding, (height, width))
+        return cls(**fields)
 
     def pad_observation(self, pad_to: int) -> None:
         """
@@ -86,40 +249,133 @@ class Observation(dict):
         # Special case for mountains which are padded with ones
         self.mountains = np.pad(self.mountains, (h_pad, w_pad), "constant", constant_values=1)
 
-    def as_tensor(self, pad_to: int | None = None) -> np.ndarray:
+        if self.has_fog_memory:
+            for array_name in MEMORY_LAYERS:
+                padding = NEVER_SEEN if array_name in ["last_seen_owner", "last_seen_turn"] else 0
+                setattr(self, array_name, np.pad(getattr(self, array_name), (h_pad, w_pad), constant_values=padding))
+
+    def as_tensor(
+        self,
+        pad_to: int | None = None,
+        out: np.ndarray | None = None,
+        scalar_planes: bool = True,
+        fog_memory: bool = False,
+    ) -> np.ndarray | tuple[np.ndarray, np.ndarray]:
         """
         Returns a 3D tensor of shape (19, rows, cols). Suitable for neural nets.
+
+        Every channel is written exactly once into the output and the observation itself is left unmodified.
+
+        Args:
+            pad_to: If given, rows & cols are padded to this size. Mountains are padded with ones,
+                all other channels with zeros.
+            out: Preallocated array to write the tensor into, it also determines the dtype.
+                A new float32 array is allocated if None.
+            scalar_planes: If True, the scalar fields (counts, timestep & priority) are broadcast to
+                full planes. If False, only the 13 grid channels are written and the scalar fields are
+                returned as a separate vector, i.e. the result is a (tensor, scalars) tuple.
+            fog_memory: If True, the 6 fog memory layers are appended as the last channels of the tensor.
+                Cells outside the map are padded as never seen.
         """
+        height, width = self.armies.shape
         if pad_to is not None:
-            self.pad_observation(pad_to)
-            shape = (pad_to, pad_to)
+            assert pad_to >= max(height, width), "Can't pad to a smaller size than the original observation."
+            rows, cols = pad_to, pad_to
         else:
-            shape = self.armies.shape
-
-        return np.stack(
-            [
-                # Unit type arrays
-                self.cavalry,
-                self.infantry,
-                self.archers,
-                self.siege,
-                # Total armies (for backwards compatibility)
-                self.armies,
-                # Original observation fields
-                self.generals,
-                self.cities,
-                self.mountains,
-                self.neutral_cells,
-                self.owned_cells,
-                self.opponent_cells,
-                self.fog_cells,
-                self.structures_in_fog,
-                np.ones(shape) * self.owned_land_count,
-                np.ones(shape) * self.owned_army_count,
-                np.ones(shape) * self.opponent_land_count,
-                np.ones(shape) * self.opponent_army_count,
-                np.ones(shape) * self.timestep,
-                np.ones(shape) * self.priority,
-            ],
-            axis=0,
-        )
+            rows, cols = height, width
+
+        grid_channels = UNIT_LAYERS + MASK_LAYERS
+        num_channels = len(OBSERVATION_CHANNELS) if scalar_planes else len(grid_channels)
+        if fog_memory:
+            assert self.has_fog_memory, "The observation holds no fog memory."
+            num_channels += len(MEMORY_LAYERS)
+        if out is None:
+            out = np.empty((num_channels, rows, cols), dtype=np.float32)
+        assert out.shape == (num_channels, rows, cols), f"Expected out of shape {(num_channels, rows, cols)}."
+
+        for channel, name in enumerate(grid_channels):
+            out[channel, :height, :width] = getattr(self, name)
+
+        if rows > height or cols > width:
+            out[: len(grid_channels), height:, :] = 0
+            out[: len(grid_channels), :height, width:] = 0
+            mountains = grid_channels.index("mountains")
+            out[mountains, height:, :] = 1
+            out[mountains, :height, width:] = 1
+
+        if fog_memory:
+            first_channel = num_channels - len(MEMORY_LAYERS)
+            for channel, name in enumerate(MEMORY_LAYERS, start=first_channel):
+                out[channel, :height, :width] = getattr(self, name)
+                if rows > height or cols > width:
+                    padding = NEVER_SEEN if name in ["last_seen_owner", "last_seen_turn"] else 0
+                    out[channel, height:, :] = padding
+                    out[channel, :height, width:] = padding
+
+        if not scalar_planes:
+            scalars = np.array([getattr(self, name) for name in SCALAR_FIELDS], dtype=out.dtype)
+            return out, scalars
+
+        for channel, name in enumerate(SCALAR_FIELDS, start=len(grid_channels)):
+            out[channel].fill(getattr(self, name))
+        return out
+
+
+_FIELD_NAMES = tuple(field.name for field in dataclasses.fields(Observation))
+_BASE_FIELD_NAMES = tuple(name for name in _FIELD_NAMES if name not in MEMORY_LAYERS)
+
+
+def _is_unit_sum(observation: Observation, armies: np.ndarray) -> bool:
+    """Whether armies hold exactly the sum of the unit type layers, so that unpack can recompute them."""
+    units = [getattr(observation, unit_type) for unit_type in UNIT_LAYERS[:4]]
+    unit_sum = (units[0] + units[1] + units[2] + units[3]).astype(armies.dtype)
+    return unit_sum.tobytes() == armies.tobytes()
+
+
+def _encode_layer(layer: np.ndarray) -> tuple[_LayerEncoding, bytes]:
+    flat = layer.ravel()
+    nonzero = flat != 0
+    values = flat[nonzero]
+    bitmap = np.packbits(nonzero).tobytes()
+
+    if (values == 1).all():
+        encoding, payload = _LayerEncoding.BITS, bitmap
+    else:
+        encoding, payload = _LayerEncoding.SPARSE_NATIVE, bitmap + values.tobytes()
+        for candidate, value_dtype in _SPARSE_VALUE_DTYPES.items():
+            if values.min() >= 0 and values.max() <= np.iinfo(value_dtype).max:
+                compact_values = values.astype(value_dtype)
+                if np.array_equal(compact_values, values):
+                    encoding, payload = candidate, bitmap + compact_values.tobytes()
+                    break
+
+    # Values like -0.0 or NaN don't survive the encodings above, they are caught here.
+    decoded, _ = _decode_layer(payload, 0, layer.dtype, encoding, layer.shape)
+    if decoded.tobytes() != layer.tobytes():
+        encoding, payload = _LayerEncoding.RAW, layer.tobytes()
+    return encoding, payload
+
+
+def _decode_layer(
+    data: bytes, offset: int, dtype: np.dtype, encoding: int, shape: tuple[int, int]
+) -> tuple[np.ndarray, int]:
+    """Decodes a layer stored at offset, returns it together with the offset right after it."""
+    size = shape[0] * shape[1]
+    if encoding == _LayerEncoding.RAW:
+        layer = np.frombuffer(data, dtype=dtype, count=size, offset=offset).reshape(shape).copy()
+        return layer, offset + layer.nbytes
+
+    bitmap_size = (size + 7) // 8
+    nonzero = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=bitmap_size, offset=offset), count=size)
+    nonzero = nonzero.astype(bool)
+    offset += bitmap_size
+
+    layer = np.zeros(size, dtype=dtype)
+    if encoding == _LayerEncoding.BITS:
+        layer[nonzero] = 1
+    else:
+        value_dtype = _SPARSE_VALUE_DTYPES.get(encoding, dtype)
+        values = np.frombuffer(data, dtype=value_dtype, count=int(nonzero.sum()), offset=offset)
+        layer[nonzero] = values
+        offset += values.nbytes
+    return layer.reshape(shape), offset
@@ -1,7 +1,20 @@
 import abc
 
+import numpy as np
+
 from generals.core.action import Action, compute_valid_move_mask
-from generals.core.observation import Observation
+from generals.core.channels import UNIT_TYPES
+from generals.core.config import DIRECTIONS
+from generals.core.grid import Grid
+from generals.core.observation import OBSERVATION_CHANNELS, Observation
+
+# Channel indices into stacked observation tensors, see Observation.as_tensor.
+GENERALS = OBSERVATION_CHANNELS.index("generals")
+CITIES = OBSERVATION_CHANNELS.index("cities")
+MOUNTAINS = OBSERVATION_CHANNELS.index("mountains")
+OWNED_CELLS = OBSERVATION_CHANNELS.index("owned_cells")
+OWNED_LAND_COUNT = OBSERVATION_CHANNELS.index("owned_land_count")
+OWNED_ARMY_COUNT = OBSERVATION_CHANNELS.index("owned_army_count")
 
 
 def compute_num_cities_owned(observation: Observation) -> int:
@@ -18,18 +31,66 @@ def compute_num_generals_owned(observation: Observation) -> int:
 
 def is_action_valid(action: Action, observation: Observation) -> bool:
     valid_move_mask = compute_valid_move_mask(observation)
-    row, col, direction = action[1], action[2], action[3]
+    row, col, direction, unit_type_idx = action[1], action[2], action[3], action[4]
 
     # The actions' row & col may be out of bounds depending on
     # the agents implementation.
     if row >= valid_move_mask.shape[0] or col >= valid_move_mask.shape[1]:
         return False
 
-    is_action_valid = valid_move_mask[row][col][direction]
+    is_action_valid = valid_move_mask[row][col][direction][unit_type_idx]
 
     return is_action_valid
 
 
+def compute_num_cities_owned_batch(tensor: np.ndarray) -> np.ndarray:
+    """Batched compute_num_cities_owned over stacked (N, C, H, W) observation tensors."""
+    owned_cities_mask = (tensor[:, CITIES] != 0) & (tensor[:, OWNED_CELLS] != 0)
+    return owned_cities_mask.sum(axis=(1, 2))
+
+
+def compute_num_generals_owned_batch(tensor: np.ndarray) -> np.ndarray:
+    """Batched compute_num_generals_owned over stacked (N, C, H, W) observation tensors."""
+    owned_generals_mask = (tensor[:, GENERALS] != 0) & (tensor[:, OWNED_CELLS] != 0)
+    return owned_generals_mask.sum(axis=(1, 2))
+
+
+def is_action_valid_batch(actions: np.ndarray, tensor: np.ndarray) -> np.ndarray:
+    """
+    Batched is_action_valid. Instead of building the full valid move mask for every observation,
+    only the source and destination cells of each action are looked up.
+
+    Args:
+        actions: Stacked actions of shape (N, 6).
+        tensor: Stacked observation tensors of shape (N, C, H, W).
+
+    Returns:
+        np.ndarray: Boolean array of shape (N,).
+    """
+    batch_size, _, height, width = tensor.shape
+    batch = np.arange(batch_size)
+    rows, cols = actions[:, 1].astype(np.int64), actions[:, 2].astype(np.int64)
+    directions, unit_types = actions[:, 3].astype(np.int64), actions[:, 4].astype(np.int64)
+
+    offsets = np.array([direction.value for direction in DIRECTIONS])[np.clip(directions, 0, len(DIRECTIONS) - 1)]
+    dest_rows, dest_cols = rows + offsets[:, 0], cols + offsets[:, 1]
+
+    is_valid = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    is_valid &= (dest_rows >= 0) & (dest_rows < height) & (dest_cols >= 0) & (dest_cols < width)
+    is_valid &= (directions >= 0) & (directions < len(DIRECTIONS)) & (unit_types >= 0) & (unit_types < len(UNIT_TYPES))
+
+    # Out-of-range actions were already invalidated, clip them so that the lookups below are safe.
+    rows, cols = np.clip(rows, 0, height - 1), np.clip(cols, 0, width - 1)
+    dest_rows, dest_cols = np.clip(dest_rows, 0, height - 1), np.clip(dest_cols, 0, width - 1)
+    unit_types = np.clip(unit_types, 0, len(UNIT_TYPES) - 1)
+
+    # Unit type channels come first in the tensor, in the order of their indices.
+    is_valid &= tensor[batch, OWNED_CELLS, rows, cols] != 0
+    is_valid &= tensor[batch, unit_types, rows, cols] > 1.0
+    is_valid &= tensor[batch, MOUNTAINS, dest_rows, dest_cols] == 0
+    return is_valid
+
+
 class RewardFn(abc.ABC):
     @abc.abstractmethod
     def __call__(self, prior_obs: Observation, prior_action: Action, obs: Observation) -> float:
@@ -57,6 +118,50 @@ class RewardFn(abc.ABC):
             reward: The reward provided at time-step t.
         """
 
+    def reset(self, grid: Grid) -> None:
+        """
+        Called by the environments whenever a new game starts, with the grid it is played on.
+        Reward functions that depend on the map can use it to precompute what they need.
+        """
+
+    def batch(self, prior_tensor: np.ndarray, actions: np.ndarray, tensor: np.ndarray) -> np.ndarray:
+        """
+        Computes rewards of many transitions at once, e.g. when stepping many games.
+
+        The default implementation rebuilds the observations and calls the reward function on each
+        transition, so every RewardFn supports it. Built-in reward functions override it with
+        vectorized implementations.
+
+        Args:
+            prior_tensor: Stacked prior observations of shape (N, C, H, W), as given by Observation.as_tensor.
+            actions: Stacked prior actions of shape (N, 6).
+            tensor: Stacked current observations of shape (N, C, H, W).
+
+        Returns:
+            rewards: float32 array of shape (N,).
+        """
+        actions = np.asarray(actions)
+        rewards = np.empty(len(actions), dtype=np.float32)
+        for i in range(len(actions)):
+            rewards[i] = self(
+                prior_obs=Observation.from_tensor(prior_tensor[i]),
+                prior_action=actions[i].view(Action),
+                obs=Observation.from_tensor(tensor[i]),
+            )
+        return rewards
+
+    @property
+    def vectorized(self) -> bool:
+        """
+        Whether batch is a vectorized implementation of __call__, i.e. both are defined by the same class.
+        Subclasses overriding only __call__ of a built-in reward function fall back to calling it per transition.
+        """
+
+        def owner(name: str) -> type:
+            return next(cls for cls in type(self).__mro__ if name in vars(cls))
+
+        return owner("batch") is not RewardFn and owner("batch") is owner("__call__")
+
 
 class WinLoseRewardFn(RewardFn):
     """A simple reward function. +1 if the agent wins. -1 if they lose."""
@@ -65,6 +170,12 @@ class WinLoseRewardFn(RewardFn):
         change_in_num_generals_owned = compute_num_generals_owned(obs) - compute_num_generals_owned(prior_obs)
         return float(1 * change_in_num_generals_owned)
 
+    def batch(self, prior_tensor: np.ndarray, actions: np.ndarray, tensor: np.ndarray) -> np.ndarray:
+        change_in_num_generals_owned = compute_num_generals_owned_batch(tensor) - compute_num_generals_owned_batch(
+            prior_tensor
+        )
+        return change_in_num_generals_owned.astype(np.float32)
+
 
 class FrequentAssetRewardFn(RewardFn):
     """This reward function is fairly frequent -- every action/turn should generate some kind of reward. And
@@ -89,6 +200,27 @@ class FrequentAssetRewardFn(RewardFn):
 
         return reward
 
+    def batch(self, prior_tensor: np.ndarray, actions: np.ndarray, tensor: np.ndarray) -> np.ndarray:
+        change_in_army_size = tensor[:, OWNED_ARMY_COUNT, 0, 0] - prior_tensor[:, OWNED_ARMY_COUNT, 0, 0]
+        change_in_land_owned = tensor[:, OWNED_LAND_COUNT, 0, 0] - prior_tensor[:, OWNED_LAND_COUNT, 0, 0]
+        change_in_num_cities_owned = compute_num_cities_owned_batch(tensor) - compute_num_cities_owned_batch(
+            prior_tensor
+        )
+        change_in_num_generals_owned = compute_num_generals_owned_batch(tensor) - compute_num_generals_owned_batch(
+            prior_tensor
+        )
+        valid_action_reward = np.where(is_action_valid_batch(np.asarray(actions), prior_tensor), 1, -5)
+
+        reward = (
+            valid_action_reward
+            + 1 * change_in_army_size
+            + 5 * change_in_land_owned
+            + 10 * change_in_num_cities_owned
+            + 10_000 * change_in_num_generals_owned
+        )
+
+        return reward.astype(np.float32)
+
 
 class LandRewardFn(RewardFn):
     """A reward function focused on gaining territory. Provides positive reward for gaining land tiles."""
@@ -96,3 +228,79 @@ class LandRewardFn(RewardFn):
     def __call__(self, prior_obs: Observation, prior_action: Action, obs: Observation) -> float:
         change_in_land_owned = obs.owned_land_count - prior_obs.owned_land_count
         return float(change_in_land_owned)
+
+    def batch(self, prior_tensor: np.ndarray, actions: np.ndarray, tensor: np.ndarray) -> np.ndarray:
+        change_in_land_owned = tensor[:, OWNED_LAND_COUNT, 0, 0] - prior_tensor[:, OWNED_LAND_COUNT, 0, 0]
+        return change_in_land_owned.astype(np.float32)
+
+
+class DistanceShapingRewardFn(RewardFn):
+    """
+    A potential-based shaping reward, r = gamma * potential(obs) - potential(prior_obs), where the potential
+    is the negative weighted distance of the agent's land to the enemy general and to the nearest city.
+
+    Distances are shortest paths over passable cells. The distance fields are computed once per map,
+    when the reward function is reset with a grid, and cached by the grid. Each step then only looks
+    up the distances of the owned cells.
+    """
+
+    def __init__(
+        self, general_weight: float = 1.0, city_weight: float = 0.5, gamma: float = 0.99, cache_size: int = 128
+    ):
+        """
+        Args:
+            general_weight: Weight of the distance to the enemy general.
+            city_weight: Weight of the distance to the nearest city.
+            gamma: Discount factor, should match the one used by the learning algorithm.
+            cache_size: Maximum number of grids whose distance fields are kept in memory.
+        """
+        self.general_weight = general_weight
+        self.city_weight = city_weight
+        self.gamma = gamma
+        self.cache_size = cache_size
+
+        self._distance_fields: dict[Grid, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._current_fields: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+
+    def reset(self, grid: Grid) -> None:
+        if grid not in self._distance_fields:
+            if len(self._distance_fields) >= self.cache_size:
+                # Dictionaries keep insertion order, so this evicts the oldest grid.
+                del self._distance_fields[next(iter(self._distance_fields))]
+            self._distance_fields[grid] = self._compute_distance_fields(grid)
+        self._current_fields = self._distance_fields[grid]
+
+    @staticmethod
+    def _compute_distance_fields(grid: Grid) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns general positions, distances from each general and distances from the nearest city,
+        from the distance fields of the grid. Distances are normalized by the number of cells,
+        unreachable cells are set to 1.
+        """
+        size = grid.shape[0] * grid.shape[1]
+        general_distances = np.where(grid.general_distances == -1, size, grid.general_distances)
+        city_distances = np.where(grid.city_distances == -1, size, grid.city_distances).min(axis=0, initial=size)
+        general_positions = grid.static_layers.general_positions
+        return general_positions, general_distances.astype(np.float32) / size, city_distances.astype(np.float32) / size
+
+    def potential(self, obs: Observation) -> float:
+        assert self._current_fields is not None, "DistanceShapingRewardFn has to be reset with a grid first."
+        general_positions, general_distances, city_distances = self._current_fields
+        height, width = city_distances.shape
+        # Observations may be padded, the map occupies the top-left corner.
+        owned_cells = obs.owned_cells[:height, :width]
+
+        owned_generals = owned_cells[general_positions[:, 0], general_positions[:, 1]]
+        if not owned_generals.any():
+            # The agent lost its general, this is the worst possible potential.
+            return -(self.general_weight + self.city_weight)
+
+        # Distances are only gathered at the owned cells, instead of reducing over the whole grid
+        owned = np.flatnonzero(owned_cells)
+        enemy_general = 1 if owned_generals[0] else 0
+        distance_to_general = general_distances[enemy_general].ravel()[owned].min()
+        distance_to_city = city_distances.ravel()[owned].min()
+        return -float(self.general_weight * distance_to_general + self.city_weight * distance_to_city)
+
+    def __call__(self, prior_obs: Observation, prior_action: Action, obs: Observation) -> float:
+        return self.gamma * self.potential(obs) - self.potential(prior_obs)
@@ -1,8 +1,16 @@
 #  type: ignore
+from generals.envs.episode_statistics import EpisodeStatistics
 from generals.envs.gymnasium_generals import GymnasiumGenerals
+from generals.envs.gymnasium_generals_vector import GymnasiumGeneralsVector
 from generals.envs.pettingzoo_generals import PettingZooGenerals
+from generals.envs.shared_memory_vector_env import SharedMemoryVectorEnv
+from generals.envs.threaded_vector_env import ThreadedVectorEnv
 
 __all__ = [
+    "EpisodeStatistics",
     "PettingZooGenerals",
     "GymnasiumGenerals",
+    "GymnasiumGeneralsVector",
+    "SharedMemoryVectorEnv",
+    "ThreadedVectorEnv",
 ]
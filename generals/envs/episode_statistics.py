@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class EpisodeStatistics:
+    """
+    Length, return of every agent and winner of completed episodes, accumulated in numpy arrays
+    until they are drained, e.g. once per logging interval. The arrays grow as needed.
+    """
+
+    def __init__(self, num_agents: int, capacity: int = 1024):
+        self.num_agents = num_agents
+        self.lengths = np.zeros(capacity, dtype=np.int64)
+        self.returns = np.zeros((capacity, num_agents), dtype=np.float32)
+        # Index of the winning agent, -1 if the episode was truncated
+        self.winners = np.zeros(capacity, dtype=np.int8)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, lengths: np.ndarray, returns: np.ndarray, winners: np.ndarray) -> None:
+        """Adds episodes with lengths & winners of shape (n,) and returns of shape (n, num_agents)."""
+        n = len(lengths)
+        if self.count + n > len(self.lengths):
+            capacity = max(2 * len(self.lengths), self.count + n)
+            for name in ["lengths", "returns", "winners"]:
+                array = getattr(self, name)
+                grown = np.zeros((capacity, *array.shape[1:]), dtype=array.dtype)
+                grown[: self.count] = array[: self.count]
+                setattr(self, name, grown)
+        self.lengths[self.count : self.count + n] = lengths
+        self.returns[self.count : self.count + n] = returns
+        self.winners[self.count : self.count + n] = winners
+        self.count += n
+
+    def drain(self) -> dict[str, np.ndarray]:
+        """Returns copies of the statistics of all episodes completed since the last drain, and forgets them."""
+        statistics = {
+            "length": self.lengths[: self.count].copy(),
+            "return": self.returns[: self.count].copy(),
+            "winner": self.winners[: self.count].copy(),
+        }
+        self.count = 0
+        return statistics
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class FrameStack:
+    """
+    The last num_frames frames of several stacks (e.g. one per agent), kept in a preallocated ring buffer.
+
+    The buffer holds every frame twice, at positions i and i + num_frames, so the last num_frames frames
+    are always a contiguous slice of it. Stacking is therefore a view; pushing a new frame writes only
+    that frame and never moves older ones.
+    """
+
+    def __init__(self, num_frames: int, frame_shape: tuple[int, ...], num_stacks: int = 1, dtype=np.float32):
+        assert num_frames >= 1, "At least one frame has to be stacked."
+        self.num_frames = num_frames
+        self.frame_shape = tuple(frame_shape)
+        self.buffer = np.zeros((num_stacks, 2 * num_frames, *self.frame_shape), dtype=dtype)
+        self.position = 0
+
+    def reset(self, frames: np.ndarray) -> np.ndarray:
+        """Fills the whole history with frames of shape (num_stacks, *frame_shape) and returns the stack."""
+        self.buffer[:] = frames[:, None]
+        self.position = 0
+        return self.stacked()
+
+    def push(self, frames: np.ndarray) -> np.ndarray:
+        """Adds frames of shape (num_stacks, *frame_shape) as the newest ones and returns the stack."""
+        self.position = (self.position + 1) % self.num_frames
+        self.buffer[:, self.position] = frames
+        self.buffer[:, self.position + self.num_frames] = frames
+        return self.stacked()
+
+    def stacked(self) -> np.ndarray:
+        """
+        Returns a view of shape (num_stacks, num_frames * frame_shape[0], *frame_shape[1:]), i.e. frames
+        are concatenated along their first axis, oldest first. The view is only valid until the next push or reset.
+        """
+        start = self.position + 1
+        frames = self.buffer[:, start : start + self.num_frames]
+        return frames.reshape(len(self.buffer), -1, *self.frame_shape[1:])
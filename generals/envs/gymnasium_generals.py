@@ -1,17 +1,19 @@
 from copy import deepcopy
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Literal
 
 import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
 
-from generals.core.action import Action, compute_valid_move_mask
+from generals.core.action import Action, compute_valid_move_mask_batch
 from generals.core.game import Game
 from generals.core.grid import Grid, GridFactory
-from generals.core.observation import Observation
+from generals.core.observation import MASK_LAYERS, OBSERVATION_CHANNELS, UNIT_LAYERS, Observation
 from generals.core.replay import Replay
 from generals.core.rewards import RewardFn, WinLoseRewardFn
+from generals.envs.episode_statistics import EpisodeStatistics
+from generals.envs.frame_stack import FrameStack
 from generals.gui import GUI
 from generals.gui.properties import GuiMode
 
@@ -43,15 +45,32 @@ class GymnasiumGenerals(gym.Env):
         truncation: int | None = None,
         reward_fn: RewardFn | None = None,
         render_mode: str | None = None,
+        observation_window: int | None = None,
+        window_center: Literal["general", "centroid"] = "general",
+        minimap_size: int | None = None,
+        frame_stack: int | None = None,
+        autoreset: bool = False,
     ):
         """Initialize the Generals environment.
 
         Args:
             agents: List of agent identifiers
             grid_factory: Factory for generating game grids
+            pad_observations_to: Size observations are padded to
             truncation: Maximum number of steps before truncation
             reward_fn: Function for computing rewards
             render_mode: Visualization mode ('human' or None)
+            observation_window: If set, observations are observation_window x observation_window crops
+                around each agent instead of the padded map (see Game.egocentric_observation). Actions and
+                masks are then relative to the crop, whose top-left map cell is in infos["window_origin"].
+            window_center: Whether crops are centered on the agent's "general" or its army "centroid".
+            minimap_size: If set, infos["minimap"] holds a downsampled view of the whole map (see Game.minimap).
+            frame_stack: If set, observations hold the last frame_stack observations of each agent, concatenated
+                along the channel axis, oldest first. They are views of a ring buffer, valid until the next step.
+            autoreset: If True, a new game is started as soon as one ends, in the same step. The returned
+                observations & infos are then those of the new game, and those of the last step of the finished
+                game are in infos["final_obs"] & infos["final_info"]. Combine with a GridPool as grid_factory
+                to start new games on pregenerated maps.
         """
         # Initialize basic parameters
         self.render_mode = render_mode
@@ -60,6 +79,12 @@ class GymnasiumGenerals(gym.Env):
         self.agents = agents
         self.truncation = truncation
         self.pad_observations_to = pad_observations_to
+        self.observation_window = observation_window
+        self.window_center = window_center
+        self.minimap_size = minimap_size
+        self.window_origins: dict[str, np.ndarray] = {}
+        self.frame_stack = frame_stack
+        self.autoreset = autoreset
 
         # Initialize agent-specific data
         self.agent_data = self._setup_agent_data()
@@ -73,65 +98,173 @@ class GymnasiumGenerals(gym.Env):
         self.observation_space = self._create_observation_space()
         self.action_space = self._create_action_space()
 
+        # Preallocated frame history, only used with frame_stack
+        dim = self.observation_dim
+        frame_shape = (len(OBSERVATION_CHANNELS), dim, dim)
+        if self.frame_stack is not None:
+            self.frames = FrameStack(self.frame_stack, frame_shape, num_stacks=len(self.agents))
+            self._newest_frames = np.empty((len(self.agents), *frame_shape), dtype=np.float32)
+
+        # Tensors of the newest observations, shared by masks & rewards. Rewards are computed from the
+        # tensors with a single RewardFn.batch call if it is vectorized, except on egocentric crops.
+        self._tensors = np.zeros((len(self.agents), *frame_shape), dtype=np.float32)
+        self._batched_rewards = self.reward_fn.vectorized and observation_window is None
+        self._prior_tensors = np.zeros_like(self._tensors) if self._batched_rewards else None
+        self._infos = self._allocate_infos()
+
+        # Statistics of completed episodes, drained with episode_statistics.drain()
+        self.episode_statistics = EpisodeStatistics(len(self.agents))
+        self._episode_length = 0
+        self._episode_returns = np.zeros(len(self.agents), dtype=np.float32)
+        # Whether the current episode already ended, without autoreset games may be stepped past their end
+        self._episode_recorded = False
+
     def _setup_agent_data(self) -> dict[str, dict[str, Any]]:
         """Set up initial data for each agent."""
         colors = [(255, 107, 108), (0, 130, 255)]
         return {id: {"color": color} for id, color in zip(self.agents, colors)}
 
+    @property
+    def observation_dim(self) -> int:
+        """Height & width of the observations and masks."""
+        return self.observation_window or self.pad_observations_to
+
+    @property
+    def grid(self) -> Grid:
+        """
+        The grid of the current game. Its distance fields, neighbour table and all-pairs distances
+        (see Grid) are computed once per map, e.g. for agents or reward shaping that plan paths.
+        Note that they reveal the whole map, including the cells agents can't see.
+        """
+        return self.game.grid
+
     def _create_observation_space(self) -> spaces.Space:
         """Create the observation space based on grid dimensions."""
-        dim = self.pad_observations_to
-        return spaces.Box(low=0, high=2**31 - 1, shape=(2, 15, dim, dim), dtype=np.float32)
+        dim = self.observation_dim
+        channels = len(OBSERVATION_CHANNELS) * (self.frame_stack or 1)
+        return spaces.Box(low=0, high=2**31 - 1, shape=(2, channels, dim, dim), dtype=np.float32)
 
     def _create_action_space(self) -> spaces.Space:
         """Create the action space based on grid dimensions."""
-        dim = self.pad_observations_to
-        return spaces.MultiDiscrete([2, dim, dim, 4, 2])
+        dim = self.observation_dim
+        return spaces.MultiDiscrete([2, dim, dim, 4, 4, 2])
 
-    def _process_observations(self, observations: dict[str, Observation]) -> np.ndarray:
-        """Process raw observations into the required tensor format."""
-        processed_obs = []
-        for agent in self.agents:
-            observations[agent].pad_observation(pad_to=self.pad_observations_to)
-            processed_obs.append(observations[agent].as_tensor())
-        return np.stack(processed_obs)
+    def _process_observations(self, observations: dict[str, Observation], reset: bool = False) -> np.ndarray:
+        """Process raw observations into the required tensor format, stacking them with the previous ones if needed."""
+        if self.frame_stack is None:
+            processed_obs = np.empty(self.observation_space.shape, dtype=np.float32)
+        else:
+            processed_obs = self._newest_frames
+        for i, agent in enumerate(self.agents):
+            observations[agent].as_tensor(pad_to=self.observation_dim, out=processed_obs[i])
+        self._tensors[:] = processed_obs
 
-    def _process_infos(
-        self, observations: dict[str, Observation], game_infos: dict[str, Any], rewards: dict[str, float]
-    ) -> dict[str, dict[str, np.ndarray]]:
-        """Process game information into a structured format with numpy arrays.
+        if self.frame_stack is None:
+            return processed_obs
+        # The first observation of an episode fills the whole history
+        return self.frames.reset(processed_obs) if reset else self.frames.push(processed_obs)
+
+    def _allocate_infos(self) -> dict[str, dict[str, np.ndarray]]:
+        """Allocates the infos of all agents, which are overwritten in place by every step.
 
         Returns a dictionary for each agent containing:
             - army: int32 numpy array
             - land: int32 numpy array
             - done: boolean numpy array
             - winner: boolean numpy array
-            - valid_moves: boolean numpy array of shape (24, 24, 4)
+            - masks: boolean numpy array of shape (dim, dim, 4, 4)
             - reward: float32 numpy array
+            - window_origin: int numpy array of shape (2,), if observation_window is set
+            - minimap: float32 numpy array of shape (13, minimap_size, minimap_size), if minimap_size is set
         """
-        return {
-            agent: {
-                "army": np.array(game_infos[agent]["army"], dtype=np.int32),
-                "land": np.array(game_infos[agent]["land"], dtype=np.int32),
-                "done": np.array(game_infos[agent]["is_done"], dtype=bool),
-                "winner": np.array(game_infos[agent]["is_winner"], dtype=bool),
-                "masks": compute_valid_move_mask(observations[agent]),
-                "reward": np.array(rewards[agent], dtype=np.float32),
+        dim = self.observation_dim
+        infos = {}
+        for agent in self.agents:
+            infos[agent] = {
+                "army": np.zeros((), dtype=np.int32),
+                "land": np.zeros((), dtype=np.int32),
+                "done": np.zeros((), dtype=bool),
+                "winner": np.zeros((), dtype=bool),
+                "masks": np.zeros((dim, dim, 4, 4), dtype=bool),
+                "reward": np.zeros((), dtype=np.float32),
             }
-            for agent in self.agents
-        }
+            if self.observation_window is not None:
+                infos[agent]["window_origin"] = np.zeros(2, dtype=int)
+            if self.minimap_size is not None:
+                size = self.minimap_size
+                infos[agent]["minimap"] = np.zeros((len(UNIT_LAYERS + MASK_LAYERS), size, size), dtype=np.float32)
+        return infos
+
+    def _write_infos(
+        self, observations: dict[str, Observation], game_infos: dict[str, Any], rewards: np.ndarray
+    ) -> dict[str, dict[str, np.ndarray]]:
+        """
+        Writes infos of the current step into the preallocated infos, see _allocate_infos for the keys.
+        The per-agent arrays are reused across steps, the dict holding them is not.
+        Observations are the agents' observations of the whole map, from which minimaps are computed.
+        """
+        # Masks of both agents at once, from the tensors of their observations
+        masks = compute_valid_move_mask_batch(self._tensors)
+        for i, agent in enumerate(self.agents):
+            infos = self._infos[agent]
+            infos["army"][...] = game_infos[agent]["army"]
+            infos["land"][...] = game_infos[agent]["land"]
+            infos["done"][...] = game_infos[agent]["is_done"]
+            infos["winner"][...] = game_infos[agent]["is_winner"]
+            infos["masks"][:] = masks[i]
+            infos["reward"][...] = rewards[i]
+            if self.observation_window is not None:
+                infos["window_origin"][:] = self.window_origins[agent]
+            if self.minimap_size is not None:
+                infos["minimap"][:] = self.game.minimap(agent, self.minimap_size, observations[agent])
+        # A fresh outer dict, wrappers add their own keys to it
+        return {agent: self._infos[agent] for agent in self.agents}
+
+    def _agent_views(self, observations: dict[str, Observation]) -> dict[str, Observation]:
+        """Returns the observations agents actually receive, i.e. egocentric crops if observation_window is set."""
+        if self.observation_window is None:
+            return observations
+        views = {}
+        for agent in self.agents:
+            self.window_origins[agent] = self.game.window_origin(agent, self.observation_window, self.window_center)
+            views[agent] = self.game.egocentric_observation(agent, self.observation_window, self.window_center)
+        return views
 
-    def _compute_rewards(self, actions: dict[str, Action], observations: dict[str, Observation]) -> list[float]:
+    def _to_map_coordinates(self, agent: str, action: Action) -> Action:
+        """
+        Translates actions relative to the observation window into map coordinates. Windows extend past the
+        edges of the map, actions from cells outside of it are passes.
+        """
+        if self.observation_window is None:
+            return action
+        action = np.array(action)
+        action[1:3] += self.window_origins[agent]
+        height, width = self.game.grid_dims
+        if not (0 <= action[1] < height and 0 <= action[2] < width):
+            action[0] = 1
+        return action
+
+    def _compute_rewards(self, actions: dict[str, Action], observations: dict[str, Observation]) -> np.ndarray:
         """Compute rewards for all agents based on their actions and observations."""
+        if self._batched_rewards:
+            assert self._prior_tensors is not None
+            stacked_actions = np.stack([np.asarray(actions[agent]) for agent in self.agents])
+            rewards = self.reward_fn.batch(self._prior_tensors, stacked_actions, self._tensors)
+            self._prior_tensors[:] = self._tensors
+            return rewards
+
         assert self.prior_observations is not None, "Prior observations should always be legit."
-        return {
-            agent: self.reward_fn(
-                prior_obs=self.prior_observations[agent],
-                prior_action=actions[agent],
-                obs=observations[agent],
-            )
-            for agent in self.agents
-        }
+        return np.array(
+            [
+                self.reward_fn(
+                    prior_obs=self.prior_observations[agent],
+                    prior_action=actions[agent],
+                    obs=observations[agent],
+                )
+                for agent in self.agents
+            ],
+            dtype=np.float32,
+        )
 
     def reset(
         self, seed: int | None = None, options: dict[str, Any] | None = None
@@ -147,11 +280,12 @@ class GymnasiumGenerals(gym.Env):
             self.grid_factory.set_rng(rng=self.np_random)
             grid = self.grid_factory.generate()
 
-        # Create new game instance
-        self.game = Game(grid, self.agents)
+        # Start a new game in the arrays of the previous one
+        self.game.reset(grid)
+        self.reward_fn.reset(grid)
 
-        # Setup visualization if needed
-        if self.render_mode == "human":
+        # Setup visualization if needed, the GUI is kept while it shows the game on a map of the same size
+        if self.render_mode == "human" and not (hasattr(self, "gui") and self.gui.can_render(self.game)):
             self.gui = GUI(self.game, self.agent_data, GuiMode.TRAIN)
 
         # Handle replay functionality
@@ -167,28 +301,33 @@ class GymnasiumGenerals(gym.Env):
 
         # Get and process observations
         raw_obs = {agent: self.game.agent_observation(agent) for agent in self.agents}
-        observations = self._process_observations(raw_obs)
+        agent_views = self._agent_views(raw_obs)
+        observations = self._process_observations(agent_views, reset=True)
         self.prior_observations = raw_obs
-        _infos = self.game.get_infos()
-        _dummy_rewards = {agent: 0 for agent in self.agents}
-        infos = self._process_infos(raw_obs, _infos, _dummy_rewards)
+        if self._prior_tensors is not None:
+            self._prior_tensors[:] = self._tensors
+        infos = self._write_infos(raw_obs, self.game.get_infos(), np.zeros(len(self.agents), dtype=np.float32))
+        self._episode_length = 0
+        self._episode_returns[:] = 0
+        self._episode_recorded = False
 
         return observations, infos
 
     def step(self, actions: list[Action]) -> tuple[np.ndarray, float, bool, bool, dict[str, Any]]:
         """Execute one time step within the environment."""
         # Convert actions list to dictionary
-        action_dict = {self.agents[i]: action for i, action in enumerate(actions)}
+        action_dict = {agent: self._to_map_coordinates(agent, action) for agent, action in zip(self.agents, actions)}
 
         # Execute game step
         observations, infos = self.game.step(action_dict)
 
-        # Process observations and info
+        # Process observations and info, each computed once and shared by rewards & infos
         # Note: rewards are returned in dict, because Gymnasium doesnt support multi-agent rewards
         # Rewards are index 5 in the info dict
+        agent_views = self._agent_views(observations)
+        processed_obs = self._process_observations(agent_views)
         _rewards = self._compute_rewards(action_dict, observations)
-        processed_obs = self._process_observations(observations)
-        processed_infos = self._process_infos(observations, infos, _rewards)
+        processed_infos = self._write_infos(observations, infos, _rewards)
 
         # Check termination conditions
         terminated = self.game.is_done()
@@ -202,8 +341,29 @@ class GymnasiumGenerals(gym.Env):
 
         self.prior_observations = {agent: observations[agent] for agent in self.agents}
 
+        if not self._episode_recorded:
+            self._episode_length += 1
+            self._episode_returns += _rewards
+            if terminated or truncated:
+                self._record_episode()
+        if (terminated or truncated) and self.autoreset:
+            final_obs = processed_obs.copy()
+            final_info = {
+                agent: {key: value.copy() for key, value in processed_infos[agent].items()} for agent in self.agents
+            }
+            processed_obs, processed_infos = self.reset()
+            processed_infos = {**processed_infos, "final_obs": final_obs, "final_info": final_info}
+
         return processed_obs, 0, terminated, truncated, processed_infos
 
+    def _record_episode(self) -> None:
+        """Adds the finished episode to the episode statistics, once, on the step it ends."""
+        winner = self.agents.index(self.game.winner) if self.game.winner is not None else -1
+        self.episode_statistics.add([self._episode_length], self._episode_returns[None], [winner])
+        self._episode_length = 0
+        self._episode_returns[:] = 0
+        self._episode_recorded = True
+
     def render(self) -> None:
         """Render the game state."""
         if self.render_mode == "human":
@@ -211,5 +371,6 @@ class GymnasiumGenerals(gym.Env):
 
     def close(self) -> None:
         """Clean up resources."""
-        if self.render_mode == "human":
+        if self.render_mode == "human" and hasattr(self, "gui"):
             self.gui.close()
+            del self.gui
@@ -0,0 +1,265 @@
+from typing import Any
+
+import numpy as np
+from gymnasium import spaces
+from gymnasium.utils import seeding
+from gymnasium.vector import AutoresetMode, VectorEnv
+from gymnasium.vector.utils import batch_space
+
+from generals.core.action import Action, compute_valid_move_mask_batch
+from generals.core.game import Game
+from generals.core.grid import Grid, GridFactory
+from generals.core.observation import OBSERVATION_CHANNELS, Observation
+from generals.core.rewards import RewardFn, WinLoseRewardFn
+from generals.envs.episode_statistics import EpisodeStatistics
+
+INFO_KEYS = ["army", "land", "done", "winner", "masks", "reward"]
+
+
+class GymnasiumGeneralsVector(VectorEnv):
+    """
+    Runs num_envs games of GymnasiumGenerals at once, as a Gymnasium VectorEnv.
+
+    Results of all games are written into arrays that are allocated once and returned on every call,
+    i.e. observations of shape (num_envs, 2, C, pad, pad) and infos[agent][key] with a leading num_envs axis
+    (see GymnasiumGenerals._allocate_infos for the keys). They are overwritten by the next step or reset,
+    so copy them if you need to keep them.
+
+    Like GymnasiumGenerals, the returned rewards are zero and rewards of the agents are in infos[agent]["reward"].
+    If reward_fn implements a vectorized RewardFn.batch, rewards of all games are computed in one call,
+    and games are stepped by the numba kernels of Game.advance without building Observations at all
+    (prior_observations are then only updated on resets). Otherwise, the reward function is reset with
+    the grid of each game before its rewards are computed, so reward functions depending on the map should
+    cache what they need per grid. Either way, games are stepped one after the other.
+
+    Length, returns and winner of every completed episode are accumulated in episode_statistics.
+    With the "SameStep" autoreset mode and a GridPool as grid_factory, finished games immediately
+    start over on one of the pool's pregenerated maps.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        agents: list[str],
+        grid_factory: GridFactory | None = None,
+        pad_observations_to: int = 24,
+        truncation: int | None = None,
+        reward_fn: RewardFn | None = None,
+        autoreset_mode: str | AutoresetMode = AutoresetMode.NEXT_STEP,
+    ):
+        """
+        Args:
+            num_envs: Number of games played at once.
+            agents: List of agent identifiers.
+            grid_factory: Factory for generating game grids, shared by all games.
+            pad_observations_to: Size observations & masks are padded to.
+            truncation: Maximum number of steps before truncation.
+            reward_fn: Function for computing rewards.
+            autoreset_mode: How finished games are reset, see https://farama.org/Vector-Autoreset-Mode.
+                With "SameStep", observations & infos of the last step are in infos["final_obs"] & infos["final_info"].
+        """
+        self.num_envs = num_envs
+        self.agents = agents
+        self.grid_factory = grid_factory or GridFactory()
+        self.pad_observations_to = pad_observations_to
+        self.truncation = truncation
+        self.reward_fn = reward_fn or WinLoseRewardFn()
+        self.autoreset_mode = AutoresetMode(autoreset_mode)
+        self.metadata = {"autoreset_mode": self.autoreset_mode}
+        self._batched_rewards = self.reward_fn.vectorized
+
+        dim = pad_observations_to
+        observation_shape = (len(agents), len(OBSERVATION_CHANNELS), dim, dim)
+        self.single_observation_space = spaces.Box(low=0, high=2**31 - 1, shape=observation_shape, dtype=np.float32)
+        self.single_action_space = spaces.MultiDiscrete([2, dim, dim, 4, 4, 2])
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        # Output arrays, shared by all steps
+        num_agents = len(agents)
+        self._observations = np.zeros((num_envs, *observation_shape), dtype=np.float32)
+        self._prior_observations = np.zeros_like(self._observations) if self._batched_rewards else None
+        self._infos = {
+            "army": np.zeros((num_envs, num_agents), dtype=np.int32),
+            "land": np.zeros((num_envs, num_agents), dtype=np.int32),
+            "done": np.zeros((num_envs, num_agents), dtype=bool),
+            "winner": np.zeros((num_envs, num_agents), dtype=bool),
+            "masks": np.zeros((num_envs, num_agents, dim, dim, 4, 4), dtype=bool),
+            "reward": np.zeros((num_envs, num_agents), dtype=np.float32),
+        }
+        self._rewards = np.zeros(num_envs, dtype=np.float32)
+        self._terminations = np.zeros(num_envs, dtype=bool)
+        self._truncations = np.zeros(num_envs, dtype=bool)
+        self._autoreset_envs = np.zeros(num_envs, dtype=bool)
+
+        # Statistics of completed episodes, drained with episode_statistics.drain()
+        self.episode_statistics = EpisodeStatistics(num_agents)
+        self._episode_lengths = np.zeros(num_envs, dtype=np.int64)
+        self._episode_returns = np.zeros((num_envs, num_agents), dtype=np.float32)
+
+        # Games and their random generators, as each game is seeded like its own GymnasiumGenerals
+        self.env_rngs: list[np.random.Generator | None] = [None] * num_envs
+        self.games = [Game(self.grid_factory.generate(), agents) for _ in range(num_envs)]
+        self.prior_observations: list[dict[str, Observation]] = [{} for _ in range(num_envs)]
+
+    @property
+    def grids(self) -> list[Grid]:
+        """The grids of the current games, see GymnasiumGenerals.grid."""
+        return [game.grid for game in self.games]
+
+    def reset(
+        self, *, seed: int | list[int | None] | None = None, options: dict[str, Any] | None = None
+    ) -> tuple[np.ndarray, dict[str, Any]]:
+        """
+        Resets all games, or those in options["reset_mask"]. An int seed seeds the games with seed, seed + 1, ...
+        """
+        options = dict(options or {})
+        if seed is None or isinstance(seed, int):
+            seed = [None if seed is None else seed + i for i in range(self.num_envs)]
+        assert len(seed) == self.num_envs, f"Expected {self.num_envs} seeds."
+        reset_mask = options.pop("reset_mask", np.ones(self.num_envs, dtype=bool))
+
+        for i in np.flatnonzero(reset_mask):
+            self._reset_game(i, seed[i], options)
+        self._write_masks(np.flatnonzero(reset_mask))
+        self._terminations[reset_mask] = False
+        self._truncations[reset_mask] = False
+        self._autoreset_envs[reset_mask] = False
+        self._episode_lengths[reset_mask] = 0
+        self._episode_returns[reset_mask] = 0
+        return self._observations, self._agent_infos()
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict[str, Any]]:
+        """Steps all games with actions of shape (num_envs, 2, 6)."""
+        actions = np.asarray(actions)
+        if self.autoreset_mode == AutoresetMode.NEXT_STEP:
+            autoreset = np.flatnonzero(self._autoreset_envs)
+            stepped = np.flatnonzero(~self._autoreset_envs)
+        else:
+            assert not self._autoreset_envs.any(), "Finished games have to be reset before they are stepped."
+            autoreset, stepped = np.array([], dtype=int), np.arange(self.num_envs)
+
+        if self._prior_observations is not None:
+            self._prior_observations[stepped] = self._observations[stepped]
+
+        self._step_games(stepped, actions)
+        if self._batched_rewards and len(stepped) > 0:
+            self._compute_batched_rewards(stepped, actions)
+        self._episode_lengths[stepped] += 1
+        self._episode_returns[stepped] += self._infos["reward"][stepped]
+
+        for i in autoreset:
+            self._reset_game(i, None, {})
+            self._terminations[i] = self._truncations[i] = False
+        self._write_masks(np.arange(self.num_envs))
+
+        infos = self._agent_infos()
+        np.logical_or(self._terminations, self._truncations, out=self._autoreset_envs)
+        self._record_episodes(np.flatnonzero(self._autoreset_envs))
+        if self.autoreset_mode == AutoresetMode.SAME_STEP and self._autoreset_envs.any():
+            infos["final_obs"] = self._observations.copy()
+            infos["final_info"] = {
+                agent: {key: value.copy() for key, value in agent_infos.items()}
+                for agent, agent_infos in self._agent_infos().items()
+            }
+            infos["_final_obs"] = infos["_final_info"] = self._autoreset_envs.copy()
+            for i in np.flatnonzero(self._autoreset_envs):
+                self._reset_game(i, None, {})
+            self._write_masks(np.flatnonzero(self._autoreset_envs))
+            self._autoreset_envs[:] = False
+
+        return self._observations, self._rewards, self._terminations, self._truncations, infos
+
+    def _step_games(self, stepped: np.ndarray, actions: np.ndarray) -> None:
+        """Steps the given games, writing their results and, unless they are batched, rewards."""
+        if self._batched_rewards:
+            self._advance_games(stepped, actions)
+            return
+        for i in stepped:
+            game = self.games[i]
+            prior_observations = self.prior_observations[i]
+            observations, game_infos = game.step(dict(zip(self.agents, actions[i])))
+            self._write_game(i, observations, game_infos)
+            self._terminations[i] = game.is_done()
+            self._truncations[i] = self.truncation is not None and game.time >= self.truncation
+            self.reward_fn.reset(game.grid)
+            for j, agent in enumerate(self.agents):
+                self._infos["reward"][i, j] = self.reward_fn(
+                    prior_observations[agent], actions[i, j].view(Action), observations[agent]
+                )
+
+    def _advance_games(self, games: np.ndarray, actions: np.ndarray) -> None:
+        """
+        Steps the games through the numba kernels of Game.advance and writes their observation tensors
+        directly, without building Observations, which only reward functions without a batch need.
+        """
+        for i in games:
+            game = self.games[i]
+            game.advance(dict(zip(self.agents, actions[i])))
+            game.observation_tensors(self.pad_observations_to, out=self._observations[i])
+            self._write_infos(i, game.get_infos())
+            self._terminations[i] = game.is_done()
+            self._truncations[i] = self.truncation is not None and game.time >= self.truncation
+
+    def _reset_game(self, i: int, seed: int | None, options: dict[str, Any]) -> None:
+        """Starts a new game in slot i, seeded the same way as GymnasiumGenerals.reset."""
+        if seed is not None or self.env_rngs[i] is None:
+            self.env_rngs[i], _ = seeding.np_random(seed)
+
+        if "grid" in options:
+            grid = Grid(options["grid"])
+        else:
+            self.grid_factory.set_rng(rng=self.env_rngs[i])
+            grid = self.grid_factory.generate()
+
+        game = self.games[i]
+        game.reset(grid)
+        self._write_game(i, {agent: game.agent_observation(agent) for agent in self.agents}, game.get_infos())
+        self._infos["reward"][i] = 0
+
+    def _write_game(self, i: int, observations: dict[str, Observation], game_infos: dict[str, Any]) -> None:
+        """Writes observations & infos of game i into the output arrays, except for the masks."""
+        for j, agent in enumerate(self.agents):
+            observations[agent].as_tensor(pad_to=self.pad_observations_to, out=self._observations[i, j])
+        self._write_infos(i, game_infos)
+        self.prior_observations[i] = observations
+
+    def _write_infos(self, i: int, game_infos: dict[str, Any]) -> None:
+        """Writes the infos of game i, as given by Game.get_infos, into the output arrays."""
+        for j, agent in enumerate(self.agents):
+            self._infos["army"][i, j] = game_infos[agent]["army"]
+            self._infos["land"][i, j] = game_infos[agent]["land"]
+            self._infos["done"][i, j] = game_infos[agent]["is_done"]
+            self._infos["winner"][i, j] = game_infos[agent]["is_winner"]
+
+    def _write_masks(self, games: np.ndarray) -> None:
+        """Computes the valid move masks of the given games from their observations, in a single call."""
+        tensor = self._observations[games].reshape(-1, *self._observations.shape[2:])
+        self._infos["masks"][games] = compute_valid_move_mask_batch(tensor).reshape(self._infos["masks"][games].shape)
+
+    def _compute_batched_rewards(self, stepped: np.ndarray, actions: np.ndarray) -> None:
+        """Computes rewards of all agents of the stepped games with a single RewardFn.batch call."""
+        assert self._prior_observations is not None
+        shape = (len(stepped) * len(self.agents), *self._observations.shape[2:])
+        rewards = self.reward_fn.batch(
+            self._prior_observations[stepped].reshape(shape),
+            actions[stepped].reshape(-1, actions.shape[-1]),
+            self._observations[stepped].reshape(shape),
+        )
+        self._infos["reward"][stepped] = rewards.reshape(len(stepped), len(self.agents))
+
+    def _record_episodes(self, finished: np.ndarray) -> None:
+        """Adds the episodes of the finished games to the episode statistics."""
+        if len(finished) == 0:
+            return
+        winners = self._infos["winner"][finished]
+        self.episode_statistics.add(
+            self._episode_lengths[finished],
+            self._episode_returns[finished],
+            np.where(winners.any(axis=1), winners.argmax(axis=1), -1),
+        )
+        self._episode_lengths[finished] = 0
+        self._episode_returns[finished] = 0
+
+    def _agent_infos(self) -> dict[str, Any]:
+        return {agent: {key: self._infos[key][:, j] for key in INFO_KEYS} for j, agent in enumerate(self.agents)}
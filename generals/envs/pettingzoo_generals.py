@@ -8,8 +8,10 @@ from gymnasium import spaces
 
 from generals.core.game import Action, Game, Info, Observation
 from generals.core.grid import Grid, GridFactory
+from generals.core.observation import OBSERVATION_CHANNELS
 from generals.core.replay import Replay
 from generals.core.rewards import RewardFn, WinLoseRewardFn
+from generals.envs.frame_stack import FrameStack
 from generals.gui import GUI
 from generals.gui.properties import GuiMode
 
@@ -30,6 +32,7 @@ class PettingZooGenerals(pettingzoo.ParallelEnv):
         reward_fn: RewardFn | None = None,
         render_mode: str | None = None,
         speed_multiplier: float = 1.0,
+        frame_stack: int | None = None,
     ):
         """
         Args:
@@ -43,6 +46,9 @@ class PettingZooGenerals(pettingzoo.ParallelEnv):
                 game graphic. This has no effect if render_mode is None.
             pad_observations: If True, the observations will be padded to the same shape,
                 defined by maximum grid dimensions of grid_factory.
+            frame_stack: If set, infos[agent]["frames"] holds the agent's last frame_stack observations as
+                tensors (see Observation.as_tensor) concatenated along the channel axis, oldest first.
+                They are views of a ring buffer, valid until the next step.
         """
         self.render_mode = render_mode
         self.speed_multiplier = speed_multiplier
@@ -63,6 +69,13 @@ class PettingZooGenerals(pettingzoo.ParallelEnv):
             set(self.possible_agents)
         ), "Agent ids must be unique - you can pass custom ids to agent constructors."
         self.truncation = truncation
+        self.frame_stack = frame_stack
+        self.frames: FrameStack | None = None
+
+    @property
+    def grid(self) -> Grid:
+        """The grid of the current game, see GymnasiumGenerals.grid."""
+        return self.game.grid
 
     @functools.cache
     def observation_space(self, agent: AgentID) -> spaces.Space:
@@ -132,9 +145,15 @@ class PettingZooGenerals(pettingzoo.ParallelEnv):
             self.grid_factory.set_rng(rng=np.random.default_rng(seed))
             grid = self.grid_factory.generate()
 
-        self.game = Game(grid, self.agents)
+        # Games after the first are started in the arrays of the previous one
+        if hasattr(self, "game"):
+            self.game.reset(grid)
+        else:
+            self.game = Game(grid, self.agents)
+        self.reward_fn.reset(grid)
 
-        if self.render_mode == "human":
+        # The GUI is kept while it shows the game on a map of the same size
+        if self.render_mode == "human" and not (hasattr(self, "gui") and self.gui.can_render(self.game)):
             self.gui = GUI(self.game, self.agent_data, GuiMode.TRAIN, self.speed_multiplier)
 
         if "replay_file" in options:
@@ -148,7 +167,14 @@ class PettingZooGenerals(pettingzoo.ParallelEnv):
             del self.replay
 
         observations = {agent: self.game.agent_observation(agent) for agent in self.agents}
+        # Rewards of the first step are computed against the new map, not the last episode.
+        self.prior_observations = observations
         infos: dict[str, Any] = {agent: {} for agent in self.agents}
+        if self.frame_stack is not None:
+            frame_shape = (len(OBSERVATION_CHANNELS), *self.game.grid_dims)
+            if self.frames is None or self.frames.frame_shape != frame_shape:
+                self.frames = FrameStack(self.frame_stack, frame_shape, num_stacks=len(self.agents))
+            self._add_frames(observations, infos, reset=True)
         return observations, infos
 
     def step(
@@ -182,6 +208,9 @@ class PettingZooGenerals(pettingzoo.ParallelEnv):
                 for agent in self.agents
             }
 
+        if self.frame_stack is not None:
+            self._add_frames(observations, infos)
+
         if hasattr(self, "replay"):
             self.replay.add_state(deepcopy(self.game.channels))
 
@@ -194,3 +223,11 @@ class PettingZooGenerals(pettingzoo.ParallelEnv):
         self.prior_observations = observations
 
         return observations, rewards, terminated, truncated, infos
+
+    def _add_frames(self, observations: dict[AgentID, Observation], infos: dict[AgentID, Any], reset=False) -> None:
+        """Pushes the observations into the frame stack and adds the stacked frames to infos."""
+        assert self.frames is not None
+        frames = np.stack([observations[agent].as_tensor() for agent in self.possible_agents])
+        stacked = self.frames.reset(frames) if reset else self.frames.push(frames)
+        for i, agent in enumerate(self.possible_agents):
+            infos[agent]["frames"] = stacked[i]
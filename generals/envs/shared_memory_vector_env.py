@@ -0,0 +1,336 @@
+import multiprocessing as mp
+import os
+import traceback
+from collections.abc import Callable
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection, wait
+from typing import Any
+
+import numpy as np
+
+from generals.core.action import compute_valid_move_mask
+from generals.core.observation import OBSERVATION_CHANNELS
+from generals.envs.gymnasium_generals import GymnasiumGenerals
+from generals.envs.pettingzoo_generals import PettingZooGenerals
+
+# Commands sent to the workers, and their replies. Everything else is exchanged through shared memory.
+_STEP = b"s"
+_RESET = b"r"
+_CLOSE = b"c"
+_DONE = b"d"
+_ERROR = b"e"
+
+# Seeds passed to reset that are None
+_NO_SEED = -1
+
+Env = GymnasiumGenerals | PettingZooGenerals
+
+
+class SharedMemoryVectorEnv:
+    """
+    Runs GymnasiumGenerals or PettingZooGenerals environments in worker processes, envs_per_worker in each.
+
+    Observations, masks, rewards, terminations, truncations and actions of all environments live in
+    multiprocessing.shared_memory blocks, which workers read & write directly, so a step only sends a
+    command byte to every worker and receives one back.
+
+    Results of all environments have the same layout, whatever the kind of environment:
+        - observations: float32 array of shape (num_envs, 2, C, dim, dim), see GymnasiumGenerals.
+          PettingZooGenerals observations are converted with Observation.as_tensor.
+        - masks: boolean array of shape (num_envs, 2, dim, dim, 4, 4)
+        - rewards: float32 array of shape (num_envs, 2)
+        - terminated, truncated: boolean arrays of shape (num_envs,)
+    They are overwritten by the next step, so copy them if you need to keep them. Finished environments
+    are reset on their next step, which returns the first observation of the new episode with zero rewards.
+
+    Besides the synchronous step, workers can be stepped asynchronously, waiting only for the first
+    workers that finish (see step_async & step_wait).
+    """
+
+    def __init__(
+        self,
+        env_fns: list[Callable[[], Env]],
+        envs_per_worker: int = 1,
+        pad_observations_to: int = 24,
+        cpus: list[int] | None = None,
+        context: str | None = None,
+    ):
+        """
+        Args:
+            env_fns: Functions creating the environments, called in the workers.
+            envs_per_worker: Number of environments stepped by every worker, the last worker may get fewer.
+            pad_observations_to: Size PettingZooGenerals observations & masks are padded to.
+                GymnasiumGenerals observations keep the shape of their observation space.
+            cpus: If set, worker w is pinned to cpus[w % len(cpus)], where the platform supports it.
+            context: Multiprocessing start method, e.g. "fork" or "spawn". The platform default if None.
+        """
+        self.num_envs = len(env_fns)
+        self.envs_per_worker = envs_per_worker
+
+        # The first environment is created here, to know the shapes of the results
+        env = env_fns[0]()
+        if isinstance(env, GymnasiumGenerals):
+            observation_shape = env.observation_space.shape
+            dim = env.observation_dim
+        else:
+            dim = pad_observations_to
+            observation_shape = (len(env.possible_agents), len(OBSERVATION_CHANNELS), dim, dim)
+        num_agents = observation_shape[0]
+        env.close()
+
+        self._specs = {
+            "observations": ((self.num_envs, *observation_shape), np.float32),
+            "masks": ((self.num_envs, num_agents, dim, dim, 4, 4), np.bool_),
+            "rewards": ((self.num_envs, num_agents), np.float32),
+            "terminated": ((self.num_envs,), np.bool_),
+            "truncated": ((self.num_envs,), np.bool_),
+            "actions": ((self.num_envs, num_agents, 6), np.int64),
+            "seeds": ((self.num_envs,), np.int64),
+        }
+        self._blocks: dict[str, shared_memory.SharedMemory] = {}
+        self._arrays: dict[str, np.ndarray] = {}
+        for name, (shape, dtype) in self._specs.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            self._blocks[name] = shared_memory.SharedMemory(create=True, size=size)
+            self._arrays[name] = np.ndarray(shape, dtype=dtype, buffer=self._blocks[name].buf)
+            self._arrays[name].fill(0)
+        block_names = {name: block.name for name, block in self._blocks.items()}
+
+        ctx = mp.get_context(context)
+        self.worker_envs: list[np.ndarray] = []
+        self._pipes: list[Connection] = []
+        self._processes = []
+        for worker, first_env in enumerate(range(0, self.num_envs, envs_per_worker)):
+            env_ids = np.arange(first_env, min(first_env + envs_per_worker, self.num_envs))
+            cpu = None if cpus is None else cpus[worker % len(cpus)]
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child_pipe, [env_fns[i] for i in env_ids], env_ids, block_names, self._specs, cpu),
+                daemon=True,
+            )
+            process.start()
+            child_pipe.close()
+            self.worker_envs.append(env_ids)
+            self._pipes.append(parent_pipe)
+            self._processes.append(process)
+        self._pending: set[int] = set()
+        self.closed = False
+
+    @property
+    def num_workers(self) -> int:
+        return len(self._processes)
+
+    def reset(self, seed: int | list[int | None] | None = None) -> tuple[np.ndarray, dict[str, Any]]:
+        """
+        Resets all environments. An int seed seeds the environments with seed, seed + 1, ...
+        """
+        assert not self._pending, "Wait for the pending steps before resetting."
+        if seed is None or isinstance(seed, int):
+            seed = [None if seed is None else seed + i for i in range(self.num_envs)]
+        self._arrays["seeds"][:] = [_NO_SEED if s is None else s for s in seed]
+        self._send(range(self.num_workers), _RESET)
+        self._receive(range(self.num_workers))
+        return self._arrays["observations"], {"masks": self._arrays["masks"]}
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict[str, Any]]:
+        """Steps all environments with actions of shape (num_envs, 2, 6) and waits for all of them."""
+        self.step_async(actions)
+        self.step_wait()
+        arrays = self._arrays
+        return (
+            arrays["observations"],
+            arrays["rewards"],
+            arrays["terminated"],
+            arrays["truncated"],
+            {"masks": arrays["masks"]},
+        )
+
+    def step_async(self, actions: np.ndarray) -> None:
+        """
+        Steps the environments of all workers that are not busy, with their rows of actions of shape (num_envs, 2, 6).
+        """
+        idle = [worker for worker in range(self.num_workers) if worker not in self._pending]
+        for worker in idle:
+            env_ids = self.worker_envs[worker]
+            self._arrays["actions"][env_ids] = actions[env_ids]
+        self._send(idle, _STEP)
+        self._pending.update(idle)
+
+    def step_wait(self, num_workers: int | None = None) -> np.ndarray:
+        """
+        Waits until at least num_workers of the busy workers finished their step, all of them if None.
+
+        Returns:
+            np.ndarray: ids of the environments whose results were updated, their rows of the shared arrays
+                (e.g. observations[env_ids]) hold the new results until they are stepped again.
+        """
+        num_workers = len(self._pending) if num_workers is None else min(num_workers, len(self._pending))
+        finished: list[int] = []
+        while len(finished) < num_workers:
+            pipes = {self._pipes[worker]: worker for worker in self._pending}
+            ready = [pipes[pipe] for pipe in wait(list(pipes))]
+            finished.extend(ready)
+            self._receive(ready)
+        if not finished:
+            return np.array([], dtype=int)
+        return np.concatenate([self.worker_envs[worker] for worker in sorted(finished)])
+
+    @property
+    def observations(self) -> np.ndarray:
+        return self._arrays["observations"]
+
+    @property
+    def masks(self) -> np.ndarray:
+        return self._arrays["masks"]
+
+    @property
+    def rewards(self) -> np.ndarray:
+        return self._arrays["rewards"]
+
+    @property
+    def terminated(self) -> np.ndarray:
+        return self._arrays["terminated"]
+
+    @property
+    def truncated(self) -> np.ndarray:
+        return self._arrays["truncated"]
+
+    def close(self) -> None:
+        """Stops the workers and frees the shared memory."""
+        if self.closed:
+            return
+        self.closed = True
+        # Replies of busy workers are dropped, errors included
+        for worker in self._pending:
+            if self._processes[worker].is_alive() and self._pipes[worker].poll(timeout=5):
+                self._pipes[worker].recv_bytes()
+        self._pending.clear()
+        for pipe, process in zip(self._pipes, self._processes):
+            if process.is_alive():
+                pipe.send_bytes(_CLOSE)
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            pipe.close()
+        self._arrays.clear()
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+
+    def __del__(self):
+        if not getattr(self, "closed", True):
+            self.close()
+
+    def _send(self, workers, command: bytes) -> None:
+        for worker in workers:
+            self._pipes[worker].send_bytes(command)
+
+    def _receive(self, workers) -> None:
+        """Receives the replies of the workers, which are then no longer busy, and raises the first error."""
+        errors = []
+        for worker in workers:
+            reply = self._pipes[worker].recv_bytes()
+            self._pending.discard(worker)
+            if reply != _DONE:
+                errors.append(f"Worker {worker} failed:\n{reply[len(_ERROR) :].decode()}")
+        if errors:
+            raise RuntimeError(errors[0])
+
+
+def _worker(
+    pipe: Connection,
+    env_fns: list[Callable[[], Env]],
+    env_ids: np.ndarray,
+    block_names: dict[str, str],
+    specs: dict[str, tuple[tuple[int, ...], Any]],
+    cpu: int | None,
+) -> None:
+    blocks: dict[str, shared_memory.SharedMemory] = {}
+    arrays: dict[str, np.ndarray] = {}
+    envs: list[Env] = []
+    # Errors raised while starting are reported as the reply to the first command
+    startup_error = None
+    try:
+        if cpu is not None and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, {cpu})
+        for name, (shape, dtype) in specs.items():
+            blocks[name] = shared_memory.SharedMemory(name=block_names[name])
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+        envs = [env_fn() for env_fn in env_fns]
+    except Exception:  # noqa: BLE001 - errors are forwarded to the main process
+        startup_error = _ERROR + traceback.format_exc().encode()
+    needs_reset = [False] * len(envs)
+
+    try:
+        while True:
+            command = pipe.recv_bytes()
+            if command == _CLOSE:
+                break
+            if startup_error is not None:
+                pipe.send_bytes(startup_error)
+                continue
+            try:
+                for k, (env, i) in enumerate(zip(envs, env_ids)):
+                    if command == _RESET or needs_reset[k]:
+                        seed = int(arrays["seeds"][i]) if command == _RESET else _NO_SEED
+                        _reset_env(env, i, None if seed == _NO_SEED else seed, arrays)
+                    else:
+                        _step_env(env, i, arrays)
+                    needs_reset[k] = arrays["terminated"][i] or arrays["truncated"][i]
+                pipe.send_bytes(_DONE)
+            except Exception:  # noqa: BLE001 - errors are forwarded to the main process
+                pipe.send_bytes(_ERROR + traceback.format_exc().encode())
+    finally:
+        for env in envs:
+            env.close()
+        arrays.clear()
+        for block in blocks.values():
+            block.close()
+
+
+def _reset_env(env: Env, i: int, seed: int | None, arrays: dict[str, np.ndarray]) -> None:
+    arrays["rewards"][i] = 0
+    arrays["terminated"][i] = arrays["truncated"][i] = False
+    if isinstance(env, GymnasiumGenerals):
+        observations, infos = env.reset(seed=seed)
+        _write_gymnasium_results(env, i, observations, infos, arrays)
+    else:
+        observations, _ = env.reset(seed=seed)
+        arrays["masks"][i] = False
+        _write_pettingzoo_observations(env, i, observations, arrays)
+
+
+def _step_env(env: Env, i: int, arrays: dict[str, np.ndarray]) -> None:
+    actions = arrays["actions"][i]
+    if isinstance(env, GymnasiumGenerals):
+        observations, _, terminated, truncated, infos = env.step(list(actions))
+        _write_gymnasium_results(env, i, observations, infos, arrays)
+        for j, agent in enumerate(env.agents):
+            arrays["rewards"][i, j] = infos[agent]["reward"]
+    else:
+        agents = env.possible_agents
+        observations, rewards, terminated, truncated, _ = env.step(dict(zip(agents, actions)))
+        _write_pettingzoo_observations(env, i, observations, arrays)
+        arrays["rewards"][i] = [rewards[agent] for agent in agents]
+    arrays["terminated"][i] = terminated
+    arrays["truncated"][i] = truncated
+
+
+def _write_gymnasium_results(
+    env: GymnasiumGenerals, i: int, observations: np.ndarray, infos: dict[str, Any], arrays: dict[str, np.ndarray]
+) -> None:
+    arrays["observations"][i] = observations
+    for j, agent in enumerate(env.agents):
+        arrays["masks"][i, j] = infos[agent]["masks"]
+
+
+def _write_pettingzoo_observations(
+    env: PettingZooGenerals, i: int, observations: dict[str, Any], arrays: dict[str, np.ndarray]
+) -> None:
+    dim = arrays["observations"].shape[-1]
+    for j, agent in enumerate(env.possible_agents):
+        observation = observations[agent]
+        observation.as_tensor(pad_to=dim, out=arrays["observations"][i, j])
+        height, width = observation.armies.shape
+        arrays["masks"][i, j, :height, :width] = compute_valid_move_mask(observation)
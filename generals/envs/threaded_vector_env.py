@@ -0,0 +1,75 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import numpy as np
+from gymnasium.vector import AutoresetMode
+
+from generals.core.action import Action
+from generals.core.grid import GridFactory
+from generals.core.rewards import RewardFn
+from generals.envs.gymnasium_generals_vector import GymnasiumGeneralsVector
+
+
+class ThreadedVectorEnv(GymnasiumGeneralsVector):
+    """
+    GymnasiumGeneralsVector that steps its games in a pool of threads, in-process.
+
+    Games are split into one shard per thread. Moves, unit production and the observation tensors
+    are computed by numba kernels that release the GIL (see Game.advance and Game.observation_tensors),
+    so shards run in parallel without the copies & pipes of process-based vector envs.
+
+    Results are identical to GymnasiumGeneralsVector. Reward functions without a vectorized RewardFn.batch
+    need the Observations and are called in the main thread, since they may keep state between calls.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        agents: list[str],
+        grid_factory: GridFactory | None = None,
+        pad_observations_to: int = 24,
+        truncation: int | None = None,
+        reward_fn: RewardFn | None = None,
+        autoreset_mode: str | AutoresetMode = AutoresetMode.NEXT_STEP,
+        num_threads: int | None = None,
+    ):
+        """
+        Args:
+            num_threads: Number of threads the games are stepped in, the number of CPUs if None.
+            Other arguments are the same as for GymnasiumGeneralsVector.
+        """
+        super().__init__(
+            num_envs, agents, grid_factory, pad_observations_to, truncation, reward_fn, autoreset_mode=autoreset_mode
+        )
+        self.num_threads = min(num_threads or os.cpu_count() or 1, num_envs)
+        self._executor = ThreadPoolExecutor(self.num_threads, thread_name_prefix="generals")
+
+    def _step_games(self, stepped: np.ndarray, actions: np.ndarray) -> None:
+        prior_observations = [self.prior_observations[i] for i in stepped]
+        step_shard = self._advance_games if self._batched_rewards else self._step_observations
+        shards = [shard for shard in np.array_split(stepped, self.num_threads) if len(shard) > 0]
+        # Propagate errors of any shard, e.g. invalid actions
+        for future in [self._executor.submit(step_shard, shard, actions) for shard in shards]:
+            future.result()
+
+        if not self._batched_rewards:
+            for i, prior in zip(stepped, prior_observations):
+                self.reward_fn.reset(self.games[i].grid)
+                for j, agent in enumerate(self.agents):
+                    self._infos["reward"][i, j] = self.reward_fn(
+                        prior[agent], actions[i, j].view(Action), self.prior_observations[i][agent]
+                    )
+
+    def _step_observations(self, games: np.ndarray, actions: np.ndarray) -> None:
+        """Steps the games and writes their Observations, which the reward function needs."""
+        for i in games:
+            game = self.games[i]
+            observations, game_infos = game.step(dict(zip(self.agents, actions[i])))
+            self._write_game(i, observations, game_infos)
+            self._terminations[i] = game.is_done()
+            self._truncations[i] = self.truncation is not None and game.time >= self.truncation
+
+    def close(self, **kwargs: Any) -> None:
+        self._executor.shutdown()
+        super().close(**kwargs)
@@ -31,6 +31,11 @@ class GUI:
         self.__renderer = Renderer(self.properties)
         self.__event_handler = EventHandler.from_mode(self.properties.mode, self.properties)
 
+    def can_render(self, game: Game) -> bool:
+        """Whether the GUI can render game, i.e. it was created for it and the grid still has the same dims."""
+        properties = self.properties
+        return properties.game is game and (properties.grid_height, properties.grid_width) == game.grid_dims
+
     def tick(self, fps: int | None = None) -> Command:
         command = self.__event_handler.handle_events()
         if command.quit:
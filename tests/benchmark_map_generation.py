@@ -0,0 +1,39 @@
+"""
+Reports latency percentiles of map generation, per grid, for each mode of GridFactory and for batches.
+
+Run with `python3 -m tests.benchmark_map_generation`.
+"""
+
+import time
+
+import numpy as np
+
+from generals.core.grid import GridFactory
+
+NUM_SAMPLES = 1000
+BATCH_SIZE = 64
+
+
+def latencies(generate, num_samples: int = NUM_SAMPLES) -> np.ndarray:
+    """Milliseconds taken by each of num_samples calls of generate, after a warm-up call."""
+    generate()
+    times = np.empty(num_samples)
+    for i in range(num_samples):
+        start = time.perf_counter()
+        generate()
+        times[i] = time.perf_counter() - start
+    return times * 1000
+
+
+if __name__ == "__main__":
+    uniform = GridFactory(mode="uniform", seed=0)
+    generalsio = GridFactory(mode="generalsio", seed=0)
+    benchmarks = {
+        "uniform": latencies(uniform.generate),
+        "generalsio": latencies(generalsio.generate),
+        f"uniform batch of {BATCH_SIZE}, per grid": latencies(lambda: uniform.generate_batch(BATCH_SIZE), 100)
+        / BATCH_SIZE,
+    }
+    for name, times in benchmarks.items():
+        p50, p90, p99 = np.percentile(times, [50, 90, 99])
+        print(f"{name}: p50 {p50:.2f}ms, p90 {p90:.2f}ms, p99 {p99:.2f}ms, max {times.max():.2f}ms")
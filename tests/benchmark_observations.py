@@ -0,0 +1,37 @@
+"""
+Compares building observations agent by agent with the fused Game.all_observations.
+
+Run with `python3 -m tests.benchmark_observations`.
+"""
+
+import timeit
+
+import numpy as np
+
+from generals.core.game import Game
+from generals.core.grid import GridFactory
+
+
+def make_game(size: int) -> Game:
+    grid_factory = GridFactory(min_grid_dims=(size, size), max_grid_dims=(size, size), seed=0)
+    game = Game(grid_factory.generate(), ["red", "blue"])
+    # Spread some ownership & units around, so that the layers are not trivially empty
+    rng = np.random.default_rng(0)
+    for agent in game.agents:
+        owned = (rng.random(game.grid_dims) < 0.2) & game.channels.ownership_neutral
+        game.channels.ownership[agent] |= owned
+        game.channels.ownership_neutral &= ~owned
+        game.channels.infantry += owned * rng.integers(1, 50, size=game.grid_dims)
+    return game
+
+
+if __name__ == "__main__":
+    number = 2000
+    for size in [10, 24, 48]:
+        game = make_game(size)
+        per_agent = timeit.timeit(lambda: {agent: game.agent_observation(agent) for agent in game.agents}, number=number)
+        fused = timeit.timeit(game.all_observations, number=number)
+        print(
+            f"{size}x{size}: per-agent {1e6 * per_agent / number:.1f} us, "
+            f"fused {1e6 * fused / number:.1f} us, speedup {per_agent / fused:.2f}x"
+        )
@@ -0,0 +1,58 @@
+"""
+Compares steps per second of the vector envs: Gymnasium's SyncVectorEnv, GymnasiumGeneralsVector,
+ThreadedVectorEnv and SharedMemoryVectorEnv. Threads only help when several CPUs are available.
+
+Run with `python3 -m tests.benchmark_threaded_env`.
+"""
+
+import os
+import time
+
+import gymnasium as gym
+import numpy as np
+
+from generals.core.grid import GridFactory
+from generals.core.rewards import LandRewardFn
+from generals.envs import GymnasiumGenerals, GymnasiumGeneralsVector, SharedMemoryVectorEnv, ThreadedVectorEnv
+
+AGENTS = ["red", "blue"]
+
+
+def make_env():
+    return GymnasiumGenerals(agents=AGENTS, grid_factory=GridFactory(), truncation=500, reward_fn=LandRewardFn())
+
+
+def steps_per_second(env, masks, num_steps: int = 200) -> float:
+    """Steps with random valid actions, sampled from the masks of shape (num_envs, 2, H, W, 4, 4)."""
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        actions = np.zeros((*masks.shape[:2], 6), dtype=np.int64)
+        for i, j in np.ndindex(*masks.shape[:2]):
+            valid_moves = np.argwhere(masks[i, j])
+            if len(valid_moves) == 0:
+                actions[i, j, 0] = 1
+            else:
+                actions[i, j, 1:5] = valid_moves[rng.integers(len(valid_moves))]
+        masks = env.step(actions)[-1]
+        masks = masks["masks"] if "masks" in masks else np.stack([masks[agent]["masks"] for agent in AGENTS], axis=1)
+    return num_steps * len(masks) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    cpus = os.cpu_count() or 1
+    for num_envs in [8, 32]:
+        env_kwargs = {"agents": AGENTS, "truncation": 500, "reward_fn": LandRewardFn()}
+        envs = {
+            "sync": gym.vector.SyncVectorEnv([make_env] * num_envs),
+            "vector": GymnasiumGeneralsVector(num_envs, **env_kwargs),
+            "threaded": ThreadedVectorEnv(num_envs, num_threads=cpus, **env_kwargs),
+            "shared memory": SharedMemoryVectorEnv([make_env] * num_envs, envs_per_worker=max(num_envs // cpus, 1)),
+        }
+        results = []
+        for name, env in envs.items():
+            infos = env.reset(seed=0)[1]
+            masks = infos["masks"] if "masks" in infos else np.stack([infos[agent]["masks"] for agent in AGENTS], axis=1)
+            results.append(f"{name} {steps_per_second(env, masks):.0f}")
+            env.close()
+        print(f"{num_envs} envs, {cpus} CPUs, steps/s: " + ", ".join(results))
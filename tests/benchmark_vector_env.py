@@ -0,0 +1,55 @@
+"""
+Compares stepping GymnasiumGenerals under gymnasium's SyncVectorEnv with GymnasiumGeneralsVector.
+
+Run with `python3 -m tests.benchmark_vector_env`.
+"""
+
+import time
+
+import gymnasium as gym
+import numpy as np
+
+from generals.core.grid import GridFactory
+from generals.core.rewards import LandRewardFn
+from generals.envs import GymnasiumGenerals, GymnasiumGeneralsVector
+
+AGENTS = ["red", "blue"]
+
+
+def random_actions(masks: dict[str, np.ndarray], rng: np.random.Generator) -> np.ndarray:
+    """Samples a random valid action for every agent of every env, passing when there is none."""
+    num_envs = len(masks[AGENTS[0]])
+    actions = np.zeros((num_envs, len(AGENTS), 6), dtype=int)
+    for i in range(num_envs):
+        for j, agent in enumerate(AGENTS):
+            valid_moves = np.argwhere(masks[agent][i])
+            if len(valid_moves) == 0:
+                actions[i, j, 0] = 1
+            else:
+                actions[i, j, 1:5] = valid_moves[rng.integers(len(valid_moves))]
+    return actions
+
+
+def steps_per_second(env: gym.vector.VectorEnv, num_steps: int) -> float:
+    rng = np.random.default_rng(0)
+    _, infos = env.reset(seed=0)
+    masks = {agent: infos[agent]["masks"] for agent in AGENTS}
+    # Actions are sampled up front, so that only the env is timed
+    actions = random_actions(masks, rng)
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        env.step(actions)
+    return num_steps * env.num_envs / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    num_steps = 200
+    env_kwargs = {"agents": AGENTS, "truncation": 100, "reward_fn": LandRewardFn()}
+    for num_envs in [4, 16, 64]:
+        sync_env = gym.vector.SyncVectorEnv(
+            [lambda: GymnasiumGenerals(grid_factory=GridFactory(), **env_kwargs) for _ in range(num_envs)]
+        )
+        vector_env = GymnasiumGeneralsVector(num_envs, grid_factory=GridFactory(), **env_kwargs)
+        sync = steps_per_second(sync_env, num_steps)
+        vector = steps_per_second(vector_env, num_steps)
+        print(f"{num_envs} envs: sync {sync:.0f} steps/s, vector {vector:.0f} steps/s, speedup {vector / sync:.2f}x")
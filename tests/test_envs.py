@@ -0,0 +1,411 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+
+from generals.core.action import compute_valid_move_mask
+from generals.core.grid import GridFactory, GridPool
+from generals.core.observation import OBSERVATION_CHANNELS
+from generals.core.rewards import FrequentAssetRewardFn, LandRewardFn, RewardFn
+from generals.envs import (
+    EpisodeStatistics,
+    GymnasiumGenerals,
+    GymnasiumGeneralsVector,
+    PettingZooGenerals,
+    SharedMemoryVectorEnv,
+    ThreadedVectorEnv,
+)
+from generals.envs.frame_stack import FrameStack
+
+
+def sample_valid_action(mask, rng):
+    """
+    Samples a random valid action from a (rows, cols, 4, 4) mask, passing when there is none.
+    """
+    valid_moves = np.argwhere(mask)
+    if len(valid_moves) == 0:
+        return np.array([1, 0, 0, 0, 1, 0])
+    row, col, direction, unit_type_idx = valid_moves[rng.integers(len(valid_moves))]
+    return np.array([0, row, col, direction, unit_type_idx, rng.integers(2)])
+
+
+def test_gymnasium_egocentric_observations():
+    rng = np.random.default_rng(0)
+    grid_factory = GridFactory(min_grid_dims=(10, 10), max_grid_dims=(16, 16))
+    env = GymnasiumGenerals(
+        agents=["red", "blue"], grid_factory=grid_factory, observation_window=7, minimap_size=4, truncation=100
+    )
+    observations, infos = env.reset(seed=0)
+    assert env.observation_space.shape == (2, 19, 7, 7)
+
+    terminated = truncated = False
+    while not (terminated or truncated):
+        assert observations.shape == (2, 19, 7, 7)
+        for i, agent in enumerate(env.agents):
+            assert infos[agent]["masks"].shape == (7, 7, 4, 4)
+            assert infos[agent]["minimap"].shape == (13, 4, 4)
+            window_origin = infos[agent]["window_origin"]
+            reference = env.game.egocentric_observation(agent, 7).as_tensor()
+            assert np.array_equal(observations[i], reference)
+            assert np.array_equal(window_origin, env.game.window_origin(agent, 7))
+
+        actions = [sample_valid_action(infos[agent]["masks"], rng) for agent in env.agents]
+        # Actions relative to the window are translated to the map before the game is stepped
+        owned_before = [env.game.channels.ownership[agent].copy() for agent in env.agents]
+        for action, agent, owned in zip(actions, env.agents, owned_before):
+            if action[0] == 0:
+                assert owned[tuple(action[1:3] + infos[agent]["window_origin"])]
+        observations, _, terminated, truncated, infos = env.step(actions)
+
+
+@pytest.mark.parametrize("red_action", [[0, 0, 5, 1, 1, 0], [0, 10, 10, 0, 1, 0]])
+def test_gymnasium_window_actions_outside_the_map(red_action):
+    # On a 5x5 map, the 11x11 window of red's general at (0, 0) starts at (-5, -5). Window cell (0, 5) is
+    # (-5, 0) on the map, which used to wrap around to the general, and (10, 10) is past the edge.
+    grid = "A....\n.....\n.....\n.....\n....B"
+    envs = [GymnasiumGenerals(agents=["red", "blue"], observation_window=11) for _ in range(2)]
+    for env in envs:
+        env.reset(seed=0, options={"grid": grid})
+        for _ in range(5):
+            env.step([np.array([1, 0, 0, 0, 1, 0])] * 2)
+
+    envs[0].step([np.array(red_action), np.array([1, 0, 0, 0, 1, 0])])
+    envs[1].step([np.array([1, 0, 0, 0, 1, 0])] * 2)
+    assert np.array_equal(envs[0].game.channels.infantry, envs[1].game.channels.infantry)
+    assert np.array_equal(envs[0].game.channels.ownership["red"], envs[1].game.channels.ownership["red"])
+
+    # Sampled actions never crash the env
+    for _ in range(20):
+        envs[0].step([envs[0].action_space.sample() for _ in envs[0].agents])
+
+
+def test_gymnasium_infos():
+    rng = np.random.default_rng(4)
+    reward_fn = FrequentAssetRewardFn()
+    env = GymnasiumGenerals(agents=["red", "blue"], grid_factory=GridFactory(seed=4), reward_fn=reward_fn)
+    _, infos = env.reset(seed=0)
+    prior_observations = {agent: env.game.agent_observation(agent) for agent in env.agents}
+    masks = infos["red"]["masks"]
+    for _ in range(30):
+        actions = [sample_valid_action(infos[agent]["masks"], rng) for agent in env.agents]
+        if rng.random() < 0.3:
+            actions[0] = np.array([0, 0, 0, 0, 0, 0])
+        _, _, _, _, infos = env.step(actions)
+        # Infos are written in place, rewards & masks are the same as computed from the observations
+        assert infos["red"]["masks"] is masks
+        for action, agent in zip(actions, env.agents):
+            observation = env.game.agent_observation(agent)
+            reward = reward_fn(prior_observations[agent], action, observation)
+            assert infos[agent]["reward"] == reward and infos[agent]["reward"].shape == ()
+            height, width = observation.armies.shape
+            assert np.array_equal(infos[agent]["masks"][:height, :width], compute_valid_move_mask(observation))
+            assert not infos[agent]["masks"][height:].any() and not infos[agent]["masks"][:, width:].any()
+            prior_observations[agent] = observation
+
+
+def test_gymnasium_record_episode_statistics():
+    # Wrappers add keys to the infos, which must not leak into the infos of the next step
+    env = gym.wrappers.RecordEpisodeStatistics(GymnasiumGenerals(agents=["red", "blue"], truncation=8))
+    _, infos = env.reset(seed=0)
+    assert "episode" not in infos
+    for episode in range(3):
+        for step in range(1, 9):
+            _, _, terminated, truncated, infos = env.step([np.array([1, 0, 0, 0, 1, 0])] * 2)
+            assert (terminated or truncated) == (step == 8) == ("episode" in infos)
+        assert infos["episode"]["l"] == 8
+        _, infos = env.reset(seed=episode)
+        assert "episode" not in infos
+
+
+def test_frame_stack():
+    frames = FrameStack(3, (2, 4), num_stacks=2)
+    history = [np.full((2, 2, 4), 0.0)]
+    stacked = frames.reset(history[0])
+    assert stacked.shape == (2, 6, 4) and (stacked == 0).all()
+    for step in range(1, 8):
+        history.append(np.stack([np.full((2, 4), step), np.full((2, 4), -step)]))
+        stacked = frames.push(history[-1])
+        expected = np.concatenate([history[max(step - i, 0)] for i in [2, 1, 0]], axis=1)
+        assert np.array_equal(stacked, expected)
+        assert np.shares_memory(stacked, frames.buffer)
+
+
+def test_gymnasium_frame_stack():
+    rng = np.random.default_rng(1)
+    env_kwargs = {"agents": ["red", "blue"], "grid_factory": GridFactory(seed=1), "truncation": 30}
+    env = GymnasiumGenerals(**env_kwargs, frame_stack=4)
+    reference_env = GymnasiumGenerals(**env_kwargs)
+    assert env.observation_space.shape == (2, 4 * 19, 24, 24)
+
+    for seed in [0, 1]:
+        observations, infos = env.reset(seed=seed)
+        reference_observations, _ = reference_env.reset(seed=seed)
+        # The history is filled with the first observation after every reset
+        history = [reference_observations] * 4
+        terminated = truncated = False
+        while not (terminated or truncated):
+            assert observations.shape == env.observation_space.shape
+            assert np.array_equal(observations, np.concatenate(history[-4:], axis=1))
+            actions = [sample_valid_action(infos[agent]["masks"], rng) for agent in env.agents]
+            observations, _, terminated, truncated, infos = env.step(actions)
+            history.append(reference_env.step(actions)[0])
+
+
+def test_pettingzoo_frame_stack():
+    rng = np.random.default_rng(2)
+    env = PettingZooGenerals(agents=["red", "blue"], grid_factory=GridFactory(seed=2), frame_stack=2)
+    observations, infos = env.reset(seed=0)
+    previous = {agent: observations[agent].as_tensor() for agent in env.agents}
+    for agent in env.agents:
+        assert np.array_equal(infos[agent]["frames"], np.concatenate([previous[agent]] * 2))
+
+    for _ in range(20):
+        actions = {}
+        for agent in env.agents:
+            actions[agent] = sample_valid_action(compute_valid_move_mask(observations[agent]), rng)
+        observations, _, _, _, infos = env.step(actions)
+        for agent in env.agents:
+            current = observations[agent].as_tensor()
+            assert np.array_equal(infos[agent]["frames"], np.concatenate([previous[agent], current]))
+            previous[agent] = current
+
+
+def test_gymnasium_vector_matches_sync_vector_env():
+    num_envs = 3
+    env_kwargs = {"agents": ["red", "blue"], "truncation": 25, "reward_fn": LandRewardFn()}
+    vector_env = GymnasiumGeneralsVector(num_envs, grid_factory=GridFactory(), **env_kwargs)
+    sync_env = gym.vector.SyncVectorEnv(
+        [lambda: GymnasiumGenerals(grid_factory=GridFactory(), **env_kwargs) for _ in range(num_envs)]
+    )
+    assert vector_env.observation_space == sync_env.observation_space
+    assert vector_env.action_space == sync_env.action_space
+
+    rng = np.random.default_rng(0)
+    observations, infos = vector_env.reset(seed=0)
+    reference_observations, reference_infos = sync_env.reset(seed=0)
+    for _ in range(60):
+        assert np.array_equal(observations, reference_observations)
+        for agent in env_kwargs["agents"]:
+            for key, value in infos[agent].items():
+                assert np.array_equal(value, reference_infos[agent][key]), key
+
+        actions = np.stack(
+            [
+                [sample_valid_action(infos[agent]["masks"][i], rng) for agent in env_kwargs["agents"]]
+                for i in range(num_envs)
+            ]
+        )
+        observations, _, terminated, truncated, infos = vector_env.step(actions)
+        reference_observations, _, reference_terminated, reference_truncated, reference_infos = sync_env.step(actions)
+        assert np.array_equal(terminated, reference_terminated)
+        assert np.array_equal(truncated, reference_truncated)
+
+
+class ArmyRewardFn(RewardFn):
+    """Reward function without a vectorized batch."""
+
+    def __call__(self, prior_obs, prior_action, obs):
+        return float(obs.owned_army_count - prior_obs.owned_army_count)
+
+
+class ConstantRewardFn(LandRewardFn):
+    """Overrides only __call__ of a reward function with a vectorized batch."""
+
+    def __call__(self, prior_obs, prior_action, obs):
+        return 7.0
+
+
+def test_reward_fn_overriding_only_call():
+    assert LandRewardFn().vectorized and not ConstantRewardFn().vectorized and not ArmyRewardFn().vectorized
+    env = GymnasiumGenerals(["red", "blue"], reward_fn=ConstantRewardFn())
+    env.reset(seed=0)
+    _, _, _, _, infos = env.step([np.array([1, 0, 0, 0, 1, 0])] * 2)
+    assert infos["red"]["reward"] == infos["blue"]["reward"] == 7.0
+
+    env = GymnasiumGeneralsVector(2, ["red", "blue"], reward_fn=ConstantRewardFn())
+    env.reset(seed=0)
+    _, _, _, _, infos = env.step(np.tile([1, 0, 0, 0, 1, 0], (2, 2, 1)))
+    assert (infos["red"]["reward"] == 7.0).all() and (infos["blue"]["reward"] == 7.0).all()
+
+
+def test_gymnasium_vector_rewards_and_same_step_autoreset():
+    agents = ["red", "blue"]
+    env = GymnasiumGeneralsVector(2, agents, truncation=10, reward_fn=ArmyRewardFn(), autoreset_mode="SameStep")
+    rng = np.random.default_rng(1)
+    observations, infos = env.reset(seed=1)
+    army = {agent: infos[agent]["army"].copy() for agent in agents}
+    for step in range(1, 25):
+        actions = np.stack([[sample_valid_action(infos[agent]["masks"][i], rng) for agent in agents] for i in range(2)])
+        observations, _, terminated, truncated, infos = env.step(actions)
+        done = terminated | truncated
+        assert np.array_equal(done, [step % 10 == 0] * 2)
+        final_infos = infos["final_info"] if done.any() else infos
+        for agent in agents:
+            assert np.array_equal(final_infos[agent]["reward"], final_infos[agent]["army"] - army[agent])
+            army[agent] = infos[agent]["army"].copy()
+        if done.any():
+            # Games were reset in the same step, their last observations are kept in the infos
+            assert (observations[:, :, -2] == 0).all() and (infos["final_obs"][:, :, -2] == 10).all()
+
+
+@pytest.mark.parametrize("reward_fn", [LandRewardFn(), ArmyRewardFn()])
+def test_threaded_vector_env_matches_gymnasium_vector(reward_fn):
+    num_envs, agents = 5, ["red", "blue"]
+    env_kwargs = {"agents": agents, "truncation": 30, "reward_fn": reward_fn}
+    env = ThreadedVectorEnv(num_envs, grid_factory=GridFactory(), num_threads=2, **env_kwargs)
+    reference_env = GymnasiumGeneralsVector(num_envs, grid_factory=GridFactory(), **env_kwargs)
+    rng = np.random.default_rng(3)
+    try:
+        observations, infos = env.reset(seed=0)
+        reference_observations, reference_infos = reference_env.reset(seed=0)
+        for _ in range(70):
+            assert np.array_equal(observations, reference_observations)
+            for agent in agents:
+                for key, value in infos[agent].items():
+                    assert np.array_equal(value, reference_infos[agent][key]), key
+
+            actions = np.stack(
+                [[sample_valid_action(infos[agent]["masks"][i], rng) for agent in agents] for i in range(num_envs)]
+            )
+            observations, _, terminated, truncated, infos = env.step(actions)
+            reference_observations, _, reference_terminated, reference_truncated, reference_infos = (
+                reference_env.step(actions)
+            )
+            assert np.array_equal(terminated, reference_terminated)
+            assert np.array_equal(truncated, reference_truncated)
+    finally:
+        env.close()
+
+
+def test_episode_statistics_and_grid_pool():
+    agents = ["red", "blue"]
+    pool = GridPool(GridFactory(seed=5), size=4)
+    env_kwargs = {"grid_factory": pool, "truncation": 8, "reward_fn": LandRewardFn()}
+    env = GymnasiumGeneralsVector(3, agents, autoreset_mode="SameStep", **env_kwargs)
+    single_env = GymnasiumGenerals(agents, autoreset=True, **env_kwargs)
+    rng = np.random.default_rng(5)
+    _, infos = env.reset(seed=0)
+    _, single_infos = single_env.reset(seed=0)
+    returns, completed_returns = np.zeros((3, 2), dtype=np.float32), []
+    for step in range(1, 21):
+        assert all(any(game.grid is grid for grid in pool.grids) for game in env.games + [single_env.game])
+        actions = np.stack([[sample_valid_action(infos[agent]["masks"][i], rng) for agent in agents] for i in range(3)])
+        _, _, terminated, truncated, infos = env.step(actions)
+        _, _, single_terminated, single_truncated, single_infos = single_env.step(list(actions[0]))
+        returns += np.stack([infos.get("final_info", infos)[agent]["reward"] for agent in agents], axis=1)
+        # Finished games are started over in the same step
+        assert (single_terminated or single_truncated) == (step % 8 == 0) == ("final_obs" in single_infos)
+        if step % 8 == 0:
+            assert (terminated | truncated).all() and (infos["final_obs"][:, :, -2] == 8).all()
+            assert single_infos["final_info"]["red"]["done"] == terminated[0]
+            completed_returns.append(returns.copy())
+            returns[:] = 0
+
+    # Completed episodes are accumulated until they are drained
+    statistics = env.episode_statistics.drain()
+    assert np.array_equal(statistics["length"], [8] * 6) and (statistics["winner"] == -1).all()
+    assert len(env.episode_statistics) == 0 and len(single_env.episode_statistics) == 2
+    assert np.array_equal(statistics["return"], np.concatenate(completed_returns))
+    assert np.array_equal(single_env.episode_statistics.drain()["return"], statistics["return"][::3])
+
+    # Without autoreset, steps past the end of a game don't record it again
+    single_env = GymnasiumGenerals(agents, **env_kwargs)
+    single_env.reset(seed=0)
+    for _ in range(12):
+        single_env.step([np.array([1, 0, 0, 0, 1, 0])] * 2)
+    statistics = single_env.episode_statistics.drain()
+    assert np.array_equal(statistics["length"], [8]) and statistics["return"].shape == (1, 2)
+    single_env.reset(seed=1)
+    for _ in range(8):
+        single_env.step([np.array([1, 0, 0, 0, 1, 0])] * 2)
+    assert np.array_equal(single_env.episode_statistics.drain()["length"], [8])
+
+    # Arrays grow as needed
+    episode_statistics = EpisodeStatistics(2, capacity=1)
+    for i in range(3):
+        episode_statistics.add([i, i + 1], [[i, -i], [0, 1]], [0, -1])
+    statistics = episode_statistics.drain()
+    assert np.array_equal(statistics["length"], [0, 1, 1, 2, 2, 3]) and statistics["return"].shape == (6, 2)
+
+
+def make_gymnasium_env():
+    return GymnasiumGenerals(agents=["red", "blue"], grid_factory=GridFactory(), truncation=15)
+
+
+def make_pettingzoo_env():
+    return PettingZooGenerals(agents=["red", "blue"], grid_factory=GridFactory(), truncation=100)
+
+
+def test_shared_memory_vector_env_matches_envs():
+    num_envs = 5
+    env = SharedMemoryVectorEnv([make_gymnasium_env] * num_envs, envs_per_worker=2, cpus=[0])
+    reference_envs = [make_gymnasium_env() for _ in range(num_envs)]
+    rng = np.random.default_rng(0)
+    try:
+        assert env.num_workers == 3
+        observations, infos = env.reset(seed=0)
+        references = [reference_env.reset(seed=i) for i, reference_env in enumerate(reference_envs)]
+        done = np.zeros(num_envs, dtype=bool)
+        for _ in range(40):
+            for i, (reference_observations, reference_infos) in enumerate(references):
+                assert np.array_equal(observations[i], reference_observations)
+                for j, agent in enumerate(["red", "blue"]):
+                    assert np.array_equal(infos["masks"][i, j], reference_infos[agent]["masks"])
+
+            actions = np.stack([[sample_valid_action(mask, rng) for mask in masks] for masks in infos["masks"]])
+            observations, rewards, terminated, truncated, infos = env.step(actions)
+            for i, reference_env in enumerate(reference_envs):
+                # Finished environments are reset on their next step
+                if done[i]:
+                    references[i] = reference_env.reset()
+                    assert (rewards[i] == 0).all() and not (terminated[i] or truncated[i])
+                else:
+                    reference_observations, _, reference_terminated, reference_truncated, reference_infos = (
+                        reference_env.step(list(actions[i]))
+                    )
+                    references[i] = reference_observations, reference_infos
+                    assert (terminated[i], truncated[i]) == (reference_terminated, reference_truncated)
+                    assert np.array_equal(rewards[i], [reference_infos[agent]["reward"] for agent in ["red", "blue"]])
+            done = terminated | truncated
+    finally:
+        env.close()
+
+
+def test_shared_memory_vector_env_pettingzoo_async():
+    env = SharedMemoryVectorEnv([make_pettingzoo_env] * 4, envs_per_worker=1, pad_observations_to=24)
+    rng = np.random.default_rng(1)
+    try:
+        observations, infos = env.reset(seed=0)
+        assert observations.shape == (4, 2, 19, 24, 24) and infos["masks"].shape == (4, 2, 24, 24, 4, 4)
+        reference_env = make_pettingzoo_env()
+        reference_observations, _ = reference_env.reset(seed=2)
+        assert np.array_equal(observations[2, 0], reference_observations["red"].as_tensor(pad_to=24))
+
+        stepped = np.zeros(4, dtype=int)
+        for _ in range(20):
+            actions = np.stack([[sample_valid_action(mask, rng) for mask in masks] for masks in env.masks])
+            env.step_async(actions)
+            env_ids = env.step_wait(num_workers=1)
+            assert len(env_ids) >= 1
+            stepped[env_ids] += 1
+        env.step_wait()
+        assert stepped.sum() >= 20
+        assert (env.observations[:, :, OBSERVATION_CHANNELS.index("timestep")] > 0).all()
+    finally:
+        env.close()
+
+    # Workers report their errors
+    env = SharedMemoryVectorEnv([make_pettingzoo_env] * 2)
+    try:
+        env.reset(seed=0)
+        with pytest.raises(RuntimeError, match="Worker"):
+            env.step(np.full((2, 2, 6), 100))
+    finally:
+        env.close()
+
+    # Including errors while starting, e.g. pinning to a CPU that doesn't exist
+    env = SharedMemoryVectorEnv([make_pettingzoo_env], cpus=[10_000])
+    try:
+        with pytest.raises(RuntimeError, match="Worker 0"):
+            env.reset()
+    finally:
+        env.close()
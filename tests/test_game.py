@@ -4,6 +4,7 @@ import numpy as np
 import pytest
 
 import generals.core.game as game
+from generals.core.action import Action, compute_valid_move_mask, compute_valid_move_mask_batch
 from generals.core.grid import Grid, GridFactory
 
 
@@ -20,6 +21,21 @@ def get_game(grid=None):
     return game.Game(grid, ["red", "blue"])
 
 
+def random_actions(game, rng):
+    """
+    Samples a random valid action for every agent, passing when there is none.
+    """
+    actions = {}
+    for agent in game.agents:
+        valid_moves = np.argwhere(compute_valid_move_mask(game.agent_observation(agent)))
+        if len(valid_moves) == 0:
+            actions[agent] = Action(to_pass=True)
+        else:
+            row, col, direction, unit_type_idx = valid_moves[rng.integers(len(valid_moves))]
+            actions[agent] = Action(False, row, col, direction, unit_type_idx, rng.random() < 0.3)
+    return actions
+
+
 def test_grid_creation():
     """
     For given configuration, we should get grid of given size.
@@ -855,3 +871,213 @@ def test_channel_to_indices():
 # #
 # #     # Game should be done
 # #     assert game.is_done()
+
+
+def test_all_observations_match_agent_observations():
+    rng = np.random.default_rng(0)
+    grid_factory = GridFactory(min_grid_dims=(10, 10), max_grid_dims=(12, 12), seed=0)
+    _game = game.Game(grid_factory.generate(), ["red", "blue"])
+    for _ in range(300):
+        observations = _game.all_observations()
+        for agent in _game.agents:
+            reference = _game.agent_observation(agent)
+            for key, value in reference.items():
+                if isinstance(value, np.ndarray):
+                    assert observations[agent][key].dtype == value.dtype
+                    assert np.array_equal(observations[agent][key], value)
+                else:
+                    assert observations[agent][key] == value
+
+        _game.step(random_actions(_game, rng))
+
+
+def test_egocentric_observation():
+    rng = np.random.default_rng(1)
+    grid_factory = GridFactory(min_grid_dims=(10, 10), max_grid_dims=(12, 12), seed=1)
+    _game = game.Game(grid_factory.generate(), ["red", "blue"])
+    height, width = _game.grid_dims
+    for _ in range(100):
+        for agent in _game.agents:
+            # Reference: the full observation placed on a large mountain-padded canvas, then cropped
+            full = _game.agent_observation(agent).as_tensor()
+            for window, center in [(5, "general"), (9, "centroid"), (31, "general")]:
+                canvas = np.zeros((19, height + 2 * window, width + 2 * window), dtype=np.float32)
+                canvas[7] = 1
+                canvas[:, window : window + height, window : window + width] = full
+                canvas[13:] = full[13:, :1, :1]
+                top, left = _game.window_origin(agent, window, center) + window
+                reference = canvas[:, top : top + window, left : left + window]
+
+                observation = _game.egocentric_observation(agent, window, center)
+                assert np.array_equal(observation.as_tensor(), reference)
+
+        minimap = _game.minimap("red", 4)
+        assert minimap.shape == (13, 4, 4)
+        assert np.isclose(minimap.mean(axis=(1, 2)), full[:13].mean(axis=(1, 2)), atol=0.5).all()
+
+        _game.step(random_actions(_game, rng))
+
+
+def test_token_observation():
+    rng = np.random.default_rng(2)
+    grid_factory = GridFactory(min_grid_dims=(10, 10), max_grid_dims=(12, 12), seed=2)
+    games = [game.Game(grid_factory.generate(), ["red", "blue"]) for _ in range(3)]
+    features = {feature: i for i, feature in enumerate(game.TOKEN_FEATURES)}
+    for _ in range(50):
+        for _game in games:
+            for agent in _game.agents:
+                tokens, mask = _game.token_observation(agent)
+                assert mask.all()
+                observation = _game.agent_observation(agent)
+
+                # Scattering the tokens back onto the grid recovers the dense observation
+                rows, cols = tokens[:, 0].astype(int), tokens[:, 1].astype(int)
+                in_fog = tokens[:, features["structure_in_fog"]] == 1
+                for key, feature in [
+                    ("cavalry", "cavalry"),
+                    ("infantry", "infantry"),
+                    ("archers", "archers"),
+                    ("siege", "siege"),
+                    ("owned_cells", "owned"),
+                    ("opponent_cells", "opponent"),
+                    ("cities", "city"),
+                    ("generals", "general"),
+                    ("mountains", "mountain"),
+                ]:
+                    dense = np.zeros(_game.grid_dims, dtype=np.float32)
+                    dense[rows, cols] = tokens[:, features[feature]]
+                    assert np.array_equal(dense, observation[key])
+                structures_in_fog = np.zeros(_game.grid_dims, dtype=bool)
+                structures_in_fog[rows[in_fog], cols[in_fog]] = True
+                assert np.array_equal(structures_in_fog, observation.structures_in_fog)
+
+                padded_tokens, padded_mask = _game.token_observation(agent, max_tokens=len(tokens) + 5)
+                assert np.array_equal(padded_tokens[: len(tokens)], tokens)
+                assert (padded_tokens[len(tokens) :] == 0).all()
+                assert padded_mask.sum() == len(tokens)
+
+        batch_tokens, batch_mask = game.stack_token_observations(games, max_tokens=16)
+        assert batch_tokens.shape == (3, 2, 16, len(game.TOKEN_FEATURES))
+        for i, _game in enumerate(games):
+            for j, agent in enumerate(_game.agents):
+                tokens, mask = _game.token_observation(agent, max_tokens=16)
+                assert np.array_equal(batch_tokens[i, j], tokens)
+                assert np.array_equal(batch_mask[i, j], mask)
+            _game.step(random_actions(_game, rng))
+
+
+def test_graph_observation():
+    rng = np.random.default_rng(3)
+    grid_factory = GridFactory(min_grid_dims=(10, 10), max_grid_dims=(12, 12), seed=3)
+    _game = game.Game(grid_factory.generate(), ["red", "blue"])
+    nodes = _game.grid.adjacency.nodes
+    for _ in range(50):
+        for agent in _game.agents:
+            features = _game.graph_observation(agent)
+            observation = _game.agent_observation(agent)
+            assert features.shape == (len(nodes), len(game.GRAPH_FEATURES))
+            rows, cols = np.divmod(nodes, _game.grid_dims[1])
+            assert np.array_equal(features[:, 0], rows) and np.array_equal(features[:, 1], cols)
+            for i, name in enumerate(game.GRAPH_FEATURES[2:], start=2):
+                assert np.array_equal(features[:, i], observation[name][rows, cols])
+        _game.step(random_actions(_game, rng))
+
+
+def test_fog_memory():
+    rng = np.random.default_rng(4)
+    grid_factory = GridFactory(min_grid_dims=(10, 10), max_grid_dims=(10, 10), seed=4)
+    _game = game.Game(grid_factory.generate(), ["red", "blue"], fog_memory=True)
+    assert game.Game(_game.grid, ["red", "blue"]).agent_observation("red").last_seen_turn is None
+
+    # Reference memory, merged from the observations on the Python side
+    reference = {
+        agent: {
+            "units": np.zeros((4, 10, 10), dtype=np.float32),
+            "owner": np.full((10, 10), -1),
+            "turn": np.full((10, 10), -1),
+        }
+        for agent in _game.agents
+    }
+    observations = _game.all_observations()
+    for _ in range(150):
+        for agent in _game.agents:
+            observation = observations[agent]
+            visible = ~(observation.fog_cells | observation.structures_in_fog).astype(bool)
+            memory = reference[agent]
+            memory["units"][:, visible] = np.stack([observation[name] for name in game.UNIT_TYPES])[:, visible]
+            owner = observation.owned_cells + 2 * observation.opponent_cells.astype(int)
+            memory["owner"][visible] = owner[visible]
+            memory["turn"][visible] = _game.time
+
+            for i, unit_type in enumerate(game.UNIT_TYPES):
+                assert np.array_equal(observation[f"last_seen_{unit_type}"], memory["units"][i])
+            assert np.array_equal(observation.last_seen_owner, memory["owner"])
+            assert np.array_equal(observation.last_seen_turn, memory["turn"])
+
+            agent_observation = _game.agent_observation(agent)
+            for name in observation:
+                assert np.array_equal(agent_observation[name], observation[name])
+        observations, _ = _game.step(random_actions(_game, rng))
+
+    # Cropped observations keep the memory, cells outside the map were never seen
+    observation = _game.egocentric_observation("red", 25)
+    top, left = _game.window_origin("red", 25)
+    full_observation = _game.agent_observation("red")
+    for name in ["last_seen_siege", "last_seen_owner", "last_seen_turn"]:
+        assert np.array_equal(observation[name][-top : 10 - top, -left : 10 - left], full_observation[name])
+    assert (observation.last_seen_owner[:-top] == -1).all() and observation.last_seen_owner.dtype == np.int8
+
+
+def test_valid_move_mask_batch():
+    observations = []
+    for seed in range(4):
+        grid_factory = GridFactory(min_grid_dims=(6, 6), max_grid_dims=(10, 10), seed=seed)
+        _game = game.Game(grid_factory.generate(), ["red", "blue"])
+        rng = np.random.default_rng(seed)
+        # Spread ownership & units around, so that many moves are valid
+        for agent in _game.agents:
+            owned = (rng.random(_game.grid_dims) < 0.4) & _game.channels.ownership_neutral
+            _game.channels.ownership[agent] |= owned
+            _game.channels.ownership_neutral &= ~owned
+            for unit_type in game.UNIT_TYPES:
+                getattr(_game.channels, unit_type)[:] += owned * rng.integers(0, 3, size=_game.grid_dims)
+        observations.extend(_game.all_observations().values())
+
+    tensor = np.stack([observation.as_tensor(pad_to=12) for observation in observations])
+    masks = compute_valid_move_mask_batch(tensor)
+    assert masks.shape == (len(observations), 12, 12, 4, 4)
+    for mask, observation in zip(masks, observations):
+        height, width = observation.armies.shape
+        assert mask.sum() > 0 and not mask[height:].any() and not mask[:, width:].any()
+        assert np.array_equal(mask[:height, :width], compute_valid_move_mask(observation))
+
+
+def test_reset():
+    rng = np.random.default_rng(5)
+    dims = [(12, 12), (8, 10), (12, 12), (15, 14)]
+    grids = [GridFactory(min_grid_dims=d, max_grid_dims=d, seed=i).generate() for i, d in enumerate(dims)]
+    _game = game.Game(grids[0], ["red", "blue"], fog_memory=True)
+    capacity = grids[0].grid.size
+    for grid in grids[1:]:
+        for _ in range(30):
+            _game.step(random_actions(_game, rng))
+        infantry = _game.channels.infantry
+        _game.reset(grid)
+        reference = game.Game(grid, ["red", "blue"], fog_memory=True)
+        # Arrays of the previous game are reused while the new map fits in them
+        assert np.shares_memory(_game.channels.infantry, infantry) == (grid.grid.size <= capacity)
+        capacity = max(capacity, grid.grid.size)
+        assert (_game.time, _game.winner, _game.agent_order) == (0, None, ["red", "blue"])
+        for agent in _game.agents:
+            assert np.array_equal(_game.general_positions[agent], reference.general_positions[agent])
+            observation, reference_observation = _game.agent_observation(agent), reference.agent_observation(agent)
+            for name in observation:
+                assert np.array_equal(observation[name], reference_observation[name]), name
+
+
+@pytest.mark.parametrize("source", [(-5, 0), (0, -1), (5, 0), (0, 5)])
+def test_source_out_of_bounds(source):
+    # Negative sources don't wrap around to the opposite edge of the map
+    _game = game.Game(Grid("A....\n.....\n.....\n.....\n....B"), ["red", "blue"])
+    with pytest.raises(IndexError, match="Source cell out of bounds."):
+        _game.step({"red": Action(False, *source, 1), "blue": Action(True)})
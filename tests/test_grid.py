@@ -1,6 +1,11 @@
+import pickle
+
 import numpy as np
+import pytest
 
-from generals.core.grid import Grid, GridFactory
+from generals.core.grid import Grid, GridFactory, InvalidGridError, compute_distance_field
+from generals.core.map_archive import MapArchive
+from generals.core.map_bank import MapBank
 
 
 def test_grid_creation():
@@ -68,6 +73,42 @@ A#2#2
     map = Grid.numpify_grid(map)
     assert not Grid.are_generals_connected(map)
 
+    # Large open maps used to exceed the recursion limit
+    map = np.full((300, 300), ".")
+    map[0, 0], map[-1, -1] = "A", "B"
+    assert Grid.are_generals_connected(map)
+    map[:, 150] = "#"
+    assert not Grid.are_generals_connected(map)
+
+
+def test_validate_many():
+    rng = np.random.default_rng(0)
+    maps = []
+    for _ in range(200):
+        height, width = rng.integers(3, 10, size=2)
+        map = rng.choice(np.array(list(".#5")), size=(height, width), p=[0.6, 0.3, 0.1])
+        positions = rng.choice(height * width, size=2, replace=False)
+        map.flat[positions] = ["A", "B"] if rng.random() < 0.9 else ["A", "A"]
+        maps.append(map)
+
+    expected = []
+    for map in maps:
+        try:
+            Grid.ensure_grid_is_valid(map)
+            expected.append(True)
+        except InvalidGridError:
+            expected.append(False)
+    assert 0 < sum(expected) < len(maps)
+
+    codes = [Grid(map).codes if valid else Grid._as_codes(map) for map, valid in zip(maps, expected)]
+    assert Grid.validate_many(codes).tolist() == expected
+    assert Grid.validate_many([Grid(map) for map, valid in zip(maps, expected) if valid]).all()
+
+    # Stacks of codes of the same shape are checked as they are
+    same_shape = [i for i, code in enumerate(codes) if code.shape == codes[0].shape]
+    stack = np.stack([codes[i] for i in same_shape])
+    assert Grid.validate_many(stack).tolist() == [expected[i] for i in same_shape]
+
 def test_grid_factory():
     generator = GridFactory()
     generator.rng = np.random.default_rng()
@@ -79,6 +120,37 @@ def test_grid_factory():
 
 
 
+def test_generalsio_grid():
+    generator = GridFactory(mode="generalsio", seed=0)
+    grids = [generator.generate() for _ in range(50)]
+    assert Grid.validate_many(grids).all()
+    for grid in grids:
+        # Generals are far enough apart, around mountains and cities
+        walkable = (grid.grid == ".") | (grid.grid == "A") | (grid.grid == "B")
+        distances = compute_distance_field(walkable, np.argwhere(grid.grid == "A"))
+        assert distances[tuple(np.argwhere(grid.grid == "B")[0])] >= 15
+    generator = GridFactory(mode="generalsio", seed=0)
+    assert [generator.generate() for _ in range(50)] == grids
+
+
+def test_generate_batch():
+    grids = GridFactory(seed=0).generate_batch(100)
+    assert len(grids) == 100
+    assert Grid.validate_many(grids).all()
+    for grid in grids:
+        assert grid.codes.dtype == np.int8
+        assert Grid.generals_distance(grid) >= max(grid.shape) // 2
+        assert 15 <= min(grid.shape) and max(grid.shape) <= 23
+    assert len({grid.shape for grid in grids}) > 1
+
+    # Batches are reproducible from the factory's seed
+    assert GridFactory(seed=0).generate_batch(100) == grids
+
+    generator = GridFactory(general_positions=[(1, 2), (12, 13)], seed=0)
+    for grid in generator.generate_batch(10):
+        assert grid.grid[1, 2] == "A" and grid.grid[12, 13] == "B"
+
+
 def test_numpify_map():
     map_str = """
 .....
@@ -121,3 +193,190 @@ def test_stringify_map():
 .1#B#
     """
     assert map_str == reference_map.strip()
+
+
+def test_compute_distance_field():
+    map = """
+A..#.
+.#.#.
+.#...
+.##1B
+#....
+    """
+    grid = Grid(map)
+    passable = grid.grid != "#"
+
+    distances = compute_distance_field(passable, np.array([[0, 0]]))
+    assert distances[0, 0] == 0
+    assert distances[2, 2] == 4
+    assert distances[3, 4] == 7
+    assert distances[4, 1] == 9
+    assert (distances[~passable] == -1).all()
+
+    # Multiple sources yield the distance to the nearest one
+    distances = compute_distance_field(passable, np.array([[0, 0], [3, 4]]))
+    assert distances[2, 2] == 3
+    assert distances[4, 4] == 1
+    assert distances[0, 4] == 3
+
+    # Cells walled off from every source are unreachable
+    walled_off = passable.copy()
+    walled_off[2, 0] = False
+    distances = compute_distance_field(walled_off, np.array([[0, 0]]))
+    assert distances[3, 0] == -1
+
+
+def test_adjacency():
+    map = """
+A..#.
+.#.#.
+.#...
+.##1B
+#....
+    """
+    grid = Grid(map)
+    adjacency = grid.adjacency
+    assert grid.adjacency is adjacency
+    assert adjacency.indptr.dtype == adjacency.indices.dtype == np.int32
+
+    passable = grid.grid != "#"
+    assert len(adjacency.nodes) == passable.sum()
+    for node, cell in enumerate(adjacency.nodes):
+        i, j = divmod(cell, 5)
+        assert passable[i, j] and adjacency.node_ids[i, j] == node
+        expected = {
+            adjacency.node_ids[i + di, j + dj]
+            for di, dj in [(-1, 0), (1, 0), (0, -1), (0, 1)]
+            if 0 <= i + di < 5 and 0 <= j + dj < 5 and passable[i + di, j + dj]
+        }
+        neighbors = adjacency.indices[adjacency.indptr[node] : adjacency.indptr[node + 1]]
+        assert set(neighbors) == expected and len(neighbors) == len(expected)
+    assert (adjacency.node_ids[~passable] == -1).all()
+
+
+def test_distance_fields():
+    map = """
+A..#.
+.#.#.
+.#...
+.##1B
+#....
+    """
+    grid = Grid(map)
+    assert grid.general_distances[0, 3, 4] == 7 and grid.general_distances[1, 0, 0] == 7
+    assert grid.general_distances[0, 3, 0] == 3 and grid.general_distances[0, 0, 3] == -1
+    assert grid.city_distances.shape == (1, 5, 5) and grid.city_distances[0, 3, 4] == 1
+
+    # The neighbour table lists the node above, below, left and right of each node
+    node_ids = grid.node_ids
+    assert grid.neighbors[node_ids[2, 2]].tolist() == [node_ids[1, 2], -1, -1, node_ids[2, 3]]
+
+    distances = grid.all_pairs_distances()
+    assert grid.all_pairs_distances() is distances
+    passable = np.argwhere(node_ids != -1)
+    for node, (i, j) in enumerate(passable):
+        field = compute_distance_field(grid.grid != "#", np.array([[i, j]]))
+        assert (distances[node] == field[passable[:, 0], passable[:, 1]]).all()
+    with pytest.raises(ValueError):
+        Grid(map).all_pairs_distances(max_nodes=10)
+
+
+def test_static_layers():
+    grid = GridFactory(seed=0).generate()
+    same_grid = Grid.from_codes(grid.codes.copy())
+    assert grid.content_hash == same_grid.content_hash
+    assert grid.content_hash != GridFactory(seed=1).generate().content_hash
+
+    # Grids of the same content share their layers, which can't be modified
+    layers = grid.static_layers
+    assert same_grid.static_layers is layers
+    assert pickle.loads(pickle.dumps(grid)).static_layers is layers
+    with pytest.raises(ValueError):
+        layers.cities[0, 0] = True
+
+    assert (layers.mountains == (grid.grid == "#")).all()
+    assert (layers.passable == ~layers.mountains).all()
+    assert (layers.neutral == np.isin(grid.grid, list(".0123456789x"))).all()
+    assert layers.infantry[tuple(layers.general_positions[0])] == 1
+    assert grid.grid[tuple(layers.general_positions[0])] == "A"
+    assert grid.grid[tuple(layers.general_positions[1])] == "B"
+
+
+def test_map_bank(tmp_path):
+    grid_factory = GridFactory(min_grid_dims=(6, 6), max_grid_dims=(9, 9))
+    with MapBank(grid_factory, capacity=4, num_workers=2, seed=0) as bank:
+        grids = [bank.generate() for _ in range(10)]
+        for grid in grids:
+            assert 6 <= min(grid.shape) and max(grid.shape) <= 9
+            Grid.ensure_grid_is_valid(grid.grid)
+        bank.save(tmp_path / "bank.bin", num_grids=6)
+
+    # Loaded grids are handed out in turn when there is no grid factory to generate more
+    loaded = MapBank.load(tmp_path / "bank.bin")
+    saved = [str(grid) for grid in loaded._ready]
+    assert len(saved) >= 6
+    assert [str(loaded.generate()) for _ in range(2 * len(saved))] == 2 * saved
+    assert max(loaded.max_grid_dims) <= 9
+
+    # With a grid factory, generated grids follow the loaded ones
+    with MapBank.load(tmp_path / "bank.bin", grid_factory=grid_factory, capacity=2) as bank:
+        assert [str(bank.generate()) for _ in range(len(saved))] == saved
+        assert max(bank.generate().shape) <= 9
+
+    # Closed banks hand out the grids that are still ready, then raise instead of waiting for the workers
+    with MapBank(grid_factory, capacity=2, seed=0) as bank:
+        bank.save(tmp_path / "closed.bin", num_grids=2)
+    ready = len(bank._ready)
+    assert [max(bank.generate().shape) <= 9 for _ in range(ready)] == [True] * ready
+    with pytest.raises(RuntimeError, match="closed"):
+        bank.generate()
+    with pytest.raises(RuntimeError, match="closed"):
+        bank.save(tmp_path / "closed.bin", num_grids=ready + 1)
+
+
+def test_codes_and_map_archive(tmp_path):
+    grid = Grid(
+        """
+.3.#
+#..A
+x..#
+.#.B
+"""
+    )
+    assert np.array_equal(
+        grid.codes, [[0, 4, 0, -1], [-1, 0, 0, -2], [11, 0, 0, -1], [0, -1, 0, -3]]
+    ) and grid.codes.dtype == np.int8
+    from_codes = Grid.from_codes(grid.codes)
+    assert from_codes == grid and np.array_equal(from_codes.grid, grid.grid) and str(from_codes) == str(grid)
+    with pytest.raises(InvalidGridError):
+        Grid("A.C\n..B").codes
+
+    grids = [grid] + [GridFactory(min_grid_dims=(5, 6), max_grid_dims=(9, 8), seed=i).generate() for i in range(20)]
+    MapArchive.write(tmp_path / "maps.bin", grids)
+    archive = MapArchive(tmp_path / "maps.bin", seed=0)
+    shapes = np.array([original.shape for original in grids])
+    assert len(archive) == 21 and archive.max_grid_dims == tuple(shapes.max(axis=0)) and archive.min_grid_dims == (4, 4)
+    for archived, original in zip(archive, grids):
+        assert archived == original and np.array_equal(archived.grid, original.grid)
+    assert any(archive.generate() == original for original in grids)
+
+
+def test_canonical_hash_and_deduplicate(tmp_path):
+    grids = GridFactory(min_grid_dims=(5, 6), max_grid_dims=(9, 8), seed=0).generate_batch(20)
+    assert len({grid.canonical_hash for grid in grids}) == 20
+
+    # Rotations, reflections and swapped generals are the same map
+    codes = grids[0].codes
+    swapped = codes.copy()
+    swapped[codes == -2], swapped[codes == -3] = -3, -2
+    variants = [np.rot90(codes, k) for k in range(4)] + [codes.T, np.fliplr(codes), np.flipud(swapped)]
+    for variant in variants:
+        assert Grid.from_codes(np.ascontiguousarray(variant)).canonical_hash == grids[0].canonical_hash
+    assert grids[0].canonical_hash != grids[0].content_hash
+
+    duplicates = [Grid.from_codes(np.ascontiguousarray(variant)) for variant in variants]
+    MapArchive.write(tmp_path / "maps.bin", grids[:10] + duplicates + grids)
+    archive = MapArchive(tmp_path / "maps.bin")
+    for num_workers in [1, 2]:
+        deduplicated = archive.deduplicate(tmp_path / f"unique_{num_workers}.bin", num_workers=num_workers)
+        assert list(deduplicated) == grids
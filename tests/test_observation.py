@@ -0,0 +1,175 @@
+import pickle
+import tracemalloc
+
+import numpy as np
+
+from generals.core.action import Action, compute_valid_move_mask
+from generals.core.game import Game
+from generals.core.grid import GridFactory
+from generals.core.observation import MEMORY_LAYERS, OBSERVATION_CHANNELS, Observation
+
+
+def get_observation(size=8):
+    grid_factory = GridFactory(min_grid_dims=(size, size), max_grid_dims=(size, size), seed=0)
+    game = Game(grid_factory.generate(), ["red", "blue"])
+    return game.agent_observation("red")
+
+
+def test_mapping_protocol():
+    observation = get_observation()
+    # Without fog memory, the mapping only holds the base fields
+    field_names = [name for name in Observation.__dataclass_fields__ if name not in MEMORY_LAYERS]
+    assert not observation.has_fog_memory
+    assert all(value is not None for value in observation.values())
+    assert "last_seen_turn" not in observation and observation.get("last_seen_turn") is None
+
+    assert list(observation) == field_names
+    assert list(observation.keys()) == field_names
+    assert len(observation) == len(field_names)
+    assert "armies" in observation and "unknown" not in observation
+    assert observation.get("unknown") is None
+    assert observation["timestep"] == observation.timestep
+
+    # Views return the stored fields themselves, not copies
+    for (key, value), other_value in zip(observation.items(), observation.values()):
+        assert value is getattr(observation, key)
+        assert other_value is value
+
+    # Converting to a plain dict keeps working, as Observation is still a dict
+    assert isinstance(observation, dict)
+    as_dict = dict(observation)
+    assert list(as_dict) == field_names
+    assert as_dict["armies"] is observation.armies
+
+    restored = pickle.loads(pickle.dumps(observation))
+    for key, value in observation.items():
+        assert np.array_equal(restored[key], value)
+
+
+def test_mapping_protocol_does_not_allocate_grid_sized_arrays():
+    """
+    Micro-benchmark: iterating over the observation must not copy the (64, 64) layers.
+    """
+    observation = get_observation()
+    observation.pad_observation(64)
+    grid_size_in_bytes = observation.armies.nbytes
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for _ in range(100):
+        items = list(observation.items())
+        values = list(observation.values())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(items) == len(values) == len(observation)
+    assert peak < grid_size_in_bytes
+
+
+def test_as_tensor():
+    observation = get_observation()
+    original_arrays = {key: value.copy() for key, value in observation.items() if isinstance(value, np.ndarray)}
+
+    tensor = observation.as_tensor(pad_to=12)
+    assert tensor.shape == (19, 12, 12)
+    assert tensor.dtype == np.float32
+
+    # The observation is left unmodified
+    for key, value in original_arrays.items():
+        assert np.array_equal(observation[key], value)
+        assert observation[key].shape == (8, 8)
+
+    for channel, key in enumerate(OBSERVATION_CHANNELS):
+        if key in original_arrays:
+            assert np.array_equal(tensor[channel, :8, :8], observation[key])
+            padding_value = 1 if key == "mountains" else 0
+            assert (tensor[channel, 8:, :] == padding_value).all()
+            assert (tensor[channel, :, 8:] == padding_value).all()
+        else:
+            assert (tensor[channel] == observation[key]).all()
+
+    # Writes into a preallocated buffer, overwriting whatever it held
+    out = np.full((2, 19, 12, 12), 7, dtype=np.float64)
+    result = observation.as_tensor(pad_to=12, out=out[1])
+    assert result.base is out
+    assert np.array_equal(out[1], tensor)
+
+    grid_tensor, scalars = observation.as_tensor(scalar_planes=False)
+    assert grid_tensor.shape == (13, 8, 8)
+    assert np.array_equal(grid_tensor, observation.as_tensor()[:13])
+    assert np.array_equal(scalars, tensor[13:, 0, 0])
+
+
+def play_game(num_steps, size=8, seed=0, fog_memory=False):
+    rng = np.random.default_rng(seed)
+    grid_factory = GridFactory(min_grid_dims=(size, size), max_grid_dims=(size, size), seed=seed)
+    game = Game(grid_factory.generate(), ["red", "blue"], fog_memory=fog_memory)
+    observations = {agent: game.agent_observation(agent) for agent in game.agents}
+    for _ in range(num_steps):
+        actions = {}
+        for agent in game.agents:
+            valid_moves = np.argwhere(compute_valid_move_mask(observations[agent]))
+            if len(valid_moves) == 0:
+                actions[agent] = Action(to_pass=True)
+            else:
+                row, col, direction, unit_type_idx = valid_moves[rng.integers(len(valid_moves))]
+                actions[agent] = Action(False, row, col, direction, unit_type_idx, rng.random() < 0.3)
+        observations, _ = game.step(actions)
+    return observations
+
+
+def assert_bit_exact(observation, restored):
+    for key, value in observation.items():
+        if isinstance(value, np.ndarray):
+            assert isinstance(restored[key], np.ndarray)
+            assert restored[key].dtype == value.dtype
+            assert restored[key].shape == value.shape
+            assert restored[key].tobytes() == value.tobytes()
+        else:
+            assert restored[key] == value
+
+
+def test_pack_round_trip():
+    observations = play_game(num_steps=200)
+    for observation in observations.values():
+        assert_bit_exact(observation, Observation.unpack(observation.pack()))
+
+    # Values that have no compact representation are stored as they are
+    observation = observations["red"]
+    observation.infantry[0, 0] = -0.0
+    observation.cavalry[0, 1] = np.nan
+    observation.archers[1, 1] = 1e9
+    observation.siege[2, 2] = -3
+    observation.armies[3, 3] = 0.25
+    assert_bit_exact(observation, Observation.unpack(observation.pack()))
+
+
+def test_pack_size():
+    for observation in play_game(num_steps=100, size=20).values():
+        observation.pad_observation(24)
+        raw_size = sum(value.nbytes for value in observation.values() if isinstance(value, np.ndarray))
+        assert len(observation.pack()) * 10 <= raw_size
+
+
+def test_fog_memory_layers():
+    observation = play_game(num_steps=50, fog_memory=True)["red"]
+    assert observation.has_fog_memory
+    assert list(observation) == list(Observation.__dataclass_fields__)
+    assert all(observation[name] is getattr(observation, name) for name in MEMORY_LAYERS)
+    restored = pickle.loads(pickle.dumps(observation))
+    assert all(np.array_equal(restored[name], observation[name]) for name in MEMORY_LAYERS)
+    assert_bit_exact(observation, Observation.unpack(observation.pack()))
+
+    tensor = observation.as_tensor(pad_to=10, fog_memory=True)
+    assert tensor.shape == (len(OBSERVATION_CHANNELS) + len(MEMORY_LAYERS), 10, 10)
+    assert np.array_equal(tensor[: len(OBSERVATION_CHANNELS)], observation.as_tensor(pad_to=10))
+    restored = Observation.from_tensor(tensor[:, :8, :8])
+    for channel, name in enumerate(MEMORY_LAYERS, start=len(OBSERVATION_CHANNELS)):
+        assert np.array_equal(tensor[channel, :8, :8], observation[name])
+        assert restored[name].dtype == observation[name].dtype
+        assert np.array_equal(restored[name], observation[name])
+
+    # Cells outside the map were never seen
+    observation.pad_observation(10)
+    assert np.array_equal(observation.as_tensor(fog_memory=True), tensor)
+    assert (observation.last_seen_turn[8:] == -1).all() and (observation.last_seen_cavalry[8:] == 0).all()
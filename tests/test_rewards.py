@@ -0,0 +1,106 @@
+import numpy as np
+
+from generals.core.action import Action, compute_valid_move_mask
+from generals.core.game import Game
+from generals.core.grid import Grid, GridFactory
+from generals.core.rewards import (
+    DistanceShapingRewardFn,
+    FrequentAssetRewardFn,
+    LandRewardFn,
+    RewardFn,
+    WinLoseRewardFn,
+)
+
+
+def collect_transitions(num_steps=150, seed=0):
+    """
+    Plays a game with random (mostly valid) actions and returns the observed transitions.
+    """
+    rng = np.random.default_rng(seed)
+    grid_factory = GridFactory(min_grid_dims=(8, 8), max_grid_dims=(8, 8), seed=seed)
+    agents = ["red", "blue"]
+    game = Game(grid_factory.generate(), agents)
+    prior_observations = {agent: game.agent_observation(agent) for agent in agents}
+
+    transitions = []
+    for _ in range(num_steps):
+        actions = {}
+        for agent in agents:
+            valid_moves = np.argwhere(compute_valid_move_mask(prior_observations[agent]))
+            if len(valid_moves) == 0 or rng.random() < 0.2:
+                row, col = rng.integers(0, 8, size=2)
+                actions[agent] = Action(False, row, col, rng.integers(4), rng.integers(4))
+            else:
+                row, col, direction, unit_type_idx = valid_moves[rng.integers(len(valid_moves))]
+                actions[agent] = Action(False, row, col, direction, unit_type_idx, rng.random() < 0.3)
+        observations, _ = game.step(actions)
+        for agent in agents:
+            transitions.append((prior_observations[agent], actions[agent], observations[agent]))
+        prior_observations = observations
+    return transitions
+
+
+def test_batch_matches_single_transition_rewards():
+    transitions = collect_transitions()
+    prior_tensor = np.stack([prior_obs.as_tensor() for prior_obs, _, _ in transitions])
+    actions = np.stack([action for _, action, _ in transitions])
+    tensor = np.stack([obs.as_tensor() for _, _, obs in transitions])
+
+    for reward_fn in [WinLoseRewardFn(), LandRewardFn(), FrequentAssetRewardFn()]:
+        rewards = reward_fn.batch(prior_tensor, actions, tensor)
+        reference = [reward_fn(prior_obs, action, obs) for prior_obs, action, obs in transitions]
+        assert rewards.shape == (len(transitions),)
+        assert rewards.dtype == np.float32
+        assert np.array_equal(rewards, np.array(reference, dtype=np.float32))
+
+
+def test_batch_falls_back_to_single_transition_rewards():
+    class ArmyRewardFn(RewardFn):
+        def __call__(self, prior_obs, prior_action, obs):
+            assert isinstance(prior_action, Action)
+            return float(obs.armies[obs.owned_cells].sum() - prior_obs.armies[prior_obs.owned_cells].sum())
+
+    transitions = collect_transitions(num_steps=20, seed=1)
+    prior_tensor = np.stack([prior_obs.as_tensor() for prior_obs, _, _ in transitions])
+    actions = np.stack([action for _, action, _ in transitions])
+    tensor = np.stack([obs.as_tensor() for _, _, obs in transitions])
+
+    reward_fn = ArmyRewardFn()
+    rewards = reward_fn.batch(prior_tensor, actions, tensor)
+    reference = [reward_fn(prior_obs, action, obs) for prior_obs, action, obs in transitions]
+    assert np.allclose(rewards, reference)
+
+
+def test_distance_shaping_reward():
+    map = """
+A..#.
+.#.#.
+.#...
+.##1B
+#....
+    """
+    grid = Grid(map)
+    game = Game(grid, ["red", "blue"])
+    reward_fn = DistanceShapingRewardFn(general_weight=1.0, city_weight=0.5, gamma=0.99)
+    reward_fn.reset(grid)
+    reward_fn.reset(Grid(map))
+    assert len(reward_fn._distance_fields) == 1
+
+    # Red's general is 7 steps from the enemy general and 6 steps from the city
+    prior_obs = game.agent_observation("red")
+    assert np.isclose(reward_fn.potential(prior_obs), -(7 + 0.5 * 6) / 25)
+    # Blue's general is 7 steps from the enemy general and next to the city
+    assert np.isclose(reward_fn.potential(game.agent_observation("blue")), -(7 + 0.5 * 1) / 25)
+
+    game.channels.ownership["red"][0, 1] = True
+    obs = game.agent_observation("red")
+    assert np.isclose(reward_fn.potential(obs), -(6 + 0.5 * 5) / 25)
+    assert np.isclose(reward_fn(prior_obs, Action(to_pass=True), obs), 0.99 * -(6 + 0.5 * 5) / 25 + (7 + 0.5 * 6) / 25)
+
+    # Padded observations are supported
+    obs.pad_observation(8)
+    assert np.isclose(reward_fn.potential(obs), -(6 + 0.5 * 5) / 25)
+
+    # Losing the general gives the worst potential
+    game.channels.ownership["red"][:] = False
+    assert reward_fn.potential(game.agent_observation("red")) == -1.5